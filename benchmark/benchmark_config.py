@@ -0,0 +1,49 @@
+# benchmark_config.py
+""" Measure how long configuration takes at the start of a run.
+    "eager" reads every Parameter Store section up front, as get_config used to;
+    "lazy_cold" reads only the sections needed before the Web Kiosk fetch starts (sentry and embark);
+    "lazy_warm" does the same again while the cache is still valid, as a warm Lambda invocation would.
+
+    Uses whatever source get_config is set up for: Parameter Store (SSM_KEY_BASE), or CONFIG_FILE / CONFIG_JSON.
+    Run from the project root:  python -m benchmark.benchmark_config """
+
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(where_i_am))
+import time  # noqa: E402
+from src.get_config import get_config, forget_cached_parameters, PARAMETER_STORE_SECTIONS  # noqa: E402
+
+
+def _time_milliseconds(function):
+    start = time.perf_counter()
+    function()
+    return (time.perf_counter() - start) * 1000
+
+
+def _read_everything():
+    config = get_config()
+    for section in PARAMETER_STORE_SECTIONS:
+        config[section]
+    config.get('no-reply-email-address')
+
+
+def _read_what_the_fetch_needs():
+    config = get_config()
+    config['sentry']
+    config['embark']
+
+
+def run():
+    """ Return milliseconds taken for each way of reading configuration """
+    forget_cached_parameters()
+    results = {'eager_milliseconds': _time_milliseconds(_read_everything)}
+    forget_cached_parameters()
+    results['lazy_cold_milliseconds'] = _time_milliseconds(_read_what_the_fetch_needs)
+    results['lazy_warm_milliseconds'] = _time_milliseconds(_read_what_the_fetch_needs)
+    return results
+
+
+if __name__ == '__main__':
+    for name, value in run().items():
+        print(name, round(value, 2))
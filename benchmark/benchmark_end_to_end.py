@@ -0,0 +1,124 @@
+# benchmark_end_to_end.py
+""" Time complete runs of process_web_kiosk_metadata against the fake Drive and Web Kiosk in fake_services,
+    which run in their own process so they don't compete with the run for the interpreter.
+    The fake Drive starts empty for each number of upload workers tried, so the first run uploads everything;
+    later runs find every object already there, as a nightly run mostly would.
+
+    Run from the project root:
+        python -m benchmark.benchmark_end_to_end --objects 2000 --latency-ms 50 --upload-workers 8 16 """
+
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(where_i_am))
+import argparse  # noqa: E402
+from contextlib import redirect_stdout  # noqa: E402
+import json  # noqa: E402
+import subprocess  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+from urllib import request  # noqa: E402
+
+
+def start_fake_services(options, config_file_name):
+    """ Start fake_services in a new process, returning the process and the environment that points at it """
+    process = subprocess.Popen([sys.executable, '-m', 'benchmark.fake_services',
+                                '--objects', str(options.objects),
+                                '--latency-ms', str(options.latency_ms),
+                                '--bandwidth-kbps', str(options.bandwidth_kbps),
+                                '--rate-limit-rate', str(options.rate_limit_rate),
+                                '--failure-rate', str(options.failure_rate),
+                                '--quota-per-second', str(options.quota_per_second),
+                                '--write-config', config_file_name],
+                               cwd=os.path.dirname(where_i_am), stdout=subprocess.PIPE, universal_newlines=True)
+    environment = {}
+    for line in process.stdout:
+        if line.startswith('export '):
+            name, value = line[len('export '):].strip().split('=', 1)
+            environment[name] = value
+        if 'DRIVE_API_ROOT_URL' in environment:
+            return process, environment
+    raise RuntimeError('fake_services stopped before it was ready')
+
+
+def run_once(folder_name, upload_workers, fetch_mode):
+    """ Fetch and process the whole export once, returning a dictionary of results """
+    from src.get_config import get_config
+    from src.process_web_kiosk_metadata import process_web_kiosk_metadata
+    from run_metrics import start_run_metrics  # as the src modules import it, so they record into the same one
+    run_metrics = start_run_metrics()
+    config = get_config()
+    config['folder_name'] = folder_name
+    config['run_manifest']['folder_name'] = folder_name
+    config['resume'] = False
+    config['upload_workers'] = upload_workers
+    config['fetch_mode'] = fetch_mode
+    processor = process_web_kiosk_metadata(config)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as quiet, redirect_stdout(quiet):  # one line per object is too much here
+        processor.get_snite_composite_mets_metadata()
+        fetched = time.perf_counter()
+        processor.process_snite_composite_mets_metadata(clean_up_as_we_go=True)
+    finished = time.perf_counter()
+    uploader = processor.uploader
+    objects = len(uploader.succeeded) + len(uploader.skipped) + len(uploader.failed)
+    return {
+        'upload_workers': upload_workers,
+        'fetch_mode': fetch_mode,
+        'objects': objects,
+        'uploaded': len(uploader.succeeded),
+        'skipped': len(uploader.skipped),
+        'failed': len(uploader.failed),
+        'fetch_seconds': round(fetched - start, 3),
+        'total_seconds': round(finished - start, 3),
+        'objects_per_second': round(objects / (finished - start), 1),
+        'run_metrics': run_metrics.get_summary()
+    }
+
+
+def _get_drive_stats(environment):
+    with request.urlopen(environment['DRIVE_API_ROOT_URL'] + 'fake/stats') as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def _reset_drive(environment):
+    request.urlopen(request.Request(environment['DRIVE_API_ROOT_URL'] + 'fake/reset', data=b'')).close()
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Time complete runs against fake Drive and Web Kiosk services.')
+    parser.add_argument('--objects', type=int, default=1000)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--bandwidth-kbps', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--quota-per-second', type=float, default=0.0)
+    parser.add_argument('--upload-workers', type=int, nargs='+', default=[8], help='one or more settings to try')
+    parser.add_argument('--fetch-mode', choices=['single', 'paged', 'streamed'], default='single')
+    parser.add_argument('--runs', type=int, default=2, help='runs for each number of upload workers')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    options = parser.parse_args(arguments)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as folder_name:
+        process, environment = start_fake_services(options, os.path.join(folder_name, 'config.json'))
+        try:
+            os.environ.update(environment)
+            os.environ['WEB_KIOSK_EXPORT_MODE'] = 'full'
+            for upload_workers in options.upload_workers:
+                _reset_drive(environment)
+                for run_number in range(1, options.runs + 1):
+                    result = run_once(folder_name, upload_workers, options.fetch_mode)
+                    result['run'] = run_number
+                    results.append(result)
+                    print(json.dumps(result))
+                print('Fake Drive:', _get_drive_stats(environment))
+        finally:
+            process.terminate()
+            process.wait()
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump({'settings': vars(options), 'runs': results}, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
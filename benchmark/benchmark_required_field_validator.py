@@ -0,0 +1,91 @@
+# benchmark_required_field_validator.py
+""" Compare the per-object cost of checking required fields with RequiredFieldValidator
+    against calling get_value_given_xpath once per field.
+
+    Run from the project root:  python -m benchmark.benchmark_required_field_validator """
+
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(where_i_am))
+import timeit  # noqa: E402
+from xml.etree.ElementTree import fromstring  # noqa: E402
+from src.get_config import REQUIRED_FIELDS  # noqa: E402
+from src.required_field_validator import RequiredFieldValidator  # noqa: E402
+from src.xml_manipulation import get_value_given_xpath  # noqa: E402
+
+NAMESPACE_DICTIONARY = {
+    'mets': 'http://www.loc.gov/METS/',
+    'xlink': 'http://www.w3.org/1999/xlink',
+    'dcterms': 'http://purl.org/dc/terms/',
+    'vracore': 'http://www.vraweb.org/vracore4.htm'
+}
+
+SAMPLE_OBJECT = """<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:dcterms="http://purl.org/dc/terms/"
+    xmlns:vracore="http://www.vraweb.org/vracore4.htm" xmlns:xlink="http://www.w3.org/1999/xlink">
+  <mets:dmdSec ID="DSC_01_SNITE"><mets:mdWrap MDTYPE="DC"><mets:xmlData>
+    <dcterms:identifier>1990.001</dcterms:identifier>
+    <dcterms:description>A long description of the object</dcterms:description>
+    <dcterms:title>A Title</dcterms:title>
+    <dcterms:creator>First Creator</dcterms:creator>
+    <dcterms:creator>Second Creator</dcterms:creator>
+    <dcterms:created>1900</dcterms:created>
+    <dcterms:type>Painting</dcterms:type>
+    <dcterms:extent>10 x 12 in</dcterms:extent>
+    <dcterms:format>Oil on canvas</dcterms:format>
+    <dcterms:rights>Public domain</dcterms:rights>
+    <dcterms:license>1990.001</dcterms:license>
+    <dcterms:accessRights>On view</dcterms:accessRights>
+    <dcterms:provenance>Gift</dcterms:provenance>
+    <dcterms:subject authority="AAT">Landscape</dcterms:subject>
+    <dcterms:subject authority="AAT">Trees</dcterms:subject>
+    <dcterms:publisher>Snite Museum</dcterms:publisher>
+  </mets:xmlData></mets:mdWrap></mets:dmdSec>
+  <mets:dmdSec ID="DSC_02_SNITE"><mets:mdWrap MDTYPE="VRA"><mets:xmlData>
+    <vracore:work id="w_1990.001" source="EmbARK" refid="1990.001">
+      <vracore:agentSet><vracore:display/><vracore:agent><vracore:name>First Creator</vracore:name></vracore:agent>
+      </vracore:agentSet>
+      <vracore:measurementsSet><vracore:display>10 x 12 in</vracore:display></vracore:measurementsSet>
+      <vracore:worktypeSet><vracore:worktype>Painting</vracore:worktype></vracore:worktypeSet>
+      <vracore:materialSet><vracore:display>Oil on canvas</vracore:display><vracore:material/></vracore:materialSet>
+      <vracore:dateSet><vracore:display>01/01/2019 12:00:00</vracore:display></vracore:dateSet>
+    </vracore:work>
+  </mets:xmlData></mets:mdWrap></mets:dmdSec>
+  <mets:fileSec><mets:fileGrp ID="JPG" USE="MASTER"><mets:file ID="ID_1990_001.jpg" MIMETYPE="image/jpeg">
+    <mets:FLocat LOCTYPE="URL" xlink:href="GOOGLE::Snite::1990_001.jpg"/></mets:file></mets:fileGrp></mets:fileSec>
+  <mets:structMap TYPE="logical"><mets:div><mets:div ORDER="1" LABEL="primary">
+    <mets:fptr FILEID="ID_1990_001.jpg"/>
+  </mets:div></mets:div></mets:structMap>
+</mets:mets>"""
+
+
+def check_one_field_at_a_time(item):
+    """ The original approach: one findall over the object per required field """
+    missing_fields = []
+    for preferred_name, xpath in REQUIRED_FIELDS.items():
+        value = get_value_given_xpath(item, xpath, NAMESPACE_DICTIONARY)
+        if value == '' or value is None:
+            missing_fields.append((preferred_name, xpath))
+    return missing_fields
+
+
+def run(number=20000):
+    """ Time both approaches against the sample object, returning microseconds per object for each """
+    item = fromstring(SAMPLE_OBJECT)
+    validator = RequiredFieldValidator(REQUIRED_FIELDS, NAMESPACE_DICTIONARY)
+    assert validator.validate(item) == check_one_field_at_a_time(item)
+    results = {
+        'one_field_at_a_time_microseconds': min(timeit.repeat(lambda: check_one_field_at_a_time(item),
+                                                              number=number, repeat=3)) / number * 1e6,
+        'required_field_validator_microseconds': min(timeit.repeat(lambda: validator.validate(item),
+                                                                   number=number, repeat=3)) / number * 1e6
+    }
+    return results
+
+
+if __name__ == '__main__':
+    results = run()
+    for name, value in results.items():
+        print(name, round(value, 2))
+    print('speedup', round(results['one_field_at_a_time_microseconds']
+                           / results['required_field_validator_microseconds'], 2))
@@ -0,0 +1,610 @@
+# fake_services.py
+""" Local stand-ins for Google Drive and Web Kiosk, for load testing without either.
+    FakeDrive implements the part of Drive v3 that save_to_google_team_drive uses: files.list, create,
+    update (including moving to the trash) and delete, with simple, multipart and resumable media uploads,
+    the batch endpoint for requests without media, and a token endpoint for service account credentials.
+    FakeWebKiosk serves results.html from synthetic objects (see generate_composite_mets), a page at a time
+    or all at once, gzipped (with Range requests to resume) if asked, and can drop connections part way.
+    Both can add latency to each request, share a limited bandwidth between all their connections,
+    and fail a proportion of requests, FakeDrive with the 403 Drive sends when rate limiting.
+    FakeDrive can also enforce a quota of requests per second, answering any more with that 403.
+
+    Run from the project root to start both and write a matching configuration file:
+        python -m benchmark.fake_services --objects 10000 --latency-ms 50 --rate-limit-rate 0.01
+    then point a run at them with the CONFIG_FILE and DRIVE_API_ROOT_URL it prints. """
+
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(where_i_am))
+import argparse  # noqa: E402
+from collections import namedtuple, Counter, OrderedDict  # noqa: E402
+from datetime import datetime  # noqa: E402
+import email  # noqa: E402
+from hashlib import md5  # noqa: E402
+from http import HTTPStatus  # noqa: E402
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # noqa: E402
+from itertools import count  # noqa: E402
+import json  # noqa: E402
+import random  # noqa: E402
+import re  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+import zlib  # noqa: E402
+from urllib.parse import urlsplit, parse_qs  # noqa: E402
+from benchmark.generate_composite_mets import COMPOSITE_HEAD, COMPOSITE_TAIL, iterate_objects  # noqa: E402
+
+network_conditions = namedtuple('network_conditions',
+                                ['latency_seconds', 'bytes_per_second', 'rate_limit_rate', 'failure_rate', 'seed',
+                                 'requests_per_second'],
+                                defaults=[0.0, 0, 0.0, 0.0, 0, 0.0])
+NO_DELAYS_OR_FAILURES = network_conditions()
+
+FAKE_DRIVE_ID = 'fake-drive-id'
+FAKE_PARENT_FOLDER_ID = 'fake-parent-folder-id'
+RATE_LIMIT_ERROR = {'error': {'errors': [{'domain': 'usageLimits', 'reason': 'userRateLimitExceeded',
+                                          'message': 'User Rate Limit Exceeded'}],
+                              'code': 403, 'message': 'User Rate Limit Exceeded'}}
+BACKEND_ERROR = {'error': {'errors': [{'domain': 'global', 'reason': 'backendError', 'message': 'Backend Error'}],
+                           'code': 500, 'message': 'Backend Error'}}
+WRITE_CHUNK_SIZE = 64 * 1024
+BATCH_BOUNDARY = 'fake_batch_boundary'
+
+
+class _Network():
+    """ Applies network_conditions: latency per request, one link's bandwidth shared by every connection,
+        and which requests fail """
+    def __init__(self, conditions):
+        self.conditions = conditions
+        self._lock = threading.Lock()
+        self._randomizer = random.Random(conditions.seed)
+        self._link_free_at = 0.0
+        self._quota = float(conditions.requests_per_second)  # requests left this second, topped up continuously
+        self._quota_counted_at = time.monotonic()
+
+    def wait_for_latency(self):
+        if self.conditions.latency_seconds:
+            time.sleep(self.conditions.latency_seconds)
+
+    def transfer(self, byte_count):
+        """ Wait as long as byte_count bytes take to cross the link, behind anything already crossing it """
+        if not self.conditions.bytes_per_second or not byte_count:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._link_free_at = max(now, self._link_free_at) + byte_count / self.conditions.bytes_per_second
+            finished_at = self._link_free_at
+        time.sleep(max(0.0, finished_at - now))
+
+    def choose_fault(self, can_rate_limit):
+        """ Return 403, 500, or None for a request that should succeed """
+        with self._lock:
+            draw = self._randomizer.random()
+            if can_rate_limit and not self._take_quota():
+                return 403
+        rate_limit_rate = self.conditions.rate_limit_rate if can_rate_limit else 0.0
+        if draw < rate_limit_rate:
+            return 403
+        if draw < rate_limit_rate + self.conditions.failure_rate:
+            return 500
+        return None
+
+    def _take_quota(self):
+        """ Count one request against the quota, returning False if it is used up """
+        requests_per_second = self.conditions.requests_per_second
+        if not requests_per_second:
+            return True
+        now = time.monotonic()
+        self._quota = min(requests_per_second, self._quota + (now - self._quota_counted_at) * requests_per_second)
+        self._quota_counted_at = now
+        if self._quota < 1:
+            return False
+        self._quota -= 1
+        return True
+
+
+class _FakeServer(ThreadingHTTPServer):
+    """ Threaded http server on localhost, keeping count of what it has been asked for """
+    daemon_threads = True
+
+    def __init__(self, handler_class, conditions=NO_DELAYS_OR_FAILURES, port=0):
+        super().__init__(('127.0.0.1', port), handler_class)
+        self.network = _Network(conditions)
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:' + str(self.server_port) + '/'
+
+    def count(self, name, amount=1):
+        with self.stats_lock:
+            self.stats[name] += amount
+
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def start(self):
+        """ Serve requests on a background thread until shutdown is called """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _FakeRequestHandler(BaseHTTPRequestHandler):
+    """ Reads the whole request, then applies the server's network conditions to the response """
+    disable_nagle_algorithm = True  # otherwise small responses wait on delayed acknowledgements, adding ~40ms each
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.network.transfer(len(body))
+        return body
+
+    def _send(self, status, body=b'', content_type='application/json', headers=()):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.server.network.transfer(len(body))
+        self.wfile.write(body)
+
+    def _send_fault(self, can_rate_limit):
+        """ Send an error response and return True if this request has been chosen to fail """
+        fault = self.server.network.choose_fault(can_rate_limit)
+        if fault == 403:
+            self.server.count('rate_limited')
+            self._send(403, RATE_LIMIT_ERROR)
+        elif fault == 500:
+            self.server.count('failed')
+            self._send(500, BACKEND_ERROR)
+        return fault is not None
+
+
+class FakeDrive(_FakeServer):
+    """ In-memory Drive.  Files are kept as id, name, parents, mime type, md5 and modified time;
+        their content is only kept if keep_content is True. """
+    def __init__(self, conditions=NO_DELAYS_OR_FAILURES, port=0, keep_content=False):
+        super().__init__(_FakeDriveRequestHandler, conditions, port)
+        self.keep_content = keep_content
+        self.files = OrderedDict()  # file id -> file resource
+        self.content = {}  # file id -> bytes, if keep_content
+        self.upload_sessions = {}  # upload id -> (file id or None, metadata, bytes received so far)
+        self.files_lock = threading.Lock()
+        self._ids = count(1)
+
+    def get_stats(self):
+        stats = super().get_stats()
+        with self.files_lock:
+            stats['files'] = len(self.files)
+        return stats
+
+    def reset(self):
+        """ Empty the drive and its counts """
+        with self.files_lock:
+            self.files.clear()
+            self.content.clear()
+            self.upload_sessions.clear()
+        with self.stats_lock:
+            self.stats.clear()
+
+    def list_files(self, query, page_size, page_token):
+        """ Return a files.list response for a query like "'parent' in parents and name='x' and trashed = False" """
+        parent = re.search(r"'([^']*)' in parents", query)
+        name = re.search(r"name\s*=\s*'([^']*)'", query)
+        not_trashed = re.search(r"trashed\s*=\s*false", query, re.IGNORECASE)
+        with self.files_lock:
+            matches = [file for file in self.files.values()
+                       if (parent is None or parent.group(1) in file['parents'])
+                       and (name is None or file['name'] == name.group(1))
+                       and (not_trashed is None or not file.get('trashed'))]
+        start = int(page_token or 0)
+        response = {'kind': 'drive#fileList', 'incompleteSearch': False, 'files': matches[start:start + page_size]}
+        if start + page_size < len(matches):
+            response['nextPageToken'] = str(start + page_size)
+        return response
+
+    def save_file(self, file_id, metadata, content):
+        """ Create (if file_id is None) or update a file, returning its resource """
+        with self.files_lock:
+            if file_id is None:
+                file_id = 'fake-' + str(next(self._ids))
+                self.files[file_id] = {'kind': 'drive#file', 'id': file_id, 'name': metadata.get('name', 'Untitled'),
+                                       'mimeType': metadata.get('mimeType', 'application/octet-stream'),
+                                       'parents': metadata.get('parents', [])}
+            elif file_id not in self.files:
+                return None
+            file = self.files[file_id]
+            file.update({key: value for key, value in metadata.items() if key in ('name', 'mimeType', 'trashed')})
+            if content is not None:
+                file['md5Checksum'] = md5(content).hexdigest()
+                file['size'] = str(len(content))
+                if self.keep_content:
+                    self.content[file_id] = content
+            file['modifiedTime'] = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+            return dict(file)
+
+    def delete_file(self, file_id):
+        with self.files_lock:
+            self.content.pop(file_id, None)
+            return self.files.pop(file_id, None) is not None
+
+    def start_upload(self, file_id, metadata):
+        """ Open a resumable upload session, returning its id """
+        with self.files_lock:
+            upload_id = str(next(self._ids))
+            self.upload_sessions[upload_id] = (file_id, metadata, b'')
+        return upload_id
+
+    def continue_upload(self, upload_id, chunk, total_size):
+        """ Add chunk to a resumable upload.  Returns (bytes received so far, the file resource once complete).
+            Raises KeyError for an unknown upload_id. """
+        with self.files_lock:
+            file_id, metadata, received = self.upload_sessions[upload_id]
+            received += chunk
+            if total_size is not None and len(received) < total_size:
+                self.upload_sessions[upload_id] = (file_id, metadata, received)
+                return len(received), None
+            del self.upload_sessions[upload_id]
+        return len(received), self.save_file(file_id, metadata, received)
+
+
+class _FakeDriveRequestHandler(_FakeRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, as Drive does
+    FILES_PATH = re.compile(r'^/(?P<upload>upload/)?drive/v3/files(/(?P<file_id>[^/]+))?$')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        parameters = {key: values[0] for key, values in parse_qs(url.query).items()}
+        body = self._read_body()
+        if url.path == '/token':  # service account credentials refresh
+            self.server.count('token')
+            return self._send(200, {'access_token': 'fake-access-token', 'expires_in': 3600, 'token_type': 'Bearer'})
+        if url.path == '/fake/stats':
+            return self._send(200, self.server.get_stats())
+        if url.path == '/fake/reset' and method == 'POST':
+            self.server.reset()
+            return self._send(204)
+        if url.path == '/batch/drive/v3' and method == 'POST':
+            self.server.network.wait_for_latency()
+            return self._batch(body)
+        match = self.FILES_PATH.match(url.path)
+        if match is None:
+            return self._send(404, {'error': {'code': 404, 'message': 'Not Found'}})
+        self.server.network.wait_for_latency()
+        if self._send_fault(can_rate_limit=True):
+            return
+        if match.group('upload'):
+            return self._upload(method, match.group('file_id'), parameters, body)
+        self._files(method, match.group('file_id'), parameters, body)
+
+    def _files(self, method, file_id, parameters, body):
+        """ files.list, files.delete, and files.create or files.update without media """
+        if method == 'GET' and file_id is None:
+            self.server.count('list')
+            return self._send(200, self.server.list_files(parameters.get('q', ''),
+                                                          int(parameters.get('pageSize', 100)),
+                                                          parameters.get('pageToken')))
+        if method == 'DELETE' and file_id is not None:
+            self.server.count('delete')
+            if self.server.delete_file(file_id):
+                return self._send(204)
+            return self._send_not_found(file_id)
+        if method in ('POST', 'PATCH'):
+            self.server.count('create' if method == 'POST' else 'update')
+            return self._send_file(self.server.save_file(file_id, json.loads(body or b'{}'), None), file_id)
+        self._send(405, {'error': {'code': 405, 'message': 'Method Not Allowed'}})
+
+    def _batch(self, body):
+        """ Handle each request of a multipart/mixed batch as if on its own, answering them all in one response """
+        self.server.count('batch')
+        message = email.message_from_bytes(b'Content-Type: ' + self.headers['Content-Type'].encode('ascii')
+                                           + b'\r\n\r\n' + body)
+        response_parts = []
+        for part in message.get_payload():
+            request_line, _, rest = part.get_payload().partition('\n')
+            method, path, _ = request_line.split(' ', 2)
+            part_body = rest.replace('\r\n', '\n').partition('\n\n')[2].encode('utf-8')
+            status, content = _FakeDriveBatchPart(self.server, method, path).handle(part_body)
+            response_parts.append('--' + BATCH_BOUNDARY + '\r\nContent-Type: application/http\r\n'
+                                  + 'Content-ID: <response-' + part['Content-ID'][1:] + '\r\n\r\n'
+                                  + 'HTTP/1.1 ' + str(status) + ' ' + HTTPStatus(status).phrase + '\r\n'
+                                  + 'Content-Type: application/json\r\n\r\n' + content.decode('utf-8') + '\r\n')
+        response = ''.join(response_parts) + '--' + BATCH_BOUNDARY + '--\r\n'
+        self._send(200, response.encode('utf-8'), 'multipart/mixed; boundary=' + BATCH_BOUNDARY)
+
+    def _upload(self, method, file_id, parameters, body):
+        """ Media upload to create (POST) or update (PATCH) a file, or the content of a resumable upload (PUT) """
+        upload_type = parameters.get('uploadType', 'media')
+        if method == 'PUT' or 'upload_id' in parameters:
+            return self._continue_resumable_upload(parameters.get('upload_id', ''), body)
+        self.server.count('create' if method == 'POST' else 'update')
+        if upload_type == 'resumable':
+            upload_id = self.server.start_upload(file_id, json.loads(body or b'{}'))
+            location = 'http://' + self.headers['Host'] + self.path.split('?')[0] \
+                + '?uploadType=resumable&upload_id=' + upload_id
+            return self._send(200, headers=[('Location', location)])
+        if upload_type == 'multipart':
+            metadata, content = self._split_multipart(body)
+        else:
+            metadata, content = {}, body
+        self.server.count('bytes_uploaded', len(content))
+        self._send_file(self.server.save_file(file_id, metadata, content), file_id)
+
+    def _continue_resumable_upload(self, upload_id, body):
+        """ Add a chunk to a resumable upload, finishing it once every byte has arrived """
+        total_size = self.headers.get('Content-Range', '').rpartition('/')[2]
+        try:
+            received_size, file = self.server.continue_upload(upload_id, body,
+                                                              int(total_size) if total_size.isdigit() else None)
+        except KeyError:
+            return self._send(404, {'error': {'code': 404, 'message': 'Upload session not found'}})
+        self.server.count('bytes_uploaded', len(body))
+        if file is None:
+            headers = [('Range', 'bytes=0-' + str(received_size - 1))] if received_size else []
+            return self._send(308, headers=headers)
+        self._send(200, file)
+
+    def _split_multipart(self, body):
+        """ Return the metadata and content parts of a multipart/related upload """
+        message = email.message_from_bytes(b'Content-Type: ' + self.headers['Content-Type'].encode('ascii')
+                                           + b'\r\n\r\n' + body)
+        metadata_part, content_part = message.get_payload()
+        return json.loads(metadata_part.get_payload(decode=True) or b'{}'), content_part.get_payload(decode=True)
+
+    def _send_file(self, file, file_id):
+        if file is None:
+            return self._send_not_found(file_id)
+        self._send(200, file)
+
+    def _send_not_found(self, file_id):
+        self._send(404, {'error': {'errors': [{'domain': 'global', 'reason': 'notFound',
+                                               'message': 'File not found: ' + str(file_id) + '.'}],
+                                   'code': 404, 'message': 'File not found: ' + str(file_id) + '.'}})
+
+
+class _FakeDriveBatchPart(_FakeDriveRequestHandler):
+    """ One request of a batch, handled as if it had come on its own, keeping the response instead of sending it """
+    def __init__(self, server, method, path):  # rather than BaseHTTPRequestHandler's, which serves a connection
+        self.server = server
+        self.method = method
+        self.path = path
+        self.response = None
+
+    def handle(self, body):
+        """ Return the status and content of the response to this request """
+        url = urlsplit(self.path)
+        parameters = {key: values[0] for key, values in parse_qs(url.query).items()}
+        match = self.FILES_PATH.match(url.path)
+        if match is None or match.group('upload'):  # Drive doesn't take media uploads in batches either
+            self._send(400, {'error': {'code': 400, 'message': 'Bad Request'}})
+        elif not self._send_fault(can_rate_limit=True):
+            self._files(self.method, match.group('file_id'), parameters, body)
+        return self.response
+
+    def _send(self, status, body=b'', content_type='application/json', headers=()):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+        self.response = (status, body)
+
+
+class FakeWebKiosk(_FakeServer):
+    """ Serves /results.html as a composite METS export of object_count synthetic objects.
+        maximumrecords (-1 for everything) and the page_start_parameter (first record, from 1) select a page;
+        the query itself is ignored, so full and incremental runs get the same objects.
+        Asked for gzip, it sends the page gzipped, with its length and an ETag, and answers Range requests for it.
+        With drop_after_bytes, it closes each connection after sending that many bytes of a gzipped page,
+        first leaving it idle for stall_seconds, as a connection that stalls rather than drops would be. """
+    def __init__(self, object_count, conditions=NO_DELAYS_OR_FAILURES, port=0, page_start_parameter='startrecord',
+                 description_size=200, missing_field_rate=0.0, drop_after_bytes=0, stall_seconds=0):
+        super().__init__(_FakeWebKioskRequestHandler, conditions, port)
+        self.object_count = object_count
+        self.page_start_parameter = page_start_parameter
+        self.description_size = description_size
+        self.missing_field_rate = missing_field_rate
+        self.drop_after_bytes = drop_after_bytes
+        self.stall_seconds = stall_seconds
+        self._compressed_exports = {}
+        self._compressed_exports_lock = threading.Lock()
+
+    def get_compressed_export(self, first_record, maximum_records):
+        """ Return the export gzipped, the same bytes each time it is asked for, so a Range of it can be sent """
+        with self._compressed_exports_lock:
+            key = (first_record, maximum_records)
+            if key not in self._compressed_exports:
+                compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # a gzip header without a time
+                pieces = [compressor.compress(piece) for piece in self.iterate_export(first_record, maximum_records)]
+                pieces.append(compressor.flush())
+                self._compressed_exports[key] = b''.join(pieces)
+            return self._compressed_exports[key]
+
+    def iterate_export(self, first_record, maximum_records):
+        """ Yield the export a piece at a time, as bytes """
+        first_object = min(max(first_record - 1, 0), self.object_count)
+        object_count = self.object_count - first_object
+        if maximum_records >= 0:
+            object_count = min(object_count, maximum_records)
+        yield COMPOSITE_HEAD.encode('utf-8')
+        for object_xml, missing_fields in iterate_objects(object_count, first_object, self.description_size,
+                                                          missing_field_rate=self.missing_field_rate):
+            yield object_xml.encode('utf-8')
+        yield COMPOSITE_TAIL.encode('utf-8')
+
+
+class _FakeWebKioskRequestHandler(_FakeRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parameters = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/fake/stats':
+            return self._send(200, self.server.get_stats())
+        if url.path != '/results.html':
+            return self._send(404, b'Not Found', 'text/plain')
+        self.server.network.wait_for_latency()
+        if self._send_fault(can_rate_limit=False):
+            return
+        self.server.count('results')
+        first_record = int(parameters.get(self.server.page_start_parameter, 1))
+        maximum_records = int(parameters.get('maximumrecords', -1))
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            return self._send_compressed(self.server.get_compressed_export(first_record, maximum_records))
+        # the length isn't known in advance, so the response ends when the connection closes, as an HTTP/1.0 one does
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.end_headers()
+        pending = []
+        pending_size = 0
+        for piece in self.server.iterate_export(first_record, maximum_records):
+            pending.append(piece)
+            pending_size += len(piece)
+            if pending_size >= WRITE_CHUNK_SIZE:
+                self._write(b''.join(pending))
+                pending, pending_size = [], 0
+        self._write(b''.join(pending))
+
+    def _send_compressed(self, body):
+        """ Send body, or the Range of it asked for, with Content-Encoding gzip """
+        etag = '"' + md5(body).hexdigest() + '"'
+        start = 0
+        requested_range = re.fullmatch(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if requested_range and self.headers.get('If-Range', etag) == etag:
+            start = int(requested_range.group(1))
+            if start >= len(body):
+                return self._send(416, b'', 'text/plain', [('Content-Range', 'bytes */' + str(len(body)))])
+            self.server.count('resumed')
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(len(body) - 1) + '/' + str(len(body)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body) - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        end = len(body)
+        if self.server.drop_after_bytes:
+            end = min(end, start + self.server.drop_after_bytes)
+        for offset in range(start, end, WRITE_CHUNK_SIZE):
+            self._write(body[offset:min(offset + WRITE_CHUNK_SIZE, end)])
+        if end < len(body):  # the connection closes once this returns, short of Content-Length
+            self.server.count('dropped')
+            time.sleep(self.server.stall_seconds)
+
+    def _write(self, chunk):
+        self.server.network.transfer(len(chunk))
+        self.wfile.write(chunk)
+        self.server.count('bytes_sent', len(chunk))
+
+
+def get_fake_service_account_info(token_uri):
+    """ Service account credentials with a freshly generated key, which refresh against token_uri """
+    return {
+        'type': 'service_account',
+        'project_id': 'fake-project',
+        'private_key_id': 'fake-key',
+        'private_key': _generate_private_key_pem(),
+        'client_email': 'fake@fake-project.iam.gserviceaccount.com',
+        'client_id': '1',
+        'token_uri': token_uri
+    }
+
+
+def _generate_private_key_pem():
+    """ An RSA key for google-auth to sign with, from whichever of its signing libraries is installed """
+    try:
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+        return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                 serialization.NoEncryption()).decode('ascii')
+    except ImportError:
+        import rsa
+        public_key, private_key = rsa.newkeys(2048)
+        return private_key.save_pkcs1().decode('ascii')
+
+
+def get_fake_parameters(drive, web_kiosk):
+    """ Parameter Store keys and values (as read from CONFIG_FILE or CONFIG_JSON) for a run against the fakes """
+    parameters = {'google/credentials/' + key: value
+                  for key, value in get_fake_service_account_info(drive.url + 'token').items()}
+    parameters.update({
+        'google/museum/metadata/drive-id': FAKE_DRIVE_ID,
+        'google/museum/metadata/parent-folder-id': FAKE_PARENT_FOLDER_ID,
+        'embark/server-address': web_kiosk.url.rstrip('/'),
+        'sentry/dsn': '',
+        'museum/notification-email-address': 'nobody@example.com',
+        'no-reply-email-address': 'nobody@example.com'
+    })
+    return parameters
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Run fake Google Drive and Web Kiosk services.')
+    parser.add_argument('--objects', type=int, default=1000, help='objects in the Web Kiosk export')
+    parser.add_argument('--description-size', type=int, default=200)
+    parser.add_argument('--missing-field-rate', type=float, default=0.0)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='added to every request')
+    parser.add_argument('--bandwidth-kbps', type=float, default=0.0,
+                        help='kilobytes per second shared by all connections to each service (0 for no limit)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='proportion of Drive requests answered with 403 userRateLimitExceeded')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='proportion of requests answered with 500 backendError')
+    parser.add_argument('--quota-per-second', type=float, default=0.0,
+                        help='Drive requests allowed a second, answering any more with 403 (0 for no quota)')
+    parser.add_argument('--drop-after-bytes', type=int, default=0,
+                        help='close each Web Kiosk connection after sending this many bytes (0 to send them all)')
+    parser.add_argument('--stall-seconds', type=float, default=0.0,
+                        help='how long each such connection is left idle before it is closed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--drive-port', type=int, default=0)
+    parser.add_argument('--web-kiosk-port', type=int, default=0)
+    parser.add_argument('--write-config', default='/tmp/fake_services_config.json',
+                        help='where to write the configuration for CONFIG_FILE')
+    options = parser.parse_args(arguments)
+    conditions = network_conditions(options.latency_ms / 1000, int(options.bandwidth_kbps * 1024),
+                                    options.rate_limit_rate, options.failure_rate, options.seed,
+                                    options.quota_per_second)
+    drive = FakeDrive(conditions, options.drive_port).start()
+    web_kiosk = FakeWebKiosk(options.objects, conditions, options.web_kiosk_port,
+                             description_size=options.description_size,
+                             missing_field_rate=options.missing_field_rate,
+                             drop_after_bytes=options.drop_after_bytes,
+                             stall_seconds=options.stall_seconds).start()
+    with open(os.open(options.write_config, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as config_file:
+        json.dump(get_fake_parameters(drive, web_kiosk), config_file, indent=2)
+    print('Fake Drive at', drive.url, 'and fake Web Kiosk at', web_kiosk.url)
+    print('export CONFIG_FILE=' + options.write_config)
+    print('export DRIVE_API_ROOT_URL=' + drive.url, flush=True)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print('Drive:', drive.get_stats())
+        print('Web Kiosk:', web_kiosk.get_stats())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,188 @@
+# generate_composite_mets.py
+""" Write a synthetic composite METS export, shaped like the output of
+    on_web_kiosk_server/EmbARK_Web_Kiosk/Templates/API/marble_mets.xml, for benchmarks and load tests.
+    Objects are written one at a time, so any number of them can be generated without holding them in memory.
+
+    Run from the project root:
+        python -m benchmark.generate_composite_mets --objects 10000 --output /tmp/web_kiosk_mets_composite.xml """
+
+import argparse
+import os
+import random
+import sys
+from xml.sax.saxutils import escape, quoteattr
+
+COMPOSITE_HEAD = '''<?xml version="1.0" encoding="utf-8" standalone="no" ?>
+<superMets xmlns="http://www.loc.gov/METS/" xmlns:mets="http://www.loc.gov/METS/"
+    xmlns:xlink="http://www.w3.org/1999/xlink" xmlns:dcterms="http://purl.org/dc/terms/"
+    xmlns:vracore="http://www.vraweb.org/vracore4.htm"
+    xmlns:bogus="http://www.nd.edu/"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+    xsi:schemaLocation="http://www.loc.gov/METS/ http://www.loc.gov/standards/mets/mets.xsd http://purl.org/dc/terms/
+    http://dublincore.org/schemas/xmls/qdc/2008/02/11/dcterms.xsd
+    http://www.vraweb.org/vracore4.htm http://www.loc.gov/standards/vracore/vra-strict.xsd">
+'''
+COMPOSITE_TAIL = '</superMets>\n'
+
+# Required fields (see REQUIRED_FIELDS in src/get_config.py) that missing_field_rate may leave out.
+# "Unique identifier" is never left out, because every object is named after it.
+OPTIONAL_REQUIRED_FIELDS = ('Title', 'Creator', 'Date created', 'Work Type', 'Medium', 'Repository', 'Subject',
+                            'Usage', 'Access', 'Dimensions', 'Dedication', 'Thumbnail')
+
+WORDS = ('oil', 'canvas', 'landscape', 'portrait', 'bronze', 'museum', 'gift', 'study', 'river', 'light', 'figure',
+         'panel', 'print', 'etching', 'collection', 'morning', 'harbor', 'garden', 'still', 'life')
+
+
+def get_text(randomizer, size):
+    """ Return roughly size characters of words """
+    words = []
+    length = 0
+    while length < size:
+        word = randomizer.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+
+def get_object_xml(randomizer, object_id, missing_fields=(), description_size=200, subject_count=3, image_count=1):
+    """ Return the xml of one mets record, leaving out any fields named in missing_fields """
+    def field(name, text):
+        return '' if name in missing_fields else text
+
+    title = get_text(randomizer, 40)
+    creator = get_text(randomizer, 20).title()
+    dimensions = '{} x {} in'.format(randomizer.randint(1, 90), randomizer.randint(1, 90))
+    dc = [
+        '              <dcterms:identifier>{}</dcterms:identifier>\n'.format(escape(object_id)),
+        '            <dcterms:description>{}</dcterms:description>\n'.format(get_text(randomizer, description_size)),
+        field('Title', '              <dcterms:title>{}</dcterms:title>\n'.format(title)),
+        field('Creator', '                  <dcterms:creator>{}</dcterms:creator>\n'.format(creator)),
+        field('Date created', '              <dcterms:created>{}</dcterms:created>\n'.format(
+            randomizer.randint(1400, 2019))),
+        '              <dcterms:type>Paintings</dcterms:type>\n',
+        field('Dimensions', '              <dcterms:extent>{}</dcterms:extent>\n'.format(dimensions)),
+        '            <dcterms:format>Painting</dcterms:format>\n',
+        field('Usage', '            <dcterms:rights>Public domain</dcterms:rights>\n'),
+        '            <dcterms:license>{}</dcterms:license>\n'.format(randomizer.randint(1, 99999)),
+        field('Access', '            <dcterms:accessRights>Gallery {}</dcterms:accessRights>\n'.format(
+            randomizer.randint(1, 30))),
+        field('Dedication', '            <dcterms:provenance>Gift of {}</dcterms:provenance>\n'.format(
+            get_text(randomizer, 30).title())),
+    ]
+    if 'Subject' not in missing_fields:
+        for _ in range(subject_count):
+            dc.append('              <dcterms:subject authority="AAT" valueURI="http://vocab.getty.edu/aat/{}" >{}'
+                      '</dcterms:subject>\n'.format(randomizer.randint(300000000, 300999999),
+                                                    randomizer.choice(WORDS)))
+    dc.append(field('Repository', '            <dcterms:publisher>Snite Museum of Art</dcterms:publisher>\n'))
+    image_names = ['{}_{}.jpg'.format(object_id, number) for number in range(1, image_count + 1)]
+    files = ''.join('''                        <file ID={}  MIMETYPE="image/jpeg">
+                            <FLocat LOCTYPE="URL" xlink:href={} />
+                        </file>
+'''.format(quoteattr('ID_' + name), quoteattr('GOOGLE::Snite Archive-Collection Team Drive::' + name))
+        for name in image_names)
+    divs = ''.join('''                <mets:div ORDER="{0}" LABEL="{1}">
+                    <fptr{2} />
+                </mets:div>
+'''.format(order, 'primary' if order == 1 else 'secondary',
+           '' if 'Thumbnail' in missing_fields else ' FILEID=' + quoteattr('ID_' + name))
+        for order, name in enumerate(image_names, 1))
+    return '''    <mets>
+        <dmdSec ID="DSC_01_SNITE">
+          <mdWrap MDTYPE="DC">
+            <xmlData>
+{dc}            </xmlData>
+          </mdWrap>
+        </dmdSec>
+
+        <dmdSec ID="DSC_02_SNITE">
+            <mdWrap MDTYPE="VRA">
+              <xmlData>
+                  <vracore:work id={work_id} source="EmbARK" refid={refid}>
+                      <vracore:agentSet>
+                            <vracore:display/>
+                            <vracore:agent>
+                                  <vracore:name vocab="ULAN" refid="500000000" type="personal">{creator}</vracore:name>
+                                  <vracore:role>artist</vracore:role>
+                            </vracore:agent>
+                      </vracore:agentSet>
+                      <vracore:measurementsSet>
+                            <vracore:display>{dimensions}</vracore:display>
+                      </vracore:measurementsSet>
+{worktype}{material}                      <vracore:dateSet>
+                          <vracore:display>01/01/2019 12:00:00</vracore:display>
+                      </vracore:dateSet>
+                  </vracore:work>
+              </xmlData>
+            </mdWrap>
+        </dmdSec>
+        <fileSec>
+            <fileGrp ID="JPG" USE="MASTER">
+{files}            </fileGrp>
+        </fileSec>
+        <structMap TYPE="logical">
+            <mets:div>
+{divs}            </mets:div>
+        </structMap>
+    </mets>
+'''.format(dc=''.join(dc), work_id=quoteattr('w_' + object_id), refid=quoteattr(object_id), creator=creator,
+           dimensions=dimensions,
+           worktype=field('Work Type', '                      <vracore:worktypeSet><vracore:worktype>Painting'
+                                       '</vracore:worktype></vracore:worktypeSet>\n'),
+           material=field('Medium', '                      <vracore:materialSet>\n'
+                                    '                          <vracore:display>Oil on canvas</vracore:display>\n'
+                                    '                          <vracore:material/>\n'
+                                    '                      </vracore:materialSet>\n'),
+           files=files, divs=divs)
+
+
+def iterate_objects(object_count, first_object=0, description_size=200, subject_count=3, image_count=1,
+                    missing_field_rate=0.0, seed=0):
+    """ Yield (object xml, fields left out) for objects first_object to first_object + object_count - 1.
+        Each object depends only on seed and its own number, so any page of objects can be produced on its own
+        and will match the same objects in a complete export. """
+    for number in range(first_object, first_object + object_count):
+        randomizer = random.Random('{}-{}'.format(seed, number))
+        missing_fields = {name for name in OPTIONAL_REQUIRED_FIELDS if randomizer.random() < missing_field_rate}
+        object_id = '{}.{:06d}'.format(1900 + number // 1000000, number % 1000000)
+        yield get_object_xml(randomizer, object_id, missing_fields, description_size, subject_count,
+                             image_count), missing_fields
+
+
+def generate_composite_mets(full_path_file_name, object_count, description_size=200, subject_count=3,
+                            image_count=1, missing_field_rate=0.0, seed=0):
+    """ Write a composite export of object_count objects.
+        Each optional required field is left out of an object with probability missing_field_rate.
+        Returns the number of objects with at least one field left out. """
+    objects_missing_fields = 0
+    with open(full_path_file_name, 'w', encoding='utf-8') as output_file:
+        output_file.write(COMPOSITE_HEAD)
+        for object_xml, missing_fields in iterate_objects(object_count, 0, description_size, subject_count,
+                                                          image_count, missing_field_rate, seed):
+            if missing_fields:
+                objects_missing_fields += 1
+            output_file.write(object_xml)
+        output_file.write(COMPOSITE_TAIL)
+    return objects_missing_fields
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Write a synthetic composite METS export.')
+    parser.add_argument('--objects', type=int, default=1000)
+    parser.add_argument('--output', default='/tmp/web_kiosk_mets_composite.xml')
+    parser.add_argument('--description-size', type=int, default=200, help='characters of description per object')
+    parser.add_argument('--subjects', type=int, default=3, help='subjects per object')
+    parser.add_argument('--images', type=int, default=1, help='images per object')
+    parser.add_argument('--missing-field-rate', type=float, default=0.0,
+                        help='chance that each optional required field is left out of an object')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args(arguments)
+    objects_missing_fields = generate_composite_mets(options.output, options.objects, options.description_size,
+                                                     options.subjects, options.images, options.missing_field_rate,
+                                                     options.seed)
+    print('Wrote', options.objects, 'objects (' + str(objects_missing_fields), 'missing fields) to', options.output,
+          '(' + str(os.path.getsize(options.output)), 'bytes)')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
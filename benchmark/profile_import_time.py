@@ -0,0 +1,67 @@
+# profile_import_time.py
+""" Profile how long the Lambda handler takes to import, using python -X importtime in a fresh interpreter.
+    Exits with an error if the import takes longer than the budget, or if it loads any of the libraries
+    that should only be loaded once the stage that needs them runs.
+
+    Run from the project root:  python -m benchmark.profile_import_time [--budget-ms 250] [--top 15] """
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+SOURCE_FOLDER = os.path.join(os.path.dirname(where_i_am), 'src')
+DEFAULT_BUDGET_MILLISECONDS = 250
+# Parameter Store, S3 and SES (boto3), and Google Drive, are only used part way through a run
+DEFERRED_MODULES = ('boto3', 'botocore', 'googleapiclient', 'google.oauth2', 'google_auth_httplib2', 'httplib2')
+IMPORT_TIME_PATTERN = re.compile(r'^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| +(?P<module>\S+)$')
+
+
+def get_import_times(module_name='handler', repeat=3):
+    """ Return {module: cumulative microseconds} from the fastest of repeat imports of module_name """
+    fastest = None
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module_name],
+                                   cwd=SOURCE_FOLDER, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        import_times = {}
+        for line in completed.stderr.splitlines():
+            match = IMPORT_TIME_PATTERN.match(line)
+            if match:
+                import_times[match.group('module')] = int(match.group('cumulative'))
+        if fastest is None or import_times[module_name] < fastest[module_name]:
+            fastest = import_times
+    return fastest
+
+
+def get_deferred_modules_imported(import_times):
+    """ Return any DEFERRED_MODULES (or their submodules) that were imported """
+    return sorted(module for module in import_times
+                  if any(module == deferred or module.startswith(deferred + '.') for deferred in DEFERRED_MODULES))
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Profile the import time of the Lambda handler.')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MILLISECONDS)
+    parser.add_argument('--top', type=int, default=15, help='number of slowest imports to list')
+    parser.add_argument('--module', default='handler')
+    options = parser.parse_args(arguments)
+    import_times = get_import_times(options.module)
+    for module, microseconds in sorted(import_times.items(), key=lambda item: -item[1])[:options.top]:
+        print('{:10.1f} ms  {}'.format(microseconds / 1000, module))
+    total_milliseconds = import_times[options.module] / 1000
+    print('import {} took {:.1f} ms (budget {:.1f} ms)'.format(options.module, total_milliseconds, options.budget_ms))
+    problems = []
+    if total_milliseconds > options.budget_ms:
+        problems.append('import time is over budget')
+    deferred_modules_imported = get_deferred_modules_imported(import_times)
+    if deferred_modules_imported:
+        problems.append('imported at startup: ' + ', '.join(deferred_modules_imported[:10]))
+    for problem in problems:
+        print('FAIL:', problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
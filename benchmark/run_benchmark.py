@@ -0,0 +1,252 @@
+# run_benchmark.py
+""" Measure throughput of a whole run, offline, against synthetic composite METS files of several sizes.
+    Each stage is timed separately:
+        fetch      streaming the composite file from a local http server to disk (stream_url_to_disk)
+        split      iterating the mets:mets records out of it (the XML backend's iterate_records)
+        validate   checking required fields (RequiredFieldValidator)
+        serialize  serializing each object with the xsi attributes added, as process_web_kiosk_metadata does
+        upload     handing each object to a ConcurrentUploader, which writes it to a scratch folder,
+                   optionally after a simulated round trip, in place of Google Drive
+    Each size runs in its own interpreter, so peak RSS is measured per size.
+    Results are written as JSON; pass an earlier results file with --compare to see the change per stage.
+    --xml-backend chooses the XML library (stdlib or lxml), as the xml_backend setting does, and --split-workers
+    splits, validates and serializes with that many processes, as the split_workers setting does.
+
+    Run from the project root:
+        python -m benchmark.run_benchmark --sizes 1000 10000 100000 --output /tmp/benchmark.json """
+
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(os.path.dirname(where_i_am))
+import argparse  # noqa: E402
+from datetime import datetime  # noqa: E402
+from functools import partial  # noqa: E402
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer  # noqa: E402
+import json  # noqa: E402
+import platform  # noqa: E402
+import resource  # noqa: E402
+import subprocess  # noqa: E402
+import tempfile  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+from benchmark.generate_composite_mets import generate_composite_mets  # noqa: E402
+from src.concurrent_uploader import ConcurrentUploader  # noqa: E402
+from src.get_config import REQUIRED_FIELDS  # noqa: E402
+from src.parallel_split import iterate_split_objects  # noqa: E402
+from src.process_web_kiosk_metadata import OBJECT_ID_XPATH  # noqa: E402
+from src.required_field_validator import RequiredFieldValidator  # noqa: E402
+from src.stream_url_to_disk import stream_url_to_disk  # noqa: E402
+from src.xml_backend import get_xml_backend  # noqa: E402
+from src.xml_manipulation import save_bytes_of_xml_to_disk  # noqa: E402
+
+STAGES = ('fetch', 'split', 'validate', 'serialize', 'upload')
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+class _QuietRequestHandler(SimpleHTTPRequestHandler):
+    """ Serve files without logging every request """
+    def log_message(self, format, *args):
+        pass
+
+
+def _save_object(folder_name, file_name, xml_as_bytes, latency_seconds):
+    """ Stands in for save_bytes_to_google_team_drive """
+    if latency_seconds:
+        time.sleep(latency_seconds)
+    save_bytes_of_xml_to_disk(folder_name, file_name, xml_as_bytes)
+
+
+def _fetch(full_path_file_name, folder_name):
+    """ Serve full_path_file_name over http on localhost and stream it into folder_name.
+        Returns the stream_result and the seconds taken, not counting starting and stopping the server. """
+    handler = partial(_QuietRequestHandler, directory=os.path.dirname(full_path_file_name))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = 'http://127.0.0.1:' + str(server.server_port) + '/' + os.path.basename(full_path_file_name)
+        start = time.perf_counter()
+        fetch_result = stream_url_to_disk(url, folder_name, 'web_kiosk_mets_composite.xml')
+        return fetch_result, time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_once(full_path_file_name, upload_workers=10, upload_latency_seconds=0.0, xml_backend_name='auto',
+             split_workers=0):
+    """ Time each stage of processing full_path_file_name, returning a dictionary of results.
+        With split_workers, split covers splitting, validating and serializing, which happen in worker processes. """
+    seconds = dict.fromkeys(STAGES, 0.0)
+    objects = 0
+    objects_missing_fields = 0
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as folder_name:
+        fetch_result, seconds['fetch'] = _fetch(full_path_file_name, folder_name)
+        upload_folder_name = os.path.join(folder_name, 'uploaded')
+        xml_backend = get_xml_backend(xml_backend_name)
+        uploader = ConcurrentUploader(upload_workers)
+        namespace_dictionary = {}
+        validator = None
+        if split_workers:
+            records = iterate_split_objects(fetch_result.path, 'mets:mets', namespace_dictionary, OBJECT_ID_XPATH,
+                                            REQUIRED_FIELDS, xml_backend_name, split_workers)
+        else:
+            records = xml_backend.iterate_records(fetch_result.path, 'mets:mets', namespace_dictionary)
+        while True:
+            start = time.perf_counter()
+            item = next(records, None)
+            split_finished = time.perf_counter()
+            seconds['split'] += split_finished - start
+            if item is None:
+                break
+            if split_workers:
+                objects += 1
+                objects_missing_fields += 1 if item.missing_fields else 0
+                uploader.submit(item.object_id, _save_object, upload_folder_name, item.object_id + '.xml',
+                                item.xml_as_bytes, upload_latency_seconds)
+                seconds['upload'] += time.perf_counter() - split_finished
+                continue
+            if validator is None:
+                xml_backend.use_namespaces(namespace_dictionary)
+                validator = RequiredFieldValidator(REQUIRED_FIELDS, namespace_dictionary)
+            objects += 1
+            object_id = item.find(OBJECT_ID_XPATH, namespace_dictionary).text
+            if validator.validate(item):
+                objects_missing_fields += 1
+            validate_finished = time.perf_counter()
+            seconds['validate'] += validate_finished - split_finished
+            xml_as_bytes = xml_backend.serialize_record(item)
+            serialize_finished = time.perf_counter()
+            seconds['serialize'] += serialize_finished - validate_finished
+            uploader.submit(object_id, _save_object, upload_folder_name, object_id + '.xml', xml_as_bytes,
+                            upload_latency_seconds)
+            seconds['upload'] += time.perf_counter() - serialize_finished
+        start = time.perf_counter()
+        uploader.wait()
+        seconds['upload'] += time.perf_counter() - start
+    total_seconds = sum(seconds.values())
+    return {
+        'xml_backend': xml_backend.name,
+        'objects': objects,
+        'bytes': fetch_result.size,
+        'objects_missing_fields': objects_missing_fields,
+        'uploads_failed': len(uploader.failed),
+        'stage_seconds': {stage: round(value, 4) for stage, value in seconds.items()},
+        'total_seconds': round(total_seconds, 4),
+        'objects_per_second': round(objects / total_seconds, 1) if total_seconds else None,
+        'split_workers': split_workers,
+        'peak_rss_mb': round(_get_peak_rss_mb(), 1),
+        'peak_split_worker_rss_mb': round(_get_peak_rss_mb(resource.RUSAGE_CHILDREN), 1) if split_workers else None
+    }
+
+
+def _get_peak_rss_mb(who=resource.RUSAGE_SELF):
+    """ Peak resident memory of this process so far (or with RUSAGE_CHILDREN, of its largest child process) """
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, kilobytes elsewhere
+
+
+def _run_in_fresh_interpreter(full_path_file_name, options):
+    """ run_once in a new process, so each size starts from the same memory baseline """
+    completed = subprocess.run([sys.executable, '-m', 'benchmark.run_benchmark', '--single', full_path_file_name,
+                                '--upload-workers', str(options.upload_workers),
+                                '--upload-latency-ms', str(options.upload_latency_ms),
+                                '--xml-backend', options.xml_backend,
+                                '--split-workers', str(options.split_workers)],
+                               cwd=os.path.dirname(where_i_am), stdout=subprocess.PIPE, universal_newlines=True,
+                               check=True)
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def _get_revision():
+    """ The git revision being measured, if we can tell """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(where_i_am),
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(options):
+    """ Generate each size of composite file (or reuse one already generated) and time processing it """
+    results = {
+        'revision': _get_revision(),
+        'python': platform.python_version(),
+        'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'settings': {
+            'description_size': options.description_size,
+            'missing_field_rate': options.missing_field_rate,
+            'upload_workers': options.upload_workers,
+            'upload_latency_ms': options.upload_latency_ms,
+            'xml_backend': options.xml_backend,
+            'split_workers': options.split_workers
+        },
+        'runs': []
+    }
+    os.makedirs(options.data_folder, exist_ok=True)
+    for size in options.sizes:
+        full_path_file_name = os.path.join(options.data_folder, 'composite-{}-{}-{}.xml'.format(
+            size, options.description_size, options.missing_field_rate))
+        if not os.path.exists(full_path_file_name):
+            generate_composite_mets(full_path_file_name, size, description_size=options.description_size,
+                                    missing_field_rate=options.missing_field_rate)
+        result = _run_in_fresh_interpreter(full_path_file_name, options)
+        results['runs'].append(result)
+        print(size, 'objects:', result['objects_per_second'], 'objects/second,', result['peak_rss_mb'], 'MB peak,',
+              ', '.join(stage + ' ' + str(result['stage_seconds'][stage]) + 's' for stage in STAGES))
+    return results
+
+
+def compare(old_results, new_results):
+    """ Print new/old time for each stage of each size measured in both """
+    old_runs = {run['objects']: run for run in old_results['runs']}
+    print('Compared with', old_results.get('revision'), 'from', old_results.get('timestamp'), '(new/old time)')
+    for new_run in new_results['runs']:
+        old_run = old_runs.get(new_run['objects'])
+        if old_run is None:
+            continue
+        ratios = [stage + ' ' + _get_ratio(old_run['stage_seconds'][stage], new_run['stage_seconds'][stage])
+                  for stage in STAGES]
+        ratios.append('total ' + _get_ratio(old_run['total_seconds'], new_run['total_seconds']))
+        ratios.append('peak rss ' + _get_ratio(old_run['peak_rss_mb'], new_run['peak_rss_mb']))
+        print(new_run['objects'], 'objects:', ', '.join(ratios))
+
+
+def _get_ratio(old_value, new_value):
+    return str(round(new_value / old_value, 2)) + 'x' if old_value else 'n/a'
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Time each stage of processing synthetic composite METS files.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='object counts to run')
+    parser.add_argument('--description-size', type=int, default=200)
+    parser.add_argument('--missing-field-rate', type=float, default=0.01)
+    parser.add_argument('--upload-workers', type=int, default=10)
+    parser.add_argument('--upload-latency-ms', type=float, default=0.0,
+                        help='simulated round trip for each upload')
+    parser.add_argument('--xml-backend', choices=['auto', 'stdlib', 'lxml'], default='auto')
+    parser.add_argument('--split-workers', type=int, default=0,
+                        help='processes to split, validate and serialize with (0 does it in this one)')
+    parser.add_argument('--data-folder', default=os.path.join(tempfile.gettempdir(), 'marble-benchmark'),
+                        help='where generated composite files are kept between runs')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='an earlier JSON results file to compare against')
+    parser.add_argument('--single', help=argparse.SUPPRESS)  # used by _run_in_fresh_interpreter
+    options = parser.parse_args(arguments)
+    if options.single:
+        result = run_once(options.single, options.upload_workers, options.upload_latency_ms / 1000,
+                          options.xml_backend, options.split_workers)
+        print(json.dumps(result))
+        return
+    results = run(options)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    if options.compare:
+        with open(options.compare) as compare_file:
+            compare(json.load(compare_file), results)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -42,7 +42,8 @@ export class MarbleWebKioskExportStack extends cdk.Stack {
             "ssm:GetParametersByPath",
             "ssm:GetParameters",
             "ssm:GetParameter",
-            "ssm:DescribeParameters"
+            "ssm:DescribeParameters",
+            "ssm:PutParameter"
         ],
     }));
 
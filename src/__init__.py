@@ -0,0 +1,9 @@
+# __init__.py
+""" The modules here import each other by name, as they do when this folder is deployed as the Lambda's root.
+    When src is used as a package (e.g. from the tests), make this folder and its dependencies importable. """
+
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
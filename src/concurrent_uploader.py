@@ -0,0 +1,80 @@
+# concurrent_uploader.py
+""" Runs uploads on a bounded pool of worker threads.
+    A failed upload is captured and counted rather than stopping the run. """
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from sentry_sdk import capture_exception
+from run_metrics import get_run_metrics
+
+
+class ConcurrentUploader():
+    """ Keep up to max_workers uploads in flight.
+        submit blocks once max_workers more tasks are queued behind them, so the caller
+        can never get far ahead of the uploads.
+        on_success, if given, is called with the name of each task that completes without error. """
+    def __init__(self, max_workers, on_success=None):
+        self.max_workers = max_workers
+        self.on_success = on_success
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_workers * 2)
+        self._lock = threading.Lock()
+        self._queued = 0  # submitted but not yet finished
+        self.succeeded = []
+        self.skipped = []
+        self.failed = []
+
+    def submit(self, name, function, *args, **kwargs):
+        """ Run function(*args, **kwargs) on a worker thread, recording the result under name """
+        self._slots.acquire()
+        with self._lock:
+            self._queued += 1
+            queued = self._queued
+        get_run_metrics().add_queue_depth('upload', queued)
+        try:
+            self._executor.submit(self._run_task, name, function, args, kwargs)
+        except:  # noqa E722 - make sure we give the slot back no matter what
+            self._finish_task()
+            raise
+
+    def skip(self, name):
+        """ Record that name did not need to be uploaded """
+        with self._lock:
+            self.skipped.append(name)
+
+    def wait(self):
+        """ Wait for all submitted uploads to finish, then return a summary of the results """
+        self._executor.shutdown(wait=True)
+        summary = self.get_summary()
+        print(summary)
+        return summary
+
+    def get_summary(self):
+        """ Describe how many uploads succeeded or were skipped, and which failed """
+        with self._lock:
+            summary = 'Uploads completed: ' + str(len(self.succeeded)) \
+                + ', skipped as unchanged: ' + str(len(self.skipped)) \
+                + ', failed: ' + str(len(self.failed))
+            if self.failed:
+                summary += '\n' + '\n'.join(name + ' - ' + error for name, error in self.failed)
+        return summary
+
+    def _run_task(self, name, function, args, kwargs):
+        """ Run one upload, capturing any error so the remaining uploads carry on """
+        try:
+            function(*args, **kwargs)
+            with self._lock:
+                self.succeeded.append(name)
+            if self.on_success is not None:
+                self.on_success(name)
+        except Exception as e:
+            capture_exception(e)
+            with self._lock:
+                self.failed.append((name, repr(e)))
+        finally:
+            self._finish_task()
+
+    def _finish_task(self):
+        with self._lock:
+            self._queued -= 1
+        self._slots.release()
@@ -0,0 +1,121 @@
+# drive_rate_controller.py
+""" Keeps every Drive call of a run within our quota, from however many threads they are made.
+    Each call takes a token from a bucket refilled at requests_per_second (holding up to burst tokens),
+    and one of a limited number of concurrency slots.  A batch takes a token for each request in it; one costing
+    more than burst waits for a full bucket and leaves it in debt, which the calls after it wait to be repaid.
+    The number of slots grows by one after each run of successful calls, and is halved when Drive says
+    we are going too fast (403 rateLimitExceeded or userRateLimitExceeded, or 429).
+    The throttled call is then retried after an exponential backoff with jitter, which every other call waits out
+    too, so one throttled call slows them all down rather than each finding out for itself. """
+
+import json
+import random
+import threading
+import time
+from googleapiclient.errors import HttpError
+from run_metrics import get_run_metrics
+
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+def is_rate_limit_error(http_error):
+    """ True if Drive refused a request because we are making too many """
+    if http_error.resp.status == 429:
+        return True
+    if http_error.resp.status != 403:
+        return False
+    try:
+        errors = json.loads(http_error.content.decode('utf-8'))['error']['errors']
+        return any(error.get('reason') in RATE_LIMIT_REASONS for error in errors)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return False
+
+
+class DriveRateController():
+    """ Runs Drive requests within a token bucket and an adaptive concurrency limit, shared by every thread """
+    def __init__(self, requests_per_second=200, burst=50, initial_concurrency=4, max_concurrency=16, max_retries=6,
+                 initial_backoff_seconds=1.0, max_backoff_seconds=32.0):
+        self.requests_per_second = float(requests_per_second)
+        self.burst = float(burst)
+        self.concurrency_limit = int(initial_concurrency)
+        self.max_concurrency = int(max_concurrency)
+        self.max_retries = int(max_retries)
+        self.initial_backoff_seconds = float(initial_backoff_seconds)
+        self.max_backoff_seconds = float(max_backoff_seconds)
+        self.metrics = get_run_metrics()
+        self._condition = threading.Condition()
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._successes = 0  # since the concurrency limit last changed
+        self._paused_until = 0.0
+        self._cut_at = 0.0  # when the concurrency limit was last cut
+
+    def execute(self, request, call, cost=1):
+        """ Return request.execute(), recording its latency as call and counting any error by status.
+            cost is how many requests it counts as against the quota, e.g. the number of requests in a batch.
+            A call Drive throttles is retried up to max_retries times; any other error is raised at once. """
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.metrics.count('drive_retries')
+            started = self._acquire(cost)
+            outcome = 'failed'
+            try:
+                with self.metrics.time_call(call):
+                    response = request.execute()
+                outcome = 'succeeded'
+                return response
+            except HttpError as e:
+                self.metrics.count('drive_errors_' + str(e.resp.status))
+                if is_rate_limit_error(e):
+                    outcome = 'throttled'
+                    if attempt < self.max_retries:
+                        continue
+                raise
+            finally:
+                self._release(outcome, started, attempt)
+
+    def _acquire(self, cost):
+        """ Wait for a token and a concurrency slot, and for any backoff to pass, then take them.
+            Returns when the call started, to tell whether it started before the concurrency limit was last cut. """
+        started_waiting = time.perf_counter()
+        tokens_needed = min(cost, self.burst)  # as the bucket never holds more, though the whole cost is taken
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.requests_per_second)
+                self._refilled_at = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._in_flight >= self.concurrency_limit:
+                    wait = None  # until a call finishes
+                elif self._tokens < tokens_needed:
+                    wait = (tokens_needed - self._tokens) / self.requests_per_second
+                else:
+                    break
+                self._condition.wait(wait)
+            self._tokens -= cost
+            self._in_flight += 1
+        self.metrics.add_stage_time('drive_rate_wait', time.perf_counter() - started_waiting)
+        return now
+
+    def _release(self, outcome, started, attempt):
+        """ Give back a concurrency slot, adjusting the limit (and pausing every call, if throttled) """
+        with self._condition:
+            self._in_flight -= 1
+            if outcome == 'throttled':
+                self.metrics.count('drive_throttled')
+                backoff = min(self.max_backoff_seconds, self.initial_backoff_seconds * 2 ** attempt)
+                self._paused_until = max(self._paused_until, time.monotonic() + random.uniform(backoff / 2, backoff))
+                self._tokens = min(self._tokens, 0.0)  # keeping any debt
+                if started >= self._cut_at:  # calls already in flight were throttled by the same burst
+                    self.concurrency_limit = max(1, self.concurrency_limit // 2)
+                    self._cut_at = time.monotonic()
+                    self._successes = 0
+                    self.metrics.count('drive_concurrency_cuts')
+            elif outcome == 'succeeded':
+                self._successes += 1
+                if self._successes >= self.concurrency_limit and self.concurrency_limit < self.max_concurrency:
+                    self.concurrency_limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
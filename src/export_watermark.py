@@ -0,0 +1,37 @@
+# export_watermark.py
+""" Read and save the time of the last successful export (the "watermark").
+    It lives in Parameter Store beside the rest of our configuration,
+    so get_config reads it into config['embark']['last-successful-export']. """
+
+from datetime import datetime
+import os
+from get_config import forget_cached_parameters
+
+WATERMARK_KEY = 'embark/last-successful-export'
+WATERMARK_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def get_last_successful_export(config):
+    """ Return the watermark as a UTC datetime, or None if we have never recorded one """
+    value = config['embark'].get('last-successful-export', '')
+    try:
+        return datetime.strptime(value, WATERMARK_FORMAT)
+    except ValueError:
+        return None
+
+
+def save_last_successful_export(config, export_time):
+    """ Save export_time (a UTC datetime) as the new watermark """
+    value = export_time.strftime(WATERMARK_FORMAT)
+    if 'SSM_KEY_BASE' not in os.environ:  # configuration came from CONFIG_FILE or CONFIG_JSON
+        print('No Parameter Store root defined, so the last successful export time was not saved')
+        return
+    import boto3
+    client = boto3.client('ssm')
+    client.put_parameter(Name=os.environ['SSM_KEY_BASE'] + '/' + WATERMARK_KEY,
+                         Value=value,
+                         Type='String',
+                         Overwrite=True)
+    config['embark']['last-successful-export'] = value
+    forget_cached_parameters()  # so the next run reads the new watermark
+    print('Saved last successful export time of', value)
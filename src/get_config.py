@@ -2,97 +2,267 @@
 """ Get configuration for this project
     Requires environment variable called SSM_KEY_BASE,
     which will hold the path to parameter store to retrieve additional config values.
-    Also requires environment variable called WEB_KIOSK_EXPORT_MODE as "full" or "incremental" """
+    Also requires environment variable called WEB_KIOSK_EXPORT_MODE as "full" or "incremental"
 
-import boto3
+    Parameter Store values are read one section at a time, the first time that section is used,
+    and are cached for CONFIG_CACHE_SECONDS (default 300) so warm invocations don't read them again.
+    Set CONFIG_CACHE_FILE to also keep that cache in a file (readable only by its owner), such as one in /tmp.
+    Set CONFIG_FILE to a json file, or CONFIG_JSON to a json string, of Parameter Store keys (without SSM_KEY_BASE)
+    and values, e.g. {"sentry/dsn": "..."}, to read configuration from there instead of Parameter Store. """
+
+from copy import deepcopy
+import json
 import os
-import sys
-sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+import time
+
+# Parameter Store sections, each read the first time it is used.  Any other key is looked for at the root.
+PARAMETER_STORE_SECTIONS = {
+    "google": {
+        "credentials": {},
+        "museum": {
+            "metadata": {},
+            "image": {}
+        }
+    },
+    "sentry": {},
+    "embark": {},
+    "museum": {}
+}
+DEFAULT_CACHE_SECONDS = 300
+_cached_parameters = {}  # Parameter Store path -> (time it expires, {key: value})
+
+# Preferred name -> xpath (within each object) of the fields every object must have
+REQUIRED_FIELDS = {
+    "Title": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:title",
+    "Creator": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:creator",
+    "Date created": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:created",
+    "Work Type": "mets:dmdSec/mets:mdWrap/mets:xmlData/vracore:work/vracore:worktypeSet/vracore:worktype",
+    "Medium": "mets:dmdSec/mets:mdWrap/mets:xmlData/vracore:work/vracore:materialSet/vracore:display",
+    "Unique identifier": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:identifier",
+    "Repository": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:publisher",
+    "Subject": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:subject",
+    "Usage": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:rights",
+    "Access": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:accessRights",
+    "Dimensions": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:extent",
+    "Dedication": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:provenance",
+    "Thumbnail": "mets:structMap/mets:div/mets:div/mets:fptr[@FILEID]"
+}
 
 
 def get_config():
     config = {}
-    if 'SSM_KEY_BASE' not in os.environ:
+    if 'SSM_KEY_BASE' not in os.environ and _get_local_parameters() is None:
         print('You must define an environment variable called SSM_KEY_BASE to point to the Parameter Store root.')
     elif 'WEB_KIOSK_EXPORT_MODE' not in os.environ:
         print('You must define an environment variable called WEB_KIOSK_EXPORT_MODE as "full" or "incremental".')
     else:
-        config = {
+        config = LazyConfig({
             "file_name": "web_kiosk_mets_composite.xml",
             "folder_name": "/tmp",
             "mode": os.environ['WEB_KIOSK_EXPORT_MODE'],
             # "mode": "full",
             "running_unit_tests": False,
-            "required_fields": {
-                "Title": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:title",
-                "Creator": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:creator",
-                "Date created": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:created",
-                "Work Type": "mets:dmdSec/mets:mdWrap/mets:xmlData/vracore:work/vracore:worktypeSet/vracore:worktype",
-                "Medium": "mets:dmdSec/mets:mdWrap/mets:xmlData/vracore:work/vracore:materialSet/vracore:display",
-                "Unique identifier": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:identifier",
-                "Repository": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:publisher",
-                "Subject": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:subject",
-                "Usage": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:rights",
-                "Access": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:accessRights",
-                "Dimensions": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:extent",
-                "Dedication": "mets:dmdSec/mets:mdWrap/mets:xmlData/dcterms:provenance",
-                "Thumbnail": "mets:structMap/mets:div/mets:div/mets:fptr[@FILEID]"
+            "upload_workers": 8,  # number of uploads to Google Team Drive to keep in flight at once
+            "skip_unchanged": True,  # don't re-upload objects whose content matches what is already on the drive
+            "write_local_copies": False,  # True saves each object's xml in folder_name and uploads it from there
+            # "single" fetches everything in one request and saves it; "paged" fetches page_size at a time;
+            # "streamed" fetches everything in one request, processing it as it arrives without saving it
+            "fetch_mode": "single",
+            "page_size": 500,
+            "page_start_parameter": "startrecord",  # Web Kiosk results parameter giving the first record (from 1)
+            "fetch_workers": 4,  # number of pages to fetch at once
+            "page_retries": 2,
+            "fetch_timeout_seconds": 60,  # a Web Kiosk connection this long without sending anything is resumed
+            "pipeline_queue_size": 64,  # chunks or objects each "streamed" stage may get ahead of the next
+            "keep_composite_compressed": False,  # save the export gzipped, as Web Kiosk sent it, and parse that
+            "resume": True,  # pick up an unfinished run over the same composite file where it left off
+            "deadline_buffer_seconds": 60,  # stop taking on new objects this long before the Lambda times out
+            # incremental runs look back this far before the last successful export; as Web Kiosk is queried by day,
+            # this only reaches back a further day when it crosses midnight
+            "watermark_overlap_hours": 6,
+            "max_missing_field_events": 20,  # most Sentry events to send about missing required fields in one run
+            "drive_api_root_url": os.environ.get('DRIVE_API_ROOT_URL', ''),  # blank for Google; set for a fake Drive
+            "run_bundle": {  # also save every object of a run in one tar.gz, with a JSON manifest, and upload that
+                "enabled": False,
+                "parent_folder_id": "",  # blank for the folder the objects themselves are saved to
+                "keep": 10  # older bundles in that folder are moved to the trash; 0 keeps every one
             },
-            "google": {
-                "credentials": {},
-                "museum": {
-                    "metadata": {},
-                    "image": {}
-                }
+            "orphan_cleanup": {  # after a complete full export, for files of objects Web Kiosk no longer exports
+                # "none"; "report" to only say which files would go; "trash" (from which Drive can restore them
+                # for 30 days) or "delete"
+                "action": "none",
+                "max_fraction": 0.1  # remove nothing if more of the folder than this would go: the export may be short
             },
-            "sentry": {},
-            "embark": {},
-            "museum": {}
-        }
-        _get_parameter_store_config(config)
+            "drive_rate_limit": {  # shared by every Drive call of a run
+                "requests_per_second": 200,  # Drive's default quota is 12,000 queries a minute
+                "burst": 50,
+                "initial_concurrency": 4,  # calls at once, growing while they succeed, halved when throttled
+                "max_concurrency": 16,
+                "max_retries": 6,  # of a throttled call, backing off exponentially (with jitter) between tries
+                "initial_backoff_seconds": 1,
+                "max_backoff_seconds": 32
+            },
+            "write_object_index": False,  # True saves an index of where each object is in the composite file
+            "split_workers": 0,  # processes to split, validate and serialize with, off Lambda; 0 does it in this one
+            "xml_backend": "auto",  # "lxml", "stdlib", or "auto" for lxml if installed; both write the same bytes
+            "run_manifest": {
+                "backend": "local",  # "local" or "s3"
+                "folder_name": "/tmp",
+                "file_name": "web_kiosk_run_manifest.json",
+                "s3-bucket": "",
+                "s3-key": "marble-web-kiosk-export/run_manifest.json",
+                "checkpoint_interval": 100
+            },
+            "metrics": {
+                "embedded_metric_format": False,  # True writes the run summary so CloudWatch records it as metrics
+                "namespace": "MarbleWebKioskExport",
+                "trace_objects": False  # True prints each step of each object as a line of JSON
+            },
+            "required_fields": dict(REQUIRED_FIELDS)
+        })
     return config
 
 
-def _get_parameter_store_config(config):
-    """ Retrieve remaining configuration from parameter store """
+class LazyConfig(dict):
+    """ Configuration dictionary which reads each Parameter Store section ("google", "sentry", "embark", "museum")
+        the first time it is used.  Any other missing key is looked for among the root Parameter Store keys. """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loaded_sections = set()
+
+    def __missing__(self, key):
+        if key in PARAMETER_STORE_SECTIONS:
+            self._load_section(key)
+        elif '' not in self.loaded_sections:
+            self._load_section('')
+        if not dict.__contains__(self, key):
+            raise KeyError(key)
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def _load_section(self, section):
+        """ Add the Parameter Store keys for section ('' for the root keys) """
+        self.loaded_sections.add(section)
+        if section:
+            self[section] = deepcopy(PARAMETER_STORE_SECTIONS[section])
+        for key, value in _get_parameters(section).items():
+            _add_parameter_to_config(self, key, value)
+
+
+def forget_cached_parameters():
+    """ Drop cached Parameter Store values, e.g. after we have changed one """
+    _cached_parameters.clear()
+    cache_file_name = os.environ.get('CONFIG_CACHE_FILE', '')
+    if cache_file_name and os.path.exists(cache_file_name):
+        os.remove(cache_file_name)
+
+
+def _get_parameters(section):
+    """ Return {key: value} for one section ('' for the root keys), with keys relative to SSM_KEY_BASE """
+    local_parameters = _get_local_parameters()
+    if local_parameters is not None:
+        if section:
+            return {key: value for key, value in local_parameters.items() if key.startswith(section + '/')}
+        return {key: value for key, value in local_parameters.items() if '/' not in key}
+    path = os.environ['SSM_KEY_BASE'] + '/'
+    parameters = _get_cached_parameters(path + section)
+    if parameters is None:
+        if section:
+            parameters = _get_parameter_store_parameters(path, path + section + '/', recursive=True)
+        else:
+            parameters = _get_parameter_store_parameters(path, path, recursive=False)
+        _cache_parameters(path + section, parameters)
+    return parameters
+
+
+def _get_local_parameters():
+    """ Return parameters from CONFIG_JSON or CONFIG_FILE, or None if neither is defined """
+    if os.environ.get('CONFIG_JSON', ''):
+        return json.loads(os.environ['CONFIG_JSON'])
+    if os.environ.get('CONFIG_FILE', ''):
+        with open(os.environ['CONFIG_FILE'], 'r') as input_source:
+            return json.load(input_source)
+    return None
+
+
+def _get_cached_parameters(path):
+    """ Return cached parameters for path, from memory or else from CONFIG_CACHE_FILE, or None if not cached """
+    if path not in _cached_parameters:
+        _cached_parameters.update(_read_cache_file())
+    expires, parameters = _cached_parameters.get(path, (0, None))
+    if expires < time.time():
+        return None
+    return parameters
+
+
+def _cache_parameters(path, parameters):
+    cache_seconds = float(os.environ.get('CONFIG_CACHE_SECONDS', DEFAULT_CACHE_SECONDS))
+    _cached_parameters[path] = (time.time() + cache_seconds, parameters)
+    cache_file_name = os.environ.get('CONFIG_CACHE_FILE', '')
+    if cache_file_name:
+        # these are decrypted secrets, so only we may read the file
+        file_descriptor = os.open(cache_file_name + '.part', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, 'w') as output_file:
+            json.dump(_cached_parameters, output_file)
+        os.replace(cache_file_name + '.part', cache_file_name)
+
+
+def _read_cache_file():
+    cache_file_name = os.environ.get('CONFIG_CACHE_FILE', '')
+    if not cache_file_name:
+        return {}
+    try:
+        with open(cache_file_name, 'r') as input_source:
+            return {path: tuple(cached) for path, cached in json.load(input_source).items()}
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _get_parameter_store_parameters(base_path, path, recursive):
+    """ Retrieve {key relative to base_path: value} for everything under path from parameter store """
+    import boto3  # slow to import, and not needed at all when configuration comes from CONFIG_FILE or CONFIG_JSON
     client = boto3.client('ssm')
     paginator = client.get_paginator('get_parameters_by_path')
-    path = os.environ['SSM_KEY_BASE'] + '/'
     page_iterator = paginator.paginate(
         Path=path,
-        Recursive=True,
+        Recursive=recursive,
         WithDecryption=True,)
 
-    response = []
+    parameters = {}
     for page in page_iterator:
-        response.extend(page['Parameters'])
-
-    for ps in response:
-        value = ps['Value']
-        # value = value.replace('\n', os.linesep)
-        # change /all/marble-data-processing/<key> to <key>
-        key = ps['Name'].replace(path, '')
-        # add the key/value pair to appropriate hierarchy level
-        if 'google/credentials/' in key:
-            key = key.replace('google/credentials/', '')
-            if key == 'private_key':
-                value = value + "\n"  # this is to correct Parameter Store's stripping trailing \n for certificate
-            config['google']['credentials'][key] = value
-        elif 'google/museum/metadata/' in key:
-            key = key.replace('google/museum/metadata/', '')
-            config['google']['museum']['metadata'][key] = value
-        elif 'google/museum/image/' in key:
-            key = key.replace('google/museum/image/', '')
-            config['google']['museum']['image'][key] = value
-        elif 'sentry/' in key:
-            key = key.replace('sentry/', '')
-            config['sentry'][key] = value
-        elif 'embark/' in key:
-            key = key.replace('embark/', '')
-            config['embark'][key] = value
-        elif 'museum/' in key:
-            key = key.replace('museum/', '')
-            config['museum'][key] = value
-        else:
-            config[key] = value
-    return config
+        for ps in page['Parameters']:
+            # change /all/marble-data-processing/<key> to <key>
+            parameters[ps['Name'].replace(base_path, '')] = ps['Value']
+    return parameters
+
+
+def _add_parameter_to_config(config, key, value):
+    """ Add one parameter store key/value pair to the appropriate hierarchy level of config """
+    # value = value.replace('\n', os.linesep)
+    if 'google/credentials/' in key:
+        key = key.replace('google/credentials/', '')
+        if key == 'private_key':
+            value = value + "\n"  # this is to correct Parameter Store's stripping trailing \n for certificate
+        config['google']['credentials'][key] = value
+    elif 'google/museum/metadata/' in key:
+        key = key.replace('google/museum/metadata/', '')
+        config['google']['museum']['metadata'][key] = value
+    elif 'google/museum/image/' in key:
+        key = key.replace('google/museum/image/', '')
+        config['google']['museum']['image'][key] = value
+    elif 'sentry/' in key:
+        key = key.replace('sentry/', '')
+        config['sentry'][key] = value
+    elif 'embark/' in key:
+        key = key.replace('embark/', '')
+        config['embark'][key] = value
+    elif 'museum/' in key:
+        key = key.replace('museum/', '')
+        config['museum'][key] = value
+    else:
+        config[key] = value
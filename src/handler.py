@@ -10,23 +10,30 @@ from sentry_sdk import init  # noqa: E402
 from sentry_sdk.integrations.aws_lambda import AwsLambdaIntegration  # noqa: E402
 from process_web_kiosk_metadata import process_web_kiosk_metadata  # noqa: E402
 from get_config import get_config  # noqa: E402
-
-config = get_config()
+from run_metrics import start_run_metrics, print_trace  # noqa: E402
 
 
 def run(event, context):
     """ run the process to retrieve and process web kiosk metadata """
+    config = get_config()  # cheap: Parameter Store sections are read when first used, and cached between runs
     if config != {}:
         sentry_error_dsn = config['sentry']['dsn']
         sentry_environment = config['sentry']['environment']
         init(sentry_error_dsn, environment=sentry_environment, integrations=[AwsLambdaIntegration()])
+        metrics_config = config['metrics']
+        run_metrics = start_run_metrics()
+        if metrics_config['trace_objects']:
+            run_metrics.add_trace_hook(print_trace)
         web_kiosk_class = process_web_kiosk_metadata(config)
-        xml_as_string = web_kiosk_class.get_snite_composite_mets_metadata()
-        if xml_as_string > '':
+        fetch_result = web_kiosk_class.get_snite_composite_mets_metadata()
+        if fetch_result.size > 0:
             clean_up_as_we_go = True
-            web_kiosk_class.process_snite_composite_mets_metadata(clean_up_as_we_go)
+            web_kiosk_class.process_snite_composite_mets_metadata(clean_up_as_we_go, context)
         else:
             print('Nothing to process')
+        web_kiosk_class.record_successful_export()
+        run_metrics.emit(metrics_config['embedded_metric_format'], metrics_config['namespace'],
+                         {'Mode': config['mode']})
     else:
         print('No configuration defined.  Unable to continue.')
     return event
@@ -0,0 +1,79 @@
+# missing_field_report.py
+""" Collects the required fields missing from each object during a run,
+    and summarizes them once at the end for Sentry and the notification email. """
+
+from collections import OrderedDict
+from sentry_sdk import capture_message, push_scope
+
+DEFAULT_SAMPLE_SIZE = 10
+
+
+class MissingFieldReport():
+    """ Missing required fields for every object in a run.
+        Each object is stored once, as its id and a tuple of the field names it is missing. """
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.records = []  # (object_id, (field, field, ...))
+        self.xpaths = OrderedDict()  # field -> xpath, in the order first seen
+
+    def add(self, object_id, missing_fields):
+        """ Record the missing_field list returned by RequiredFieldValidator.validate for object_id """
+        if not missing_fields:
+            return
+        for field, xpath in missing_fields:
+            self.xpaths.setdefault(field, xpath)
+        self.records.append((object_id, tuple(field for field, xpath in missing_fields)))
+
+    def __len__(self):
+        """ Number of objects missing at least one required field """
+        return len(self.records)
+
+    def get_summary(self):
+        """ Return field -> {'xpath', 'count', 'sample_object_ids'} for each field missing from any object """
+        summary = OrderedDict((field, {'xpath': xpath, 'count': 0, 'sample_object_ids': []})
+                              for field, xpath in self.xpaths.items())
+        for object_id, fields in self.records:
+            for field in fields:
+                summary[field]['count'] += 1
+                if len(summary[field]['sample_object_ids']) < self.sample_size:
+                    summary[field]['sample_object_ids'].append(object_id)
+        return summary
+
+    def send_to_sentry(self, max_events):
+        """ Send one warning per missing field, rather than one per object.
+            If there are more fields than max_events, the last event covers all the remaining fields. """
+        summary = list(self.get_summary().items())
+        if len(summary) > max_events:
+            remaining = summary[max_events - 1:]
+            summary = summary[:max_events - 1] + [(', '.join(field for field, details in remaining),
+                                                   self._combine(details for field, details in remaining))]
+        for field, details in summary:
+            with push_scope() as scope:
+                scope.set_tag('repository', 'snite')
+                scope.set_tag('problem', 'missing_field')
+                scope.set_tag('field', field)
+                scope.set_extra('xpath', details['xpath'])
+                scope.set_extra('sample_object_ids', details['sample_object_ids'])
+                scope.level = 'warning'
+                capture_message(str(details['count']) + ' missing value(s) for required field(s) ' + field
+                                + ', for example in: ' + ', '.join(details['sample_object_ids']))
+        return len(summary)
+
+    def get_object_lines(self):
+        """ Yield (object_id, [(field, xpath), ...]) for each object missing fields, in the order processed """
+        for object_id, fields in self.records:
+            yield object_id, [(field, self.xpaths[field]) for field in fields]
+
+    def _combine(self, details_list):
+        """ Merge several per-field summaries into one """
+        combined = {'xpath': '', 'count': 0, 'sample_object_ids': []}
+        xpaths = []
+        for details in details_list:
+            xpaths.append(details['xpath'])
+            combined['count'] += details['count']
+            for object_id in details['sample_object_ids']:
+                if object_id not in combined['sample_object_ids'] \
+                        and len(combined['sample_object_ids']) < self.sample_size:
+                    combined['sample_object_ids'].append(object_id)
+        combined['xpath'] = ', '.join(xpaths)
+        return combined
@@ -0,0 +1,118 @@
+# object_index.py
+""" A sidecar index of a composite export, saved next to it as <composite file>.index.json.
+    For each object id it holds the byte offset and length of the object's record and the md5 of those bytes,
+    so chosen objects can be read straight from the composite file without parsing the rest of it.
+    Each record read back is checked against its md5, so an index that no longer matches its file is noticed. """
+
+from collections import OrderedDict, namedtuple
+from hashlib import md5
+from io import BytesIO
+import json
+import mmap
+import os
+from parallel_split import find_record_offsets, read_root_namespaces, ROOT_NAME_PATTERN
+
+object_index_entry = namedtuple('object_index_entry', ['offset', 'length', 'md5_checksum'])
+
+INDEX_SUFFIX = '.index.json'
+
+
+class ObjectIndexError(Exception):
+    """ The index is missing, doesn't match its composite file, or doesn't have an object asked for """
+
+
+def get_index_file_name(full_path_file_name):
+    return full_path_file_name + INDEX_SUFFIX
+
+
+def write_object_index(full_path_file_name, xml_backend, record_name, object_id_xpath):
+    """ Parse the composite file to index it, then save and return its index.
+        A run that splits the file anyway indexes it with an ObjectIndexWriter instead, so it isn't parsed twice. """
+    index_writer = ObjectIndexWriter(full_path_file_name, record_name)
+    for item in xml_backend.iterate_records(full_path_file_name, record_name, {}):
+        index_writer.add(item.find(object_id_xpath, index_writer.namespace_dictionary).text)
+    return index_writer.save()
+
+
+class ObjectIndexWriter():
+    """ Builds the index of a composite file from the object id of each of its records, added in file order.
+        Only the start tags are scanned for here, so the ids can come from the parse that splits the file.
+        Each record runs from its start tag to the next record's (or the root's end tag), so includes its tail. """
+    def __init__(self, full_path_file_name, record_name):
+        self.full_path_file_name = full_path_file_name
+        self.record_name = record_name
+        self.namespace_dictionary = {}
+        self.object_ids = []
+        with open(full_path_file_name, 'rb') as composite_file, \
+                mmap.mmap(composite_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            read_root_namespaces(mapped_file, self.namespace_dictionary)
+            self.offsets = find_record_offsets(mapped_file, record_name, self.namespace_dictionary)
+            self.header_length = self.offsets[0] if self.offsets else 0
+            header = mapped_file[:self.header_length]
+            self.closing_tag = b'</' + ROOT_NAME_PATTERN.search(header).group(1) + b'>' if self.offsets else b''
+            self.end_offset = mapped_file.rfind(self.closing_tag)
+            self.composite_size = len(mapped_file)
+
+    def add(self, object_id):
+        self.object_ids.append(object_id)
+
+    def save(self):
+        """ Checksum each record, then save and return the index.
+            Raises ObjectIndexError unless an object id was added for every record start tag found. """
+        if len(self.object_ids) != len(self.offsets):  # e.g. a start tag in a comment
+            raise ObjectIndexError('Records and their start tags in ' + self.full_path_file_name + ' do not match up')
+        objects = OrderedDict()
+        with open(self.full_path_file_name, 'rb') as composite_file, \
+                mmap.mmap(composite_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            if len(mapped_file) != self.composite_size:
+                raise ObjectIndexError(self.full_path_file_name + ' has changed while it was being indexed')
+            for object_id, offset, next_offset in zip(self.object_ids, self.offsets,
+                                                      self.offsets[1:] + [self.end_offset]):
+                checksum = md5(mapped_file[offset:next_offset]).hexdigest()
+                objects[object_id] = object_index_entry(offset, next_offset - offset, checksum)
+        index = {
+            'composite_size': self.composite_size,
+            'header_length': self.header_length,
+            'closing_tag': self.closing_tag.decode('utf-8'),
+            'record_name': self.record_name,
+            'objects': objects
+        }
+        index_file_name = get_index_file_name(self.full_path_file_name)
+        with open(index_file_name + '.part', 'w') as index_file:
+            json.dump(index, index_file, separators=(',', ':'))
+        os.replace(index_file_name + '.part', index_file_name)
+        return index
+
+
+def load_object_index(full_path_file_name):
+    """ Return the saved index of the composite file, or raise ObjectIndexError if there isn't a current one """
+    try:
+        with open(get_index_file_name(full_path_file_name), 'r') as index_file:
+            index = json.load(index_file)
+    except (FileNotFoundError, ValueError):
+        raise ObjectIndexError('No object index saved for ' + full_path_file_name)
+    if index['composite_size'] != os.path.getsize(full_path_file_name):
+        raise ObjectIndexError('The object index for ' + full_path_file_name + ' is for a different file')
+    index['objects'] = {object_id: object_index_entry(*entry) for object_id, entry in index['objects'].items()}
+    return index
+
+
+def iterate_indexed_records(full_path_file_name, object_ids, xml_backend, namespace_dictionary, index=None):
+    """ Yield the record of each of object_ids, in the order given, reading only its bytes (and the root's).
+        Each is parsed with the composite file's root around it, so it is just as a full parse would give it.
+        namespace_dictionary is filled in from the root, as iterating the whole file would. """
+    index = index or load_object_index(full_path_file_name)
+    unknown_object_ids = [object_id for object_id in object_ids if object_id not in index['objects']]
+    if unknown_object_ids:
+        raise ObjectIndexError('Not in the composite file: ' + ', '.join(unknown_object_ids))
+    closing_tag = index['closing_tag'].encode('utf-8')
+    with open(full_path_file_name, 'rb') as composite_file:
+        header = composite_file.read(index['header_length'])
+        for object_id in object_ids:
+            entry = index['objects'][object_id]
+            composite_file.seek(entry.offset)
+            record = composite_file.read(entry.length)
+            if md5(record).hexdigest() != entry.md5_checksum:
+                raise ObjectIndexError('The composite file has changed since it was indexed, at ' + object_id)
+            yield from xml_backend.iterate_records(BytesIO(header + record + closing_tag), index['record_name'],
+                                                   namespace_dictionary)
@@ -0,0 +1,141 @@
+# parallel_split.py
+""" Split, validate and serialize a composite file on several cores, for large full exports run off Lambda
+    (Lambda has no /dev/shm, so it can't run a process pool).
+    The file is memory mapped and scanned once for the byte offset at which each record starts.
+    Ranges of records are then parsed by a pool of processes, each reading its range from its own map of the file,
+    and only the compact results (object id, serialized bytes, missing fields) come back to this process to upload.
+    Records are found by their start tags, so these must not appear in comments or CDATA. """
+
+from collections import deque, namedtuple
+from io import BytesIO
+import mmap
+import os
+import re
+import time
+from xml.etree.ElementTree import XMLPullParser
+from required_field_validator import RequiredFieldValidator
+from run_metrics import get_run_metrics
+from xml_backend import get_xml_backend
+from xml_manipulation import get_qualified_name
+
+split_object = namedtuple('split_object', ['object_id', 'xml_as_bytes', 'missing_fields'])
+
+RECORDS_PER_TASK = 100
+READ_SIZE = 64 * 1024
+ROOT_NAME_PATTERN = re.compile(rb'<([A-Za-z_][^\s/>]*)')
+
+_worker = None  # the _SplitWorker of a pool process
+
+
+def find_record_offsets(mapped_file, record_name, namespace_dictionary):
+    """ Return the byte offset of each record_name start tag in mapped_file, in order.
+        Records are found under every prefix the root declares for their namespace (e.g. "<mets:mets" and "<mets"). """
+    if ':' in record_name:
+        namespace, local_name = get_qualified_name(record_name, namespace_dictionary)[1:].split('}')
+        names = [prefix + ':' + local_name if prefix else local_name
+                 for prefix, uri in namespace_dictionary.items() if uri == namespace]
+    else:
+        names = [record_name]
+    pattern = re.compile(b'<(?:' + b'|'.join(re.escape(name.encode('utf-8')) for name in names) + rb')(?=[\s/>])')
+    return [match.start() for match in pattern.finditer(mapped_file)]
+
+
+def read_root_namespaces(mapped_file, namespace_dictionary):
+    """ Fill in namespace_dictionary from the namespaces declared on the root, reading only as far as its start tag """
+    parser = XMLPullParser(events=('start-ns', 'start'))
+    for position in range(0, len(mapped_file), READ_SIZE):
+        parser.feed(mapped_file[position:position + READ_SIZE])
+        for event, elem in parser.read_events():
+            if event == 'start':
+                return
+            namespace_dictionary[elem[0]] = elem[1]
+
+
+def iterate_split_objects(full_path_file_name, record_name, namespace_dictionary, object_id_xpath, required_fields,
+                          xml_backend_name='auto', workers=None, records_per_task=RECORDS_PER_TASK):
+    """ Yield a split_object for each record, in file order, as iterating the records with the xml backend,
+        then validating and serializing each, would.  namespace_dictionary is filled in from the root first.
+        Up to two tasks per worker are in flight at once, so memory stays bounded however big the file is. """
+    from concurrent.futures import ProcessPoolExecutor  # only loaded when used, as Lambda never uses it
+    workers = workers or os.cpu_count()
+    metrics = get_run_metrics()
+    if os.path.getsize(full_path_file_name) == 0:
+        return
+    with open(full_path_file_name, 'rb') as composite_file, \
+            mmap.mmap(composite_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+        read_root_namespaces(mapped_file, namespace_dictionary)
+        offsets = find_record_offsets(mapped_file, record_name, namespace_dictionary)
+        if not offsets:
+            return
+        header = mapped_file[:offsets[0]]
+    closing_tag = b'</' + ROOT_NAME_PATTERN.search(header).group(1) + b'>'
+    task_starts = offsets[::records_per_task]
+    tasks = [(start, end, min(records_per_task, len(offsets) - number * records_per_task))
+             for number, (start, end) in enumerate(zip(task_starts, task_starts[1:] + [None]))]
+    initializer_arguments = (full_path_file_name, header, closing_tag, record_name, dict(namespace_dictionary),
+                             object_id_xpath, required_fields, xml_backend_name)
+    with ProcessPoolExecutor(workers, initializer=_start_worker, initargs=initializer_arguments) as executor:
+        remaining_tasks = iter(tasks)
+        in_flight = deque(executor.submit(_split_records, *task)
+                          for _, task in zip(range(workers * 2), remaining_tasks))
+        try:
+            while in_flight:
+                objects, validate_seconds, serialize_seconds = in_flight.popleft().result()
+                task = next(remaining_tasks, None)
+                if task is not None:
+                    in_flight.append(executor.submit(_split_records, *task))
+                metrics.count('objects_parsed', len(objects))
+                metrics.count('bytes_serialized', sum(len(item.xml_as_bytes) for item in objects))
+                metrics.add_stage_time('validate', validate_seconds)  # summed over workers, so it may exceed elapsed
+                metrics.add_stage_time('serialize', serialize_seconds)
+                yield from objects
+        finally:
+            for future in in_flight:  # if we are stopping early, don't wait for work we won't use
+                future.cancel()
+
+
+class _SplitWorker():
+    """ What each pool process keeps between tasks: its own map of the file, xml backend and validator """
+    def __init__(self, full_path_file_name, header, closing_tag, record_name, namespace_dictionary,
+                 object_id_xpath, required_fields, xml_backend_name):
+        with open(full_path_file_name, 'rb') as composite_file:
+            self.mapped_file = mmap.mmap(composite_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header = header
+        self.closing_tag = closing_tag
+        self.record_name = record_name
+        self.namespace_dictionary = namespace_dictionary
+        self.object_id_xpath = object_id_xpath
+        self.validator = RequiredFieldValidator(required_fields, namespace_dictionary)
+        self.xml_backend = get_xml_backend(xml_backend_name)
+        self.xml_backend.use_namespaces(namespace_dictionary)
+
+    def split_records(self, start, end, record_count):
+        """ Parse, validate and serialize the record_count records from byte start to end (None for the rest).
+            They are parsed as a document of their own, with the composite file's root around them. """
+        if end is None:
+            document = self.header + self.mapped_file[start:]  # which already ends with the root's end tag
+        else:
+            document = self.header + self.mapped_file[start:end] + self.closing_tag
+        objects = []
+        validate_seconds = serialize_seconds = 0.0
+        for item in self.xml_backend.iterate_records(BytesIO(document), self.record_name, {}):
+            start_time = time.perf_counter()
+            object_id = item.find(self.object_id_xpath, self.namespace_dictionary).text
+            missing_fields = self.validator.validate(item)
+            validated = time.perf_counter()
+            objects.append(split_object(object_id, self.xml_backend.serialize_record(item), missing_fields))
+            validate_seconds += validated - start_time
+            serialize_seconds += time.perf_counter() - validated
+        if len(objects) != record_count:
+            raise ValueError('Expected {} records from byte {} of the composite file, but found {}'.format(
+                record_count, start, len(objects)))
+        return objects, validate_seconds, serialize_seconds
+
+
+def _start_worker(*arguments):
+    global _worker
+    _worker = _SplitWorker(*arguments)
+
+
+def _split_records(start, end, record_count):
+    return _worker.split_records(start, end, record_count)
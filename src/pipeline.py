@@ -0,0 +1,135 @@
+# pipeline.py
+""" Run the stages of a run at the same time, each on its own thread, connected by bounded queues.
+    Each stage takes the items of the stage before it (if there is one) and yields its own.
+    A stage whose queue is full waits for the next stage to catch up, so a slow stage holds back
+    the ones before it rather than letting their work pile up in memory.
+    With the stages overlapping, a run takes about as long as its slowest stage rather than all of them added up.
+    For each stage, the time it spends waiting for input is added to the run metrics as "<stage>_idle",
+    the time it spends waiting for room in its queue as "<stage>_blocked", and its queue's depth is sampled
+    each time it adds an item, so the bottleneck is the stage the others are waiting on. """
+
+import queue
+import threading
+import time
+from run_metrics import get_run_metrics
+
+POLL_SECONDS = 0.1  # how often a stage waiting on a queue checks whether the pipeline has been closed
+
+_END = object()  # put on a stage's queue after its last item
+
+
+class PipelineClosed(Exception):
+    """ Raised in a stage waiting on a queue once the pipeline is closed, to stop it """
+
+
+class _StageFailed():
+    """ Put on a stage's queue in place of its next item when the stage raises an exception """
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class Pipeline():
+    """ Add stages in order with add_stage, each starting at once, then iterate the last stage's items.
+        An exception raised in a stage is raised again in the next, and so on, to wherever the items are iterated.
+        Close the pipeline (or use it in a with statement) to stop every stage once its items aren't wanted. """
+    def __init__(self):
+        self.metrics = get_run_metrics()
+        self._closed = threading.Event()
+        self._threads = []
+        self._output = None  # the queue of the last stage added
+
+    def add_stage(self, name, function, queue_size):
+        """ Run function(items) on a new thread, putting each item it yields on a queue of up to queue_size items.
+            items iterates the items of the stage added before this one, or is None for the first stage. """
+        input_items = None if self._output is None else self.iterate(name)
+        output = queue.Queue(queue_size)
+        thread = threading.Thread(target=self._run_stage, args=(name, function, input_items, output),
+                                  name='pipeline-' + name, daemon=True)
+        self._threads.append(thread)
+        self._output = output
+        thread.start()
+
+    def iterate(self, name):
+        """ Iterate the items of the last stage added, adding the time spent waiting for each to "<name>_idle" """
+        return self._iterate_queue(self._output, name)
+
+    def _iterate_queue(self, source, name):
+        while True:
+            start = time.perf_counter()
+            item = self._get(source)
+            self.metrics.add_stage_time(name + '_idle', time.perf_counter() - start)
+            if item is _END:
+                return
+            if isinstance(item, _StageFailed):
+                raise item.exception
+            yield item
+
+    def close(self):
+        """ Stop every stage, and wait for their threads to finish """
+        self._closed.set()
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception_information):
+        self.close()
+
+    def _run_stage(self, name, function, input_items, output):
+        items = function(input_items)
+        try:
+            for item in items:
+                self._put(output, item, name)
+            self._put(output, _END, name)
+        except PipelineClosed:
+            pass
+        except Exception as e:  # passed on to the next stage, which raises it
+            try:
+                self._put(output, _StageFailed(e), name)
+            except PipelineClosed:
+                pass
+        finally:
+            if hasattr(items, 'close'):
+                items.close()
+
+    def _get(self, source):
+        while True:
+            if self._closed.is_set():
+                raise PipelineClosed()
+            try:
+                return source.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                pass
+
+    def _put(self, output, item, name):
+        start = time.perf_counter()
+        while True:
+            if self._closed.is_set():
+                raise PipelineClosed()
+            try:
+                output.put(item, timeout=POLL_SECONDS)
+                break
+            except queue.Full:
+                pass
+        self.metrics.add_stage_time(name + '_blocked', time.perf_counter() - start)
+        self.metrics.add_queue_depth(name, output.qsize())
+
+
+class ChunkReader():
+    """ A file-like object reading from an iterable of bytes, such as the chunks of a pipeline stage,
+        so a parser can read a response as it arrives """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, b'')
+            if not chunk:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
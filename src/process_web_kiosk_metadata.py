@@ -4,163 +4,624 @@
     These individual xml files are saved locally by object name.
     They are then uploaded to a Google Team Drive, and deleted locally. """
 
-from urllib import request, error
 from datetime import datetime, timedelta
+from itertools import chain
 import os
-import sys
-where_i_am = os.path.dirname(os.path.realpath(__file__))
-sys.path.append(where_i_am)
-sys.path.append(where_i_am + "/dependencies")
-from sentry_sdk import capture_message, push_scope, capture_exception  # noqa: E402
-from xml.etree.ElementTree import ElementTree, register_namespace, iterparse   # noqa: E402
-from save_to_google_team_drive import save_file_to_google_team_drive  # noqa: E402
-from file_system_utilities import delete_file, get_full_path_file_name  # noqa: E402  create_directory,
-from send_notification_email import create_and_send_email_notification  # noqa: E402
-from xml_manipulation import get_value_given_xpath, write_xml_output_file, save_string_of_xml_to_disk # noqa: #402
+import time
+from sentry_sdk import capture_exception, capture_message
+from file_system_utilities import delete_file, get_full_path_file_name  # create_directory,
+from concurrent_uploader import ConcurrentUploader
+from send_notification_email import create_and_send_email_notification
+from export_watermark import get_last_successful_export, save_last_successful_export
+from required_field_validator import RequiredFieldValidator
+from missing_field_report import MissingFieldReport
+from object_index import INDEX_SUFFIX, ObjectIndexError, ObjectIndexWriter, iterate_indexed_records
+from parallel_split import iterate_split_objects, split_object
+from pipeline import ChunkReader, Pipeline
+from run_manifest import RunManifest, NoManifestStore, get_manifest_store
+from run_metrics import get_run_metrics
+from stream_url_to_disk import stream_url_to_disk, stream_pages_to_disk, get_saved_file_result, \
+    is_saved_file_compressed, open_saved_file, UrlStream
+from xml_backend import get_xml_backend
+from xml_manipulation import get_md5_checksum, save_bytes_of_xml_to_disk
+
+OBJECT_ID_XPATH = 'mets:dmdSec[@ID="DSC_01_SNITE"]/mets:mdWrap[@MDTYPE="DC"]/mets:xmlData/dcterms:identifier'
 
 
 class process_web_kiosk_metadata():
     def __init__(self, config):
         self.config = config
+        self.composite_identity = None
+        self.export_started = None
+        self.stopped_early = False
+        self.fetch_status = None
+        self.uploader = None
+        self.first_page = None
+        self.remaining_pages = None
+        self.url_stream = None
+        self.pipeline = None  # the fetch, then parse stages of a "streamed" fetch
+        self.metrics = get_run_metrics()
+        self.xml_backend = get_xml_backend(config['xml_backend'])
+        self.object_ids = None  # set by process_indexed_objects
+        self.run_bundle = None
+        self.index_writer = None
 
     def get_snite_composite_mets_metadata(self):
-        """ Build URL, call URL, save resulting output to disk """
+        """ Build URL, call URL, stream resulting output to disk.
+            Returns a stream_result (path, size, status, elapsed_seconds, md5_checksum) rather than the xml itself.
+            When resuming an unfinished run whose composite file is still on disk, that file is reused.
+            In "paged" fetch_mode, this returns the first page, and the rest are fetched while processing.
+            In "streamed" fetch_mode, this returns once the first chunk arrives, and nothing is saved:
+            the export is parsed, validated and uploaded as it arrives, by process_snite_composite_mets_metadata. """
+        with self.metrics.time_stage('fetch'):
+            fetch_result = self._get_composite_metadata()
+        return fetch_result
+
+    def _get_composite_metadata(self):
         embark_server_address = self.config['embark']['server-address']
         mode = self.config['mode']
         folder_name = self.config['folder_name']
         file_name = self.config['file_name']
-        xml_as_string = ''
-        url = self._get_snite_metadata_url(embark_server_address, mode)
-        xml_as_string = self._get_metadata_given_url(url)
-        if xml_as_string > '':
-            save_string_of_xml_to_disk(folder_name, file_name, xml_as_string)
-        return xml_as_string
-
-    def process_snite_composite_mets_metadata(self, clean_up_as_we_go):
-        """ Split big composite metadata file into individual small metadata files """
-        google_credentials = self.config['google']['credentials']
-        drive_id = self.config['google']['museum']['metadata']['drive-id']
-        parent_folder_id = self.config['google']['museum']['metadata']['parent-folder-id']
-        required_fields = self.config['required_fields']
+        if self.config['fetch_mode'] == 'paged':
+            return self._start_paged_fetch(embark_server_address, mode, folder_name, file_name)
+        if self.config['fetch_mode'] == 'streamed':
+            return self._start_streamed_fetch(embark_server_address, mode)
+        fetch_result = self._get_resumable_composite_metadata(folder_name, file_name)
+        if fetch_result is None:
+            self.export_started = datetime.utcnow()
+            url = self._get_snite_metadata_url(embark_server_address, mode)
+            fetch_result = stream_url_to_disk(url, folder_name, file_name,
+                                              keep_compressed=self.config['keep_composite_compressed'],
+                                              timeout_seconds=float(self.config['fetch_timeout_seconds']))
+        else:  # the export was taken when the saved file was written
+            self.export_started = datetime.utcfromtimestamp(os.path.getmtime(fetch_result.path))
+        self.composite_identity = fetch_result.md5_checksum
+        self.fetch_status = fetch_result.status
+        return fetch_result
+
+    def _start_paged_fetch(self, embark_server_address, mode, folder_name, file_name):
+        """ Start fetching the export a page at a time, several pages at once, and wait for the first page """
+        page_size = int(self.config['page_size'])
+        self.export_started = datetime.utcnow()
+        # Pages are fetched fresh every time, so a run that stops early is not resumed by object id;
+        # unchanged objects are still skipped by checksum when it is run again.
+        self.composite_identity = 'paged export started ' + self.export_started.isoformat()
+        self.remaining_pages = stream_pages_to_disk(
+            lambda page_number: self._get_snite_metadata_url(embark_server_address, mode,
+                                                             page_size, page_number * page_size + 1),
+            folder_name,
+            lambda page_number: file_name.replace('.xml', '.page-' + str(page_number + 1).zfill(5) + '.xml'),
+            int(self.config['fetch_workers']),
+            int(self.config['page_retries']),
+            self.config['keep_composite_compressed'],
+            float(self.config['fetch_timeout_seconds']))
+        self.first_page = next(self.remaining_pages)
+        self.fetch_status = self.first_page.status
+        if self.first_page.size == 0:  # so there will be nothing to process, and the pages being fetched aren't wanted
+            self.remaining_pages.close()
+            self.remaining_pages = None
+        return self.first_page
+
+    def _start_streamed_fetch(self, embark_server_address, mode):
+        """ Start reading the export as the first stage of a pipeline, and wait for its first chunk """
+        self.export_started = datetime.utcnow()
+        # As with pages, nothing is saved to resume from, but unchanged objects are still skipped by checksum.
+        self.composite_identity = 'streamed export started ' + self.export_started.isoformat()
+        self.url_stream = UrlStream(self._get_snite_metadata_url(embark_server_address, mode),
+                                    timeout_seconds=float(self.config['fetch_timeout_seconds']))
+        self.pipeline = Pipeline()
+        self.pipeline.add_stage('fetch', lambda nothing: iter(self.url_stream),
+                                int(self.config['pipeline_queue_size']))
+        fetch_result = self.url_stream.wait_until_started()
+        self.fetch_status = fetch_result.status
+        if fetch_result.size == 0:  # so there will be nothing to process
+            self.pipeline.close()
+            self.pipeline = None
+        return fetch_result
+
+    def record_successful_export(self):
+        """ Advance the last successful export watermark, but only if everything exported was saved.
+            Call this after process_snite_composite_mets_metadata, or after finding nothing to process. """
+        if self.export_started is None or self.fetch_status == 'error' or self.stopped_early:
+            return False
+        if self.uploader is not None and self.uploader.failed:
+            return False
+        save_last_successful_export(self.config, self.export_started)
+        return True
+
+    def process_snite_composite_mets_metadata(self, clean_up_as_we_go, context=None):
+        """ Split big composite metadata file into individual small metadata files,
+            uploading them concurrently as they are split.
+            If a Lambda context is passed, we stop cleanly before running out of time,
+            and the next run resumes from where this one stopped. """
         folder_name = self.config['folder_name']
         file_name = self.config['file_name']
-        accumulated_missing_fields = ''
-        xml, namespace_dictionary = self._read_big_metadata_file(folder_name, file_name)
-        if namespace_dictionary != {}:
-            for item in xml.findall('mets:mets', namespace_dictionary):
-                to_find = 'mets:dmdSec[@ID="DSC_01_SNITE"]/mets:mdWrap[@MDTYPE="DC"]/mets:xmlData/dcterms:identifier'
-                object_id = item.find(to_find, namespace_dictionary).text
-                print('Processing: ', object_id)
-                self._add_xsi_to_root(item)
-                object_xml = ElementTree(item)
-                missing_fields = self._test_for_missing_fields(object_id,
-                                                               object_xml,
-                                                               namespace_dictionary,
-                                                               required_fields)
-                if missing_fields > '':
-                    accumulated_missing_fields += missing_fields
-                local_file_name = object_id + '.xml'
-                write_xml_output_file(folder_name, local_file_name, object_xml)
-                save_file_to_google_team_drive(google_credentials,
-                                               drive_id,
-                                               parent_folder_id,
-                                               folder_name,
-                                               local_file_name)
-                if clean_up_as_we_go:
-                    delete_file(folder_name, local_file_name)
+        self.missing_field_report = MissingFieldReport()
+        self.exported_object_ids = set()
+        namespace_dictionary = {}
+        full_path_file_name = get_full_path_file_name(folder_name, file_name)
+        self.drive_session = None
+        self.folder_index = None
+        self.context = context
+        self.stopped_early = False
+        self.run_manifest = self._get_run_manifest(full_path_file_name)
+        self.run_bundle = self._start_run_bundle()
+        self.uploader = ConcurrentUploader(int(self.config['upload_workers']),
+                                           on_success=self._mark_uploaded)
+        self.index_writer = None
+        try:
+            self.index_writer = self._start_object_index(full_path_file_name, clean_up_as_we_go)
+            records = self._iterate_records(full_path_file_name, namespace_dictionary, clean_up_as_we_go)
+            for item in self._time_each(records, 'split'):
+                if self._out_of_time():
+                    break
+                if self.folder_index is None:  # first object, so namespaces have been read from the root
+                    self._start_processing(item, namespace_dictionary)
+                if isinstance(item, split_object):
+                    self._process_split_object(item, clean_up_as_we_go)
+                else:
+                    self._process_object(item, namespace_dictionary, clean_up_as_we_go)
                 if self.config['running_unit_tests']:
                     break
-            if accumulated_missing_fields > '':
-                create_and_send_email_notification(accumulated_missing_fields,
+        except FileNotFoundError:
+            capture_message('Unable to read xml file from ' + full_path_file_name)
+        finally:
+            with self.metrics.time_stage('upload_wait'):
+                self.uploader.wait()
+            self.metrics.count('uploads_failed', len(self.uploader.failed))
+            self.run_manifest.save(complete=not self.stopped_early)
+            if self.run_bundle is not None:
+                self.run_bundle.close()
+        self._save_object_index()
+        self._upload_run_bundle(clean_up_as_we_go)
+        if len(self.missing_field_report) > 0:
+            self.metrics.count('objects_missing_fields', len(self.missing_field_report))
+            with self.metrics.time_stage('notify'):
+                self.missing_field_report.send_to_sentry(int(self.config['max_missing_field_events']))
+                create_and_send_email_notification(self.missing_field_report,
                                                    self.config['museum']['notification-email-address'],
                                                    self.config['no-reply-email-address'])
-        if clean_up_as_we_go:
+        self._remove_orphaned_files()
+        if clean_up_as_we_go and not self.stopped_early:  # keep the composite file so we can resume from it
             delete_file(folder_name, file_name)
+            delete_file(folder_name, file_name + INDEX_SUFFIX)
         return namespace_dictionary
 
-    def _add_xsi_to_root(self, root):
-        """ Since we can't read the xsi information from the original xml file, add it here """
-        root.set("xsi:schemaLocation", "http://www.loc.gov/METS/ http://www.loc.gov/standards/mets/mets.xsd http://purl.org/dc/terms/ \
-                 http://dublincore.org/schemas/xmls/qdc/2008/02/11/dcterms.xsd \
-                 http://www.vraweb.org/vracore4.htm http://www.loc.gov/standards/vracore/vra-strict.xsd")
-        root.set("xmlns:xsi", "http://www.w3.org/2001/XMLSchema-instance")
+    def _start_object_index(self, full_path_file_name, clean_up_as_we_go):
+        """ An ObjectIndexWriter for the composite file, if it is to be indexed as it is split.
+            Only a whole single composite file, kept plain and on disk afterwards, is worth indexing. """
+        if not self.config['write_object_index'] or self.config['fetch_mode'] != 'single' or clean_up_as_we_go \
+                or self.object_ids is not None or self.config['running_unit_tests'] \
+                or self._is_compressed(full_path_file_name) or os.path.getsize(full_path_file_name) == 0:
+            return None
+        with self.metrics.time_stage('index'):
+            return ObjectIndexWriter(full_path_file_name, 'mets:mets')
 
-    def _read_big_metadata_file(self, folder_name, file_name):
-        """ Read metadata file and capture namespace info """
-        full_path_file_name = get_full_path_file_name(folder_name, file_name)
-        root = None
-        ns_map = []
-        namespace_dictionary = {}
-        events = "start", "start-ns", "end"
-        # iterparse is my only option for capturing namespaces, and iterparse only reads files not strings
+    def _save_object_index(self):
+        """ Save the sidecar index process_indexed_objects uses to read chosen objects from the composite file,
+            once every object in it has been split """
+        if self.index_writer is None or self.stopped_early:
+            return
+        with self.metrics.time_stage('index'):
+            try:
+                self.index_writer.save()
+            except ObjectIndexError as e:
+                capture_message(str(e))
+
+    def _start_processing(self, first_item, namespace_dictionary):
+        """ Get ready to validate, serialize and upload objects, once the first has been read """
+        if not isinstance(first_item, split_object):  # which are validated and serialized already
+            self.xml_backend.use_namespaces(namespace_dictionary)
+            self.validator = RequiredFieldValidator(self.config['required_fields'], namespace_dictionary)
+        with self.metrics.time_stage('drive_index'):
+            self._connect_to_google_team_drive()
+
+    def _iterate_composite_records(self, full_path_file_name, namespace_dictionary, clean_up_as_we_go):
+        """ Yield each mets:mets record, either from the single composite file or from each page in turn """
+        if self.remaining_pages is None:
+            yield from self._iterate_saved_records(full_path_file_name, namespace_dictionary)
+            return
+        page_size = int(self.config['page_size'])
+        first_object_ids = set()  # of each page
         try:
-            for event, elem in iterparse(full_path_file_name, events):
-                if event == "start-ns":
-                    namespace_dictionary[elem[0]] = elem[1]
-                    ns_map.append(elem)
-                elif event == "start":
-                    if root is None:
-                        root = elem
-                    for prefix, uri in ns_map:
-                        elem.set("xmlns:" + prefix, uri)
-                    ns_map = []
-            self._register_global_namespaces(namespace_dictionary)
-        except FileNotFoundError:
-            capture_exception('Unable to read xml file from ' + full_path_file_name)
-            # print('Unable to read xml file from ' + full_path_file_name)
-        return ElementTree(root), namespace_dictionary
-
-    def _register_global_namespaces(self, namespace_dictionary):
-        """ Register namespaces to allow output to include readable namespace aliases """
-        for prefix in namespace_dictionary:
-            uri = namespace_dictionary[prefix]
-            register_namespace(prefix, uri)
-
-    def _get_metadata_given_url(self, url):
-        """ Return xml from URL."""
-        xml_as_string = ""
+            for page in chain([self.first_page], self.remaining_pages):
+                if page.status == 'error':  # already retried, so Web Kiosk has stopped answering
+                    self.fetch_status = 'error'
+                    break
+                record_count = yield from self._iterate_page(page, namespace_dictionary, first_object_ids)
+                if clean_up_as_we_go:
+                    delete_file(self.config['folder_name'], os.path.basename(page.path))
+                if record_count < page_size or self.fetch_status == 'error':  # a short page is the last one
+                    break
+                if self._out_of_time():  # rather than wait for the next page
+                    break
+        finally:
+            self.remaining_pages.close()
+
+    def _iterate_page(self, page, namespace_dictionary, first_object_ids):
+        """ Yield each mets:mets record of one page, returning how many there were.
+            A page starting with an object an earlier page started with means Web Kiosk is ignoring
+            page_start_parameter and sending the same page again, so the fetch has failed and that page is skipped. """
+        records = self._iterate_saved_records(page.path, namespace_dictionary)
+        record_count = 0
+        try:
+            for item in records:
+                if record_count == 0:
+                    object_id = item.find(OBJECT_ID_XPATH, namespace_dictionary).text
+                    if object_id in first_object_ids:
+                        capture_message('Web Kiosk sent a page starting at ' + object_id + ' again, so is not paging'
+                                        + ' by ' + self.config['page_start_parameter'] + '.  Stopping the fetch.')
+                        self.fetch_status = 'error'
+                        return record_count
+                    first_object_ids.add(object_id)
+                record_count += 1
+                yield item
+        finally:
+            records.close()
+        return record_count
+
+    def _iterate_saved_records(self, full_path_file_name, namespace_dictionary):
+        """ Yield each mets:mets record of a file saved by stream_url_to_disk, decompressing it as it is parsed
+            if it was kept compressed """
+        if not is_saved_file_compressed(full_path_file_name):
+            yield from self.xml_backend.iterate_records(full_path_file_name, 'mets:mets', namespace_dictionary)
+            return
+        with open_saved_file(full_path_file_name) as saved_file:
+            yield from self.xml_backend.iterate_records(saved_file, 'mets:mets', namespace_dictionary)
+
+    def process_indexed_objects(self, object_ids):
+        """ Validate and upload just object_ids, reading each straight from the composite file already on disk
+            using its sidecar index (see write_object_index), rather than parsing the whole file.
+            The run manifest is neither used nor changed, so these are processed even if a run has done them. """
+        self.object_ids = list(object_ids)
+        try:
+            return self.process_snite_composite_mets_metadata(clean_up_as_we_go=False)
+        finally:
+            self.object_ids = None
+
+    def _iterate_records(self, full_path_file_name, namespace_dictionary, clean_up_as_we_go):
+        """ Yield each mets:mets record, or with split_workers set, a split_object for each one,
+            already validated and serialized by that many processes """
+        if self.object_ids is not None:
+            return iterate_indexed_records(full_path_file_name, self.object_ids, self.xml_backend,
+                                           namespace_dictionary)
+        if self.pipeline is not None:
+            return self._iterate_streamed_objects(namespace_dictionary)
+        split_workers = int(self.config['split_workers'])
+        if split_workers > 0 and self.remaining_pages is None and not self._is_compressed(full_path_file_name):
+            return iterate_split_objects(full_path_file_name, 'mets:mets', namespace_dictionary, OBJECT_ID_XPATH,
+                                         self.config['required_fields'], self.config['xml_backend'], split_workers)
+        return self._iterate_composite_records(full_path_file_name, namespace_dictionary, clean_up_as_we_go)
+
+    @staticmethod
+    def _is_compressed(full_path_file_name):
+        """ True if the composite file was kept compressed, so can't be split at offsets in the xml """
+        try:
+            return is_saved_file_compressed(full_path_file_name)
+        except FileNotFoundError:  # reported once processing starts
+            return False
+
+    def _iterate_streamed_objects(self, namespace_dictionary):
+        """ Yield a split_object for each record of the export as it arrives,
+            parsed, validated and serialized by a pipeline stage running alongside the fetch and the uploads """
+        pipeline = self.pipeline
+        pipeline.add_stage('split', lambda chunks: self._split_streamed_records(chunks, namespace_dictionary),
+                           int(self.config['pipeline_queue_size']))
+        try:
+            yield from pipeline.iterate('upload')
+        finally:
+            pipeline.close()
+            self.pipeline = None
+            self.fetch_status = self.url_stream.status
+
+    def _split_streamed_records(self, chunks, namespace_dictionary):
+        """ Pipeline stage turning the chunks of the export into a split_object for each record.
+            Records are validated and serialized here, rather than in a stage of their own,
+            as each one is only whole until the parser moves on to the next. """
+        metrics = self.metrics
+        validator = None
+        try:
+            for item in self.xml_backend.iterate_records(ChunkReader(chunks), 'mets:mets', namespace_dictionary):
+                if validator is None:  # first object, so namespaces have been read from the root
+                    self.xml_backend.use_namespaces(namespace_dictionary)
+                    validator = RequiredFieldValidator(self.config['required_fields'], namespace_dictionary)
+                start = time.perf_counter()
+                object_id = item.find(OBJECT_ID_XPATH, namespace_dictionary).text
+                missing_fields = validator.validate(item)
+                validated = time.perf_counter()
+                xml_as_bytes = self.xml_backend.serialize_record(item)
+                metrics.add_stage_time('validate', validated - start)
+                metrics.add_stage_time('serialize', time.perf_counter() - validated)
+                yield split_object(object_id, xml_as_bytes, missing_fields)
+        except SyntaxError:  # ElementTree's and lxml's parse errors both are
+            if self.url_stream.status != 'error':  # otherwise the fetch failed part way, and that is recorded
+                raise
+
+    def _mark_uploaded(self, object_id):
+        """ Called by the uploader (on its worker thread) once object_id is saved on the drive """
+        self.run_manifest.mark_processed(object_id)
+        if self.metrics.trace_hooks:
+            self.metrics.trace('uploaded', object_id)
+
+    def _time_each(self, iterable, stage):
+        """ Yield from iterable, adding the time spent waiting for each item to stage """
+        iterator = iter(iterable)
         try:
-            xml_as_string = request.urlopen(url).read().decode('utf-8')
-        except error.HTTPError:
-            capture_exception('Unable to retrieve xml from ' + url)
-            # print('Unable to retrieve xml from ' + url)
-            pass
-        except ConnectionRefusedError:
-            capture_exception('Connection refused on url ' + url)
-            # print('Connection refused on url ' + url)
-        except:  # noqa E722 - intentionally ignore warning about bare except
-            capture_exception('Error caught trying to process url ' + url)
-            # print('Error caught trying to process url ' + url)
-        return xml_as_string
-
-    def _get_snite_metadata_url(self, embark_server_address, mode):
-        """ Get url for retrieving Snite metadata """
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                finally:
+                    self.metrics.add_stage_time(stage, time.perf_counter() - start)
+                yield item
+        except StopIteration:
+            return
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+
+    def _get_resumable_composite_metadata(self, folder_name, file_name):
+        """ If the last run stopped early and its composite file is still on disk, return a stream_result for it """
+        if not self.config['resume'] or self.config['fetch_mode'] != 'single':
+            return None
+        saved_result = get_saved_file_result(get_full_path_file_name(folder_name, file_name))
+        if saved_result is None:
+            return None
+        saved_manifest = get_manifest_store(self.config['run_manifest']).load()
+        if not RunManifest.is_resumable(saved_manifest, saved_result.md5_checksum):
+            return None
+        print('Resuming from composite metadata already saved at', saved_result.path)
+        return saved_result
+
+    def _get_run_manifest(self, full_path_file_name):
+        """ Return the manifest for this composite file, picking up an unfinished run if resuming """
+        if self.object_ids is not None:
+            return RunManifest(NoManifestStore(), '')
+        if self.composite_identity is None:
+            saved_result = get_saved_file_result(full_path_file_name)
+            self.composite_identity = saved_result.md5_checksum if saved_result else ''
+        manifest_config = self.config['run_manifest']
+        store = get_manifest_store(manifest_config)
+        if not self.config['resume']:
+            store.delete()
+        return RunManifest(store, self.composite_identity, int(manifest_config['checkpoint_interval']))
+
+    def _out_of_time(self):
+        """ True (and remember that we stopped early) once the Lambda context, if there is one,
+            has less than deadline_buffer_seconds left, so we stop taking on new objects """
+        if self.stopped_early or not hasattr(self.context, 'get_remaining_time_in_millis'):
+            return self.stopped_early
+        if self.context.get_remaining_time_in_millis() / 1000 < float(self.config['deadline_buffer_seconds']):
+            print('Stopping before the Lambda deadline.  The next run will resume from here.')
+            self.stopped_early = True
+        return self.stopped_early
+
+    def _connect_to_google_team_drive(self):
+        """ Open the Drive session and index the destination folder, once per run """
+        # the Google client libraries are slow to import, so they are only loaded once there is something to upload
+        from save_to_google_team_drive import DriveSession, get_folder_index
+        google_credentials = self.config['google']['credentials']
+        drive_id = self.config['google']['museum']['metadata']['drive-id']
+        parent_folder_id = self.config['google']['museum']['metadata']['parent-folder-id']
+        self.drive_session = DriveSession(google_credentials, self.config['drive_api_root_url'],
+                                          self.config['drive_rate_limit'])
+        self.folder_index = get_folder_index(self.drive_session, drive_id, parent_folder_id)
+
+    def _process_object(self, item, namespace_dictionary, clean_up_as_we_go):
+        """ Validate and serialize one object, then queue its upload.
+            Any missing required fields are added to the missing field report. """
+        object_id = item.find(OBJECT_ID_XPATH, namespace_dictionary).text
+        self.exported_object_ids.add(object_id)
+        if self.index_writer is not None:
+            self.index_writer.add(object_id)
+        if self.run_manifest.is_processed(object_id):
+            return
+        print('Processing: ', object_id)
+        metrics = self.metrics
+        metrics.count('objects_processed')
+        start = time.perf_counter()
+        missing_fields = self.validator.validate(item)
+        self.missing_field_report.add(object_id, missing_fields)
+        validated = time.perf_counter()
+        metrics.add_stage_time('validate', validated - start)
+        # item is freed as soon as we ask for the next one, so it must be serialized before then
+        xml_as_bytes = self.xml_backend.serialize_record(item)  # which may empty item, so validate first
+        serialized = time.perf_counter()
+        metrics.add_stage_time('serialize', serialized - validated)
+        if metrics.trace_hooks:
+            metrics.trace('serialized', object_id, size=len(xml_as_bytes), missing_fields=len(missing_fields),
+                          validate_seconds=validated - start, serialize_seconds=serialized - validated)
+        if self.run_bundle is not None:
+            self.run_bundle.add(object_id, xml_as_bytes, missing_fields)
+        self._upload_unless_unchanged(object_id, xml_as_bytes, clean_up_as_we_go)
+
+    def _process_split_object(self, item, clean_up_as_we_go):
+        """ Queue the upload of one object a split worker has already validated and serialized """
+        self.exported_object_ids.add(item.object_id)
+        if self.index_writer is not None:
+            self.index_writer.add(item.object_id)
+        if self.run_manifest.is_processed(item.object_id):
+            return
+        print('Processing: ', item.object_id)
+        metrics = self.metrics
+        metrics.count('objects_processed')
+        self.missing_field_report.add(item.object_id, item.missing_fields)
+        if metrics.trace_hooks:
+            metrics.trace('serialized', item.object_id, size=len(item.xml_as_bytes),
+                          missing_fields=len(item.missing_fields))
+        if self.run_bundle is not None:
+            self.run_bundle.add(item.object_id, item.xml_as_bytes, item.missing_fields)
+        self._upload_unless_unchanged(item.object_id, item.xml_as_bytes, clean_up_as_we_go)
+
+    def _start_run_bundle(self):
+        """ A RunBundle to add this run's objects to, if one is wanted and this run will go through the export itself,
+            rather than resuming one that stopped part way or reprocessing chosen objects """
+        if not self.config['run_bundle']['enabled'] or self.object_ids is not None \
+                or self.run_manifest.processed_object_ids:
+            return None
+        from run_bundle import RunBundle, get_run_bundle_file_name  # tarfile is only needed for bundles
+        export_started = self.export_started or datetime.utcnow()
+        file_name = get_run_bundle_file_name(self.config['mode'], export_started)
+        return RunBundle(self.config['folder_name'], file_name, self.config['mode'], export_started)
+
+    def _upload_run_bundle(self, clean_up_as_we_go):
+        """ Upload the run bundle, if every object of the export went into it """
+        run_bundle, self.run_bundle = self.run_bundle, None
+        if run_bundle is None:
+            return
+        if not self.stopped_early and self.fetch_status != 'error' and self.drive_session is not None:
+            from save_to_google_team_drive import save_file_to_google_team_drive
+            metadata_folder_id = self.config['google']['museum']['metadata']['parent-folder-id']
+            parent_folder_id = self.config['run_bundle']['parent_folder_id'] or metadata_folder_id
+            folder_index = self.folder_index if parent_folder_id == metadata_folder_id else None
+            with self.metrics.time_stage('bundle'):
+                try:
+                    save_file_to_google_team_drive(self.drive_session,
+                                                   self.config['google']['museum']['metadata']['drive-id'],
+                                                   parent_folder_id,
+                                                   run_bundle.folder_name,
+                                                   run_bundle.file_name,
+                                                   folder_index,
+                                                   'application/gzip')
+                    self.metrics.count('bundle_bytes', os.path.getsize(run_bundle.full_path_file_name))
+                    print('Uploaded', len(run_bundle.objects), 'objects in', run_bundle.file_name)
+                    self._remove_old_run_bundles(parent_folder_id, folder_index)
+                except Exception as e:  # every object was still saved on its own
+                    capture_exception(e)
+        if clean_up_as_we_go:
+            run_bundle.delete()
+
+    def _remove_old_run_bundles(self, parent_folder_id, folder_index):
+        """ Move to the trash the bundles in parent_folder_id older than the newest run_bundle keep of them """
+        from run_bundle import get_old_run_bundle_file_names
+        from save_to_google_team_drive import get_folder_index, trash_files
+        if folder_index is None:  # the bundles have a folder of their own
+            drive_id = self.config['google']['museum']['metadata']['drive-id']
+            folder_index = get_folder_index(self.drive_session, drive_id, parent_folder_id)
+        old_file_names = get_old_run_bundle_file_names(folder_index, int(self.config['run_bundle']['keep']))
+        if not old_file_names:
+            return
+        failures = trash_files(self.drive_session, [folder_index[file_name].file_id for file_name in old_file_names])
+        for file_name in old_file_names:
+            if folder_index[file_name].file_id not in failures:
+                del folder_index[file_name]
+        self.metrics.count('bundles_removed', len(old_file_names) - len(failures))
+        if failures:
+            capture_message('Unable to remove ' + str(len(failures)) + ' old run bundles')
+
+    def _remove_orphaned_files(self):
+        """ After a complete full export, move to the trash (or delete, or just report) the drive's files for objects
+            Web Kiosk no longer exports, unless so many would go that the export looks to have been cut short """
+        orphan_cleanup = self.config['orphan_cleanup']
+        if orphan_cleanup['action'] not in ('report', 'trash', 'delete') or not self._exported_everything():
+            return
+        orphans = {file_name: drive_file for file_name, drive_file in self.folder_index.items()
+                   if file_name.endswith('.xml') and file_name[:-len('.xml')] not in self.exported_object_ids}
+        if not orphans:
+            return
+        object_file_count = sum(1 for file_name in self.folder_index if file_name.endswith('.xml'))  # not bundles
+        if len(orphans) > float(orphan_cleanup['max_fraction']) * object_file_count:
+            capture_message('Not removing ' + str(len(orphans)) + ' of the ' + str(object_file_count)
+                            + ' object files in Google Team Drive, as that is more than max_fraction of them')
+            return
+        if orphan_cleanup['action'] == 'report':
+            self.metrics.count('orphans_found', len(orphans))
+            capture_message('Would remove ' + str(len(orphans)) + ' files for objects no longer exported, such as '
+                            + ', '.join(sorted(orphans)[:10]))
+            return
+        from save_to_google_team_drive import delete_files, trash_files
+        remove_files = trash_files if orphan_cleanup['action'] == 'trash' else delete_files
+        with self.metrics.time_stage('orphans'):
+            failures = remove_files(self.drive_session, [drive_file.file_id for drive_file in orphans.values()])
+        for file_name, drive_file in orphans.items():
+            if drive_file.file_id not in failures:
+                del self.folder_index[file_name]
+        self.metrics.count('orphans_removed', len(orphans) - len(failures))
+        print('Removed (' + orphan_cleanup['action'] + ')', len(orphans) - len(failures),
+              'files for objects no longer exported')
+        if failures:
+            self.metrics.count('orphans_failed', len(failures))
+            capture_message('Unable to remove ' + str(len(failures)) + ' files for objects no longer exported')
+
+    def _exported_everything(self):
+        """ True if this run went through every object of a full export, so any other object's file is an orphan """
+        return self.config['mode'] == 'full' and self.object_ids is None and self.folder_index is not None \
+            and not self.stopped_early and self.fetch_status != 'error' and not self.config['running_unit_tests'] \
+            and len(self.exported_object_ids) > 0
+
+    def _upload_unless_unchanged(self, object_id, xml_as_bytes, clean_up_as_we_go):
+        """ Queue the upload of one serialized object, unless the drive already has exactly this content """
+        metrics = self.metrics
+        local_file_name = object_id + '.xml'
+        serialized = time.perf_counter()
+        if self._is_unchanged(local_file_name, xml_as_bytes):
+            self.uploader.skip(object_id)
+            self.run_manifest.mark_processed(object_id)
+            metrics.count('uploads_skipped')
+            if metrics.trace_hooks:
+                metrics.trace('skipped', object_id)
+        else:
+            self._queue_upload(object_id, local_file_name, xml_as_bytes, clean_up_as_we_go)
+            metrics.add_stage_time('upload_queue', time.perf_counter() - serialized)
+            if metrics.trace_hooks:
+                metrics.trace('queued', object_id, queue_seconds=time.perf_counter() - serialized)
+
+    def _is_unchanged(self, file_name, xml_as_bytes):
+        """ True if Google Team Drive already has exactly this content for file_name """
+        if not self.config['skip_unchanged'] or file_name not in self.folder_index:
+            return False
+        return self.folder_index[file_name].md5_checksum == get_md5_checksum(xml_as_bytes)
+
+    def _queue_upload(self, object_id, local_file_name, xml_as_bytes, clean_up_as_we_go):
+        """ Hand one object to the uploader, either straight from memory or via a local copy """
+        from save_to_google_team_drive import save_bytes_to_google_team_drive
+        drive_id = self.config['google']['museum']['metadata']['drive-id']
+        parent_folder_id = self.config['google']['museum']['metadata']['parent-folder-id']
+        if self.config['write_local_copies']:
+            folder_name = self.config['folder_name']
+            save_bytes_of_xml_to_disk(folder_name, local_file_name, xml_as_bytes)
+            self.uploader.submit(object_id, self._upload_object_from_disk, drive_id, parent_folder_id,
+                                 folder_name, local_file_name, clean_up_as_we_go)
+        else:
+            self.uploader.submit(object_id, save_bytes_to_google_team_drive, self.drive_session, drive_id,
+                                 parent_folder_id, local_file_name, xml_as_bytes, folder_index=self.folder_index)
+
+    def _upload_object_from_disk(self, drive_id, parent_folder_id, folder_name, local_file_name, clean_up_as_we_go):
+        """ Upload one object's local metadata file (this runs on an uploader worker thread) """
+        from save_to_google_team_drive import save_file_to_google_team_drive
+        save_file_to_google_team_drive(self.drive_session,
+                                       drive_id,
+                                       parent_folder_id,
+                                       folder_name,
+                                       local_file_name,
+                                       folder_index=self.folder_index)
+        if clean_up_as_we_go:
+            delete_file(folder_name, local_file_name)
+
+    def _get_snite_metadata_url(self, embark_server_address, mode, maximum_records=-1, start_record=None):
+        """ Get url for retrieving Snite metadata
+            By default all records are returned at once; pass maximum_records and start_record for one page. """
         base_url = embark_server_address \
-            + "/results.html?layout=marble_mets&format=xml&maximumrecords=-1&recordType=objects_1"
+            + "/results.html?layout=marble_mets&format=xml&maximumrecords=" + str(maximum_records) \
+            + "&recordType=objects_1"
+        if start_record is not None:
+            base_url += "&" + self.config['page_start_parameter'] + "=" + str(start_record)
         if mode == 'full':
             url = base_url + "&query=_ID=ALL"
         else:  # incremental
-            recent_past = datetime.utcnow() - timedelta(days=2)
-            recent_past_string = recent_past.strftime('%m/%d/%Y')
+            recent_past_string = self._get_incremental_start_date().strftime('%m/%d/%Y')
             url = base_url + "&query=mod_date%3E%22" + recent_past_string + "%22"
         return(url)
 
-    def _test_for_missing_fields(self, object_id, xml, namespace_dictionary, required_fields):
-        """ Test for missing required fields """
-        missing_fields = ''
-        for preferred_name, xpath in required_fields.items():
-            value = get_value_given_xpath(xml, xpath, namespace_dictionary)
-            if value == '' or value is None:
-                missing_fields += preferred_name + ' - at xpath location ' + xpath + '\n'
-        if missing_fields > '':
-            self._log_missing_field(object_id, missing_fields)
-            return(object_id + ' is missing the follwing required field(s): \n' + missing_fields + '\n')
-        return(missing_fields)
-
-    def _log_missing_field(self, object_id, missing_fields):
-        """ Log missing field information """
-        with push_scope() as scope:
-            scope.set_tag('repository', 'snite')
-            scope.set_tag('problem', 'missing_field')
-            scope.level = 'warning'
-            capture_message(object_id + ' is missing the follwing required field(s): \n' + missing_fields)
+    def _get_incremental_start_date(self):
+        """ Web Kiosk can only query by modification date, and only with "greater than", which leaves out that day.
+            To include everything changed since the last successful export, less watermark_overlap_hours
+            (for changes saved while that export was being taken), ask for anything modified after the day before
+            the one the overlap reaches back to.  As the query is by day, the overlap only takes it back a further
+            day when it crosses midnight; otherwise that whole day is already included.
+            If we have never recorded a successful export, look back two days. """
+        last_successful_export = get_last_successful_export(self.config)
+        if last_successful_export is None:
+            return datetime.utcnow() - timedelta(days=2)
+        overlap = timedelta(hours=float(self.config['watermark_overlap_hours']))
+        return last_successful_export - overlap - timedelta(days=1)  # only its date is used
@@ -0,0 +1,86 @@
+# reprocess_objects.py
+""" Validate and upload chosen objects again from the composite export already on disk,
+    reading each straight from the file through its sidecar object index instead of parsing the whole export.
+    The index is written while splitting with config['write_object_index'] set, or with --build-index here.
+    The composite file must have been kept, i.e. processed without clean_up_as_we_go.
+
+    Run from the project root, with the environment the Lambda uses (SSM_KEY_BASE or CONFIG_FILE,
+    and WEB_KIOSK_EXPORT_MODE):
+        python -m src.reprocess_objects 1990.001 1990.002
+        python -m src.reprocess_objects --validate-only --object-ids-file ids.txt
+        python -m src.reprocess_objects --build-index """
+
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import argparse  # noqa: E402
+from file_system_utilities import get_full_path_file_name  # noqa: E402
+from get_config import get_config  # noqa: E402
+from object_index import ObjectIndexError, iterate_indexed_records, write_object_index  # noqa: E402
+from process_web_kiosk_metadata import process_web_kiosk_metadata, OBJECT_ID_XPATH  # noqa: E402
+from required_field_validator import RequiredFieldValidator  # noqa: E402
+from xml_backend import get_xml_backend  # noqa: E402
+
+
+def validate_indexed_objects(config, full_path_file_name, object_ids):
+    """ Return {object id: list of missing_field} for object_ids, without uploading anything """
+    xml_backend = get_xml_backend(config['xml_backend'])
+    namespace_dictionary = {}
+    validator = None
+    results = {}
+    for item in iterate_indexed_records(full_path_file_name, object_ids, xml_backend, namespace_dictionary):
+        if validator is None:
+            validator = RequiredFieldValidator(config['required_fields'], namespace_dictionary)
+        results[item.find(OBJECT_ID_XPATH, namespace_dictionary).text] = validator.validate(item)
+    return results
+
+
+def _get_object_ids(options):
+    object_ids = list(options.object_ids)
+    if options.object_ids_file:
+        with open(options.object_ids_file, 'r') as object_ids_file:
+            object_ids.extend(line.strip() for line in object_ids_file if line.strip())
+    return object_ids
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description='Reprocess chosen objects from the composite export on disk.')
+    parser.add_argument('object_ids', nargs='*', help='ids of the objects to reprocess')
+    parser.add_argument('--object-ids-file', help='a file of object ids, one per line')
+    parser.add_argument('--composite', help="the composite file (default: config's folder_name and file_name)")
+    parser.add_argument('--build-index', action='store_true', help='index the composite file first')
+    parser.add_argument('--validate-only', action='store_true', help='report missing fields without uploading')
+    options = parser.parse_args(arguments)
+    config = get_config()
+    if config == {}:
+        return 1
+    full_path_file_name = options.composite or get_full_path_file_name(config['folder_name'], config['file_name'])
+    object_ids = _get_object_ids(options)
+    try:
+        if options.build_index:
+            index = write_object_index(full_path_file_name, get_xml_backend(config['xml_backend']), 'mets:mets',
+                                       OBJECT_ID_XPATH)
+            print('Indexed', len(index['objects']), 'objects in', full_path_file_name)
+        if not object_ids:
+            return 0
+        if options.validate_only:
+            for object_id, missing_fields in validate_indexed_objects(config, full_path_file_name,
+                                                                      object_ids).items():
+                print(object_id, 'missing:', ', '.join(field.field for field in missing_fields) or 'nothing')
+            return 0
+        config['folder_name'], config['file_name'] = os.path.split(full_path_file_name)
+        processor = process_web_kiosk_metadata(config)
+        processor.process_indexed_objects(object_ids)
+    except ObjectIndexError as e:
+        print(e)
+        return 1
+    uploader = processor.uploader
+    print('Uploaded', len(uploader.succeeded), 'skipped as unchanged', len(uploader.skipped),
+          'failed', len(uploader.failed))
+    return 1 if uploader.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
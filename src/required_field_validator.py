@@ -0,0 +1,94 @@
+# required_field_validator.py
+""" Check an object for missing required fields in a single walk of its xml.
+    The configured xpaths are compiled once into a tree of steps, so paths that share a prefix
+    (most of ours start with mets:dmdSec/mets:mdWrap/mets:xmlData) are only walked once. """
+
+from collections import namedtuple
+import re
+from xml_manipulation import get_value_given_xpath, get_qualified_name
+
+missing_field = namedtuple('missing_field', ['field', 'xpath'])
+
+# A step we know how to compile: prefix:name, optionally followed by [@attribute] or [@attribute="value"]
+STEP_PATTERN = re.compile(r'^((?P<prefix>[A-Za-z_][\w.-]*):)?(?P<name>[A-Za-z_][\w.-]*)'
+                          r'(\[@(?P<attribute>[\w.-]+)(=(?P<quote>["\'])(?P<value>.*)(?P=quote))?\])?$')
+
+
+class _StepNode():
+    """ One step of one or more compiled xpaths """
+    def __init__(self):
+        self.children = {}  # qualified tag -> list of (attribute, value, _StepNode)
+        self.fields = []  # (preferred_name, attribute to fall back on) for xpaths ending here
+
+    def get_child(self, tag, attribute, value):
+        for child_attribute, child_value, node in self.children.setdefault(tag, []):
+            if child_attribute == attribute and child_value == value:
+                return node
+        node = _StepNode()
+        self.children[tag].append((attribute, value, node))
+        return node
+
+
+class RequiredFieldValidator():
+    """ Compiled from a required_fields dictionary (preferred name -> xpath) and the namespaces of the document.
+        Gives the same answers as calling get_value_given_xpath for each field. """
+    def __init__(self, required_fields, namespace_dictionary):
+        self.required_fields = required_fields
+        self.namespace_dictionary = namespace_dictionary
+        self._root = _StepNode()
+        self._uncompiled_fields = []  # anything we can't compile is checked the slow way
+        for preferred_name, xpath in required_fields.items():
+            if not self._compile(preferred_name, xpath):
+                self._uncompiled_fields.append(preferred_name)
+
+    def validate(self, element):
+        """ Return a list of missing_field for each required field without a value, in configured order """
+        values = {}
+        self._walk(element, self._root, values)
+        for preferred_name in self._uncompiled_fields:
+            values[preferred_name] = get_value_given_xpath(element, self.required_fields[preferred_name],
+                                                           self.namespace_dictionary)
+        return [missing_field(preferred_name, xpath)
+                for preferred_name, xpath in self.required_fields.items()
+                if values.get(preferred_name) is None or values.get(preferred_name) == '']
+
+    def _compile(self, preferred_name, xpath):
+        """ Add xpath to the tree of steps.  Returns False if xpath uses syntax we don't compile. """
+        steps = []
+        for step in xpath.split('/'):
+            match = STEP_PATTERN.match(step)
+            if match is None:
+                return False
+            prefix = match.group('prefix')
+            if prefix is None:
+                tag = match.group('name')
+            elif prefix in self.namespace_dictionary:
+                tag = get_qualified_name(prefix + ':' + match.group('name'), self.namespace_dictionary)
+            else:
+                return False
+            steps.append((tag, match.group('attribute'), match.group('value')))
+        node = self._root
+        for tag, attribute, value in steps:
+            node = node.get_child(tag, attribute, value)
+        # Same rule as get_value_given_xpath: with no text, fall back on the first attribute named in the xpath
+        fallback_attribute = re.search(r'(?<=@)\w+', xpath)[0] if '[@' in xpath else None
+        node.fields.append((preferred_name, fallback_attribute))
+        return True
+
+    def _walk(self, element, node, values):
+        """ Visit children of element matching node's steps, in document order, recording the first value found """
+        for child in element:
+            for attribute, value, child_node in node.children.get(child.tag, ()):
+                if attribute is not None:
+                    if value is None and child.get(attribute) is None:
+                        continue
+                    if value is not None and child.get(attribute) != value:
+                        continue
+                for preferred_name, fallback_attribute in child_node.fields:
+                    if values.get(preferred_name) is None:
+                        found = child.text
+                        if found is None and fallback_attribute is not None:
+                            found = child.get(fallback_attribute)
+                        values[preferred_name] = found
+                if child_node.children:
+                    self._walk(child, child_node, values)
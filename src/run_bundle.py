@@ -0,0 +1,84 @@
+# run_bundle.py
+""" One tar.gz of every object an export run saves, with a JSON manifest of their ids, md5 checksums and
+    missing required fields, so a whole export can be taken with one download,
+    and two runs compared by their manifests alone.
+    Objects are added as they are processed, so the only copy kept is the compressed one on disk.
+    The manifest is the last member, as it is only complete once every object has been added. """
+
+from collections import namedtuple
+from datetime import timezone
+from hashlib import md5
+from io import BytesIO
+import json
+import re
+import tarfile
+from file_system_utilities import create_directory, delete_file, get_full_path_file_name
+
+MANIFEST_NAME = 'manifest.json'
+COMPRESS_LEVEL = 6  # tarfile's default of 9 takes several times as long, for very little less on xml
+
+RUN_BUNDLE_NAME_PATTERN = re.compile(r'web_kiosk_export_[a-z]+_(\d{8}T\d{6}Z)\.tar\.gz$')
+
+bundled_object = namedtuple('bundled_object', ['object_id', 'file_name', 'md5_checksum', 'size', 'missing_fields'])
+
+
+def get_run_bundle_file_name(mode, export_started):
+    """ Name the bundle of one export, e.g. web_kiosk_export_full_20201018T020000Z.tar.gz """
+    return 'web_kiosk_export_' + mode + '_' + export_started.strftime('%Y%m%dT%H%M%SZ') + '.tar.gz'
+
+
+def get_old_run_bundle_file_names(file_names, keep):
+    """ Return those of file_names that are run bundles older than the newest keep of them (of any mode) """
+    run_bundle_file_names = sorted((file_name for file_name in file_names if RUN_BUNDLE_NAME_PATTERN.match(file_name)),
+                                   key=lambda file_name: RUN_BUNDLE_NAME_PATTERN.match(file_name).group(1))
+    return run_bundle_file_names[:-keep] if keep > 0 else []
+
+
+class RunBundle():
+    """ Add each object's xml with add, then close to write the manifest and finish the archive.
+        export_started (UTC) is recorded in the manifest, and used as every member's modified time. """
+    def __init__(self, folder_name, file_name, mode, export_started):
+        create_directory(folder_name)
+        self.folder_name = folder_name
+        self.file_name = file_name
+        self.full_path_file_name = get_full_path_file_name(folder_name, file_name)
+        self.mode = mode
+        self.export_started = export_started
+        self.objects = []
+        self._modified_time = export_started.replace(tzinfo=timezone.utc).timestamp()
+        self._tar_file = tarfile.open(self.full_path_file_name, 'w:gz', compresslevel=COMPRESS_LEVEL)
+
+    def add(self, object_id, xml_as_bytes, missing_fields):
+        """ Add one object, saved as object_id.xml, just as it is uploaded on its own """
+        file_name = object_id + '.xml'
+        self._add_member(file_name, xml_as_bytes)
+        self.objects.append(bundled_object(object_id, file_name, md5(xml_as_bytes).hexdigest(), len(xml_as_bytes),
+                                           [missing.field for missing in missing_fields]))
+
+    def close(self):
+        """ Add the manifest, after the objects, and finish the archive """
+        if self._tar_file is None:
+            return
+        manifest = {
+            'mode': self.mode,
+            'export_started': self.export_started.isoformat(),
+            'object_count': len(self.objects),
+            'objects': [bundled._asdict() for bundled in self.objects]
+        }
+        self._add_member(MANIFEST_NAME, json.dumps(manifest, indent=2).encode('utf-8'))
+        self._tar_file.close()
+        self._tar_file = None
+
+    def delete(self):
+        """ Remove the archive from disk, finished or not """
+        if self._tar_file is not None:
+            self._tar_file.close()
+            self._tar_file = None
+        delete_file(self.folder_name, self.file_name)
+
+    def _add_member(self, file_name, content):
+        member = tarfile.TarInfo(file_name)
+        member.size = len(content)
+        member.mtime = self._modified_time
+        member.mode = 0o644
+        self._tar_file.addfile(member, BytesIO(content))
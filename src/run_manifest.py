@@ -0,0 +1,125 @@
+# run_manifest.py
+""" Keep track of which objects from a composite export have been processed,
+    so a run that stops part way through (for example at the Lambda timeout)
+    can be resumed without redoing completed work. """
+
+import json
+import os
+import threading
+from file_system_utilities import create_directory, delete_file, get_full_path_file_name
+
+
+class LocalFileManifestStore():
+    """ Save the manifest as a json file on local disk """
+    def __init__(self, folder_name, file_name):
+        self.folder_name = folder_name
+        self.file_name = file_name
+
+    def load(self):
+        full_path_file_name = get_full_path_file_name(self.folder_name, self.file_name)
+        try:
+            with open(full_path_file_name, 'r') as input_source:
+                return json.load(input_source)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save(self, manifest):
+        create_directory(self.folder_name)
+        full_path_file_name = get_full_path_file_name(self.folder_name, self.file_name)
+        with open(full_path_file_name + '.part', 'w') as output_file:
+            json.dump(manifest, output_file)
+        os.replace(full_path_file_name + '.part', full_path_file_name)
+
+    def delete(self):
+        delete_file(self.folder_name, self.file_name)
+
+
+class S3ManifestStore():
+    """ Save the manifest as a json object in S3, so it outlives the Lambda container """
+    def __init__(self, bucket, key):
+        import boto3
+        self.bucket = bucket
+        self.key = key
+        self.client = boto3.client('s3')
+
+    def load(self):
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.key)
+            return json.loads(response['Body'].read().decode('utf-8'))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return {}
+            raise
+
+    def save(self, manifest):
+        self.client.put_object(Bucket=self.bucket, Key=self.key, Body=json.dumps(manifest).encode('utf-8'))
+
+    def delete(self):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key)
+
+
+class NoManifestStore():
+    """ Don't save the manifest, for runs which should neither resume nor be resumed, like reprocessing objects """
+    def load(self):
+        return {}
+
+    def save(self, manifest):
+        pass
+
+    def delete(self):
+        pass
+
+
+def get_manifest_store(manifest_config):
+    """ Return the manifest store described by config['run_manifest'] """
+    if manifest_config['backend'] == 's3':
+        return S3ManifestStore(manifest_config['s3-bucket'], manifest_config['s3-key'])
+    return LocalFileManifestStore(manifest_config['folder_name'], manifest_config['file_name'])
+
+
+class RunManifest():
+    """ Object ids processed so far for one composite export, identified by its md5 checksum.
+        An unfinished manifest for the same composite is picked up where it left off;
+        anything else starts fresh. """
+    def __init__(self, store, composite_identity, checkpoint_interval=100):
+        self.store = store
+        self.composite_identity = composite_identity
+        self.checkpoint_interval = checkpoint_interval
+        self._lock = threading.Lock()
+        self._unsaved_count = 0
+        saved_manifest = store.load()
+        if self.is_resumable(saved_manifest, composite_identity):
+            self.processed_object_ids = set(saved_manifest['processed_object_ids'])
+            print('Resuming run.', len(self.processed_object_ids), 'objects were already processed.')
+        else:
+            self.processed_object_ids = set()
+
+    @staticmethod
+    def is_resumable(saved_manifest, composite_identity):
+        """ True if saved_manifest is an unfinished run over the same composite export """
+        return saved_manifest.get('composite_identity') == composite_identity \
+            and not saved_manifest.get('complete', True)
+
+    def is_processed(self, object_id):
+        with self._lock:
+            return object_id in self.processed_object_ids
+
+    def mark_processed(self, object_id):
+        """ Record object_id as done, saving a checkpoint every checkpoint_interval objects """
+        with self._lock:
+            self.processed_object_ids.add(object_id)
+            self._unsaved_count += 1
+            checkpoint_due = self._unsaved_count >= self.checkpoint_interval
+        if checkpoint_due:
+            self.save()
+
+    def save(self, complete=False):
+        with self._lock:
+            manifest = {
+                'composite_identity': self.composite_identity,
+                'complete': complete,
+                'processed_object_ids': sorted(self.processed_object_ids)
+            }
+            self._unsaved_count = 0
+            self.store.save(manifest)
@@ -0,0 +1,225 @@
+# run_metrics.py
+""" Timings and counts for one run, emitted at the end as a single JSON summary
+    (optionally in CloudWatch embedded metric format, so CloudWatch turns it into metrics).
+    Every module records into the current run's RunMetrics through get_run_metrics(), from any thread.
+    Per-object tracing calls each trace hook; with no hooks added, callers skip it after one falsy check. """
+
+from bisect import bisect_left
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+import json
+import threading
+import time
+
+# Upper bounds, in milliseconds, of the buckets API call latencies are counted in.  Anything slower is counted last.
+LATENCY_BUCKETS_MILLISECONDS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+DEFAULT_NAMESPACE = 'MarbleWebKioskExport'
+
+
+class LatencyHistogram():
+    """ Count, total, maximum and bucketed distribution of one kind of call's latency """
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MILLISECONDS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS_MILLISECONDS, seconds * 1000)] += 1
+
+    def get_percentile_milliseconds(self, percentile):
+        """ Upper bound of the bucket holding the given percentile (or the maximum, if that is lower) """
+        target = self.count * percentile / 100
+        running_count = 0
+        for bucket_number, bucket_count in enumerate(self.buckets):
+            running_count += bucket_count
+            if running_count >= target and bucket_count:
+                if bucket_number < len(LATENCY_BUCKETS_MILLISECONDS):
+                    return min(LATENCY_BUCKETS_MILLISECONDS[bucket_number], self.max_seconds * 1000)
+                break
+        return self.max_seconds * 1000
+
+    def get_summary(self):
+        labels = ['<=' + str(bound) + 'ms' for bound in LATENCY_BUCKETS_MILLISECONDS]
+        labels.append('>' + str(LATENCY_BUCKETS_MILLISECONDS[-1]) + 'ms')
+        return OrderedDict([
+            ('count', self.count),
+            ('total_seconds', round(self.total_seconds, 3)),
+            ('mean_milliseconds', round(self.total_seconds * 1000 / self.count, 1) if self.count else 0),
+            ('p50_milliseconds', round(self.get_percentile_milliseconds(50), 1)),
+            ('p90_milliseconds', round(self.get_percentile_milliseconds(90), 1)),
+            ('p99_milliseconds', round(self.get_percentile_milliseconds(99), 1)),
+            ('max_milliseconds', round(self.max_seconds * 1000, 1)),
+            ('buckets', OrderedDict((label, count) for label, count in zip(labels, self.buckets) if count))
+        ])
+
+
+class QueueDepth():
+    """ How full one pipeline queue was, sampled each time an item is added to it """
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+
+    def add(self, depth):
+        self.count += 1
+        self.total += depth
+        self.maximum = max(self.maximum, depth)
+
+    def get_summary(self):
+        return OrderedDict([
+            ('samples', self.count),
+            ('mean', round(self.total / self.count, 1) if self.count else 0),
+            ('max', self.maximum)
+        ])
+
+
+class RunMetrics():
+    """ Stage durations, counters and API call latencies for one run """
+    def __init__(self):
+        self.started = time.time()
+        self.stage_seconds = defaultdict(float)
+        self.counters = Counter()
+        self.latencies = defaultdict(LatencyHistogram)
+        self.queue_depths = defaultdict(QueueDepth)
+        self.trace_hooks = []  # functions called as hook(event, object_id, details)
+        self._lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        """ Add amount to the counter called name """
+        with self._lock:
+            self.counters[name] += amount
+
+    def add_stage_time(self, stage, seconds):
+        """ Add seconds to the time spent in stage """
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+
+    @contextmanager
+    def time_stage(self, stage):
+        """ Add the time taken by the with block to stage """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, time.perf_counter() - start)
+
+    def add_latency(self, call, seconds):
+        """ Record how long one call (e.g. "drive.files.create") took """
+        with self._lock:
+            self.latencies[call].add(seconds)
+
+    @contextmanager
+    def time_call(self, call):
+        """ Record the time taken by the with block as one call's latency """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_latency(call, time.perf_counter() - start)
+
+    def add_queue_depth(self, queue, depth):
+        """ Record how many items were waiting in a pipeline queue (e.g. "fetch") just after one was added """
+        with self._lock:
+            self.queue_depths[queue].add(depth)
+
+    def add_trace_hook(self, hook):
+        """ Call hook(event, object_id, details) for each traced step of each object """
+        self.trace_hooks.append(hook)
+
+    def trace(self, event, object_id, **details):
+        """ Pass one step of one object to every trace hook.
+            Callers check "if metrics.trace_hooks:" first, so nothing is built when tracing is off. """
+        for hook in self.trace_hooks:
+            hook(event, object_id, details)
+
+    def get_summary(self):
+        """ Everything recorded so far, as a dictionary ready to be written as JSON """
+        with self._lock:
+            return OrderedDict([
+                ('elapsed_seconds', round(time.time() - self.started, 3)),
+                ('stage_seconds', OrderedDict((stage, round(seconds, 3))
+                                              for stage, seconds in sorted(self.stage_seconds.items()))),
+                ('counters', OrderedDict(sorted(self.counters.items()))),
+                ('latencies', OrderedDict((call, histogram.get_summary())
+                                          for call, histogram in sorted(self.latencies.items()))),
+                ('queue_depths', OrderedDict((queue, depth.get_summary())
+                                             for queue, depth in sorted(self.queue_depths.items()))),
+                ('peak_memory_mb', _get_peak_memory_mb())
+            ])
+
+    def get_embedded_metrics(self, namespace=DEFAULT_NAMESPACE, dimensions=None):
+        """ The summary in CloudWatch embedded metric format: stage times, counters, API call counts and latencies
+            become metrics, and everything else stays in the log entry for CloudWatch Logs Insights """
+        dimensions = dimensions or {}
+        summary = self.get_summary()
+        values = OrderedDict([('ElapsedSeconds', (summary['elapsed_seconds'], 'Seconds')),
+                              ('PeakMemoryMB', (summary['peak_memory_mb'], 'Megabytes'))])
+        for stage, seconds in summary['stage_seconds'].items():
+            values[_get_metric_name(stage) + 'Seconds'] = (seconds, 'Seconds')
+        for name, value in summary['counters'].items():
+            values[_get_metric_name(name)] = (value, 'Bytes' if name.startswith('bytes') else 'Count')
+        for call, latency in summary['latencies'].items():
+            values[_get_metric_name(call) + 'Calls'] = (latency['count'], 'Count')
+            values[_get_metric_name(call) + 'P90Milliseconds'] = (latency['p90_milliseconds'], 'Milliseconds')
+        for queue, depth in summary['queue_depths'].items():
+            values[_get_metric_name(queue) + 'QueueMaxDepth'] = (depth['max'], 'Count')
+        entry = OrderedDict([('_aws', {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (value, unit) in values.items()]
+            }]
+        })])
+        entry.update(dimensions)
+        entry.update((name, value) for name, (value, unit) in values.items())
+        entry['summary'] = summary
+        return entry
+
+    def emit(self, embedded_metric_format=False, namespace=DEFAULT_NAMESPACE, dimensions=None):
+        """ Print the summary as one line of JSON, which is one log entry in CloudWatch """
+        if embedded_metric_format:
+            entry = self.get_embedded_metrics(namespace, dimensions)
+        else:
+            entry = OrderedDict([('run_metrics', self.get_summary())])
+            entry.update(dimensions or {})
+        print(json.dumps(entry))
+        return entry
+
+
+_run_metrics = RunMetrics()
+
+
+def start_run_metrics():
+    """ Start recording a new run, replacing whatever was recorded for the last one (e.g. on a warm Lambda) """
+    global _run_metrics
+    _run_metrics = RunMetrics()
+    return _run_metrics
+
+
+def get_run_metrics():
+    """ The current run's RunMetrics """
+    return _run_metrics
+
+
+def print_trace(event, object_id, details):
+    """ Trace hook which prints each step as a line of JSON """
+    print(json.dumps(dict(details, trace=event, object_id=object_id, time=round(time.time(), 3))))
+
+
+def _get_metric_name(name):
+    """ "drive.files.create" or "uploads_created" -> "DriveFilesCreate" or "UploadsCreated" """
+    return ''.join(word[:1].upper() + word[1:] for word in name.replace('.', '_').split('_'))
+
+
+def _get_peak_memory_mb():
+    """ Peak resident memory of this process, or None where the resource module isn't available """
+    try:
+        import resource
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # kilobytes on Linux
@@ -1,14 +1,77 @@
 # save_to_google_team_drive.py
 """ Saves a file to a Google Team Drive, in a given parent folder """
 
+from collections import namedtuple
+from io import BytesIO
+import json
 import os
-import sys
+import threading
+import httplib2
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp, Request
+from googleapiclient.discovery import build_from_document
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, MediaIoBaseUpload
+from drive_rate_controller import DriveRateController, is_rate_limit_error
+from run_metrics import get_run_metrics
+
 where_i_am = os.path.dirname(os.path.realpath(__file__))
-sys.path.append(where_i_am)
-sys.path.append(where_i_am + "/dependencies")
-from google.oauth2 import service_account  # noqa: E402
-from googleapiclient.discovery import build  # noqa: E402
-from googleapiclient.http import MediaFileUpload  # noqa: E402
+
+drive_file = namedtuple('drive_file', ['file_id', 'md5_checksum', 'modified_time'])
+
+# Static copy of https://www.googleapis.com/discovery/v1/apis/drive/v3/rest, so we never fetch it at run time
+DISCOVERY_DOCUMENT_FILE_NAME = os.path.join(where_i_am, 'drive_v3_discovery.json')
+_discovery_document = None
+# Anything smaller than this is sent in a single request rather than through a resumable upload session
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+BATCH_SIZE = 100  # the most requests Drive takes in one batch
+_discovery_document_lock = threading.Lock()
+
+
+class DriveSession():
+    """ Everything needed to talk to Google Drive, created once per invocation and reused by every call:
+        refreshed credentials, a keep-alive http connection, and one service built from the bundled
+        discovery document.
+        httplib2 connections are not thread safe, so each thread gets its own connection and service.
+        Pass api_root_url to send requests somewhere other than https://www.googleapis.com/,
+        such as the fake Drive in benchmark/fake_services.py.
+        Every call goes through one DriveRateController, set up with rate_limit (its keyword arguments) if given. """
+    def __init__(self, google_credentials, api_root_url='', rate_limit=None):
+        self.credentials = _get_credentials_from_service_account_info(google_credentials)
+        self.rate_controller = DriveRateController(**(rate_limit or {}))
+        self._thread_local = threading.local()
+        self._discovery_document = _get_discovery_document(api_root_url)
+        self.credentials.refresh(Request(self._get_http()))
+
+    @property
+    def service(self):
+        """ Drive service for the calling thread """
+        if not hasattr(self._thread_local, 'service'):
+            authorized_http = AuthorizedHttp(self.credentials, http=self._get_http())
+            self._thread_local.service = build_from_document(self._discovery_document, http=authorized_http)
+        return self._thread_local.service
+
+    def _get_http(self):
+        """ Keep-alive http connection for the calling thread """
+        if not hasattr(self._thread_local, 'http'):
+            self._thread_local.http = httplib2.Http()  # keeps connections to each host open between requests
+        return self._thread_local.http
+
+
+def _get_discovery_document(api_root_url=''):
+    """ Read the bundled Drive v3 discovery document once per process, pointed at api_root_url if given.
+        This is kept as text because build_from_document modifies the dictionary it is given. """
+    global _discovery_document
+    with _discovery_document_lock:
+        if _discovery_document is None:
+            with open(DISCOVERY_DOCUMENT_FILE_NAME, 'r') as input_source:
+                _discovery_document = input_source.read()
+    if not api_root_url:
+        return _discovery_document
+    document = json.loads(_discovery_document)
+    document['rootUrl'] = api_root_url
+    document['baseUrl'] = api_root_url + document['servicePath']
+    return json.dumps(document)
 
 
 def _get_credentials_from_service_account_info(google_credentials):
@@ -21,26 +84,104 @@ def _get_credentials_from_service_account_info(google_credentials):
     return(credentials)
 
 
-def save_file_to_google_team_drive(google_credentials, drive_id, parent_folder_id, local_folder_name, file_name):
-    """ If file exists, update it, else do initial upload """
-    # credentials = _get_credentials_from_service_account_file()
-    credentials = _get_credentials_from_service_account_info(google_credentials)
-    file_id = _get_file_id_given_filename(credentials, drive_id, parent_folder_id, file_name)
+def save_file_to_google_team_drive(drive_session, drive_id, parent_folder_id, local_folder_name, file_name,
+                                   folder_index=None, mime_type='text/xml'):
+    """ If file exists, update it, else do initial upload
+        If a folder_index (from get_folder_index) is passed, it is used instead of querying Drive,
+        and is kept up to date with the file saved. """
+    if folder_index is None:
+        file_id = _get_file_id_given_filename(drive_session, drive_id, parent_folder_id, file_name)
+    else:
+        file_id = _get_file_id_given_folder_index(folder_index, file_name)
     if file_id > "":
-        _update_existing_file(credentials, parent_folder_id, file_id, local_folder_name, file_name)
+        _update_existing_file(drive_session, parent_folder_id, file_id, local_folder_name, file_name, mime_type,
+                              folder_index=folder_index)
     else:
-        file_id = _upload_new_file(credentials, drive_id, parent_folder_id, local_folder_name, file_name)
+        file_id = _upload_new_file(drive_session, drive_id, parent_folder_id, local_folder_name, file_name, mime_type,
+                                   folder_index=folder_index)
     return(file_id)
 
 
-def _get_file_id_given_filename(credentials, drive_id, parent_folder_id, file_name):
-    """ Find a File_Id given drive, parent folder, and file_name """
+def save_bytes_to_google_team_drive(drive_session, drive_id, parent_folder_id, file_name, content,
+                                    folder_index=None, mime_type='text/xml'):
+    """ Same as save_file_to_google_team_drive, but uploads content straight from memory """
+    if folder_index is None:
+        file_id = _get_file_id_given_filename(drive_session, drive_id, parent_folder_id, file_name)
+    else:
+        file_id = _get_file_id_given_folder_index(folder_index, file_name)
+    media = MediaIoBaseUpload(BytesIO(content),
+                              mimetype=mime_type,
+                              resumable=len(content) > RESUMABLE_UPLOAD_THRESHOLD)
+    if file_id > "":
+        _update_file_media(drive_session, file_id, media, folder_index)
+    else:
+        file_id = _create_file_with_media(drive_session, drive_id, parent_folder_id, file_name, media, mime_type,
+                                          folder_index)
+    return(file_id)
+
+
+def get_folder_index(drive_session, drive_id, parent_folder_id):
+    """ Page through the parent folder once, returning a dictionary of file name -> drive_file """
+    service = drive_session.service
+    folder_index = {}
+    nextPageToken = ""
+    query_string = "'" + parent_folder_id + "' in parents and trashed = False"
+    while True:
+        request = service.files().list(
+            pageSize=1000,  # 1000 is the maximum pageSize allowed
+            pageToken=nextPageToken,
+            fields="nextPageToken, incompleteSearch, files(id, name, md5Checksum, modifiedTime)",
+            supportsAllDrives="true",  # required if writing to a team drive
+            driveId=drive_id,
+            includeItemsFromAllDrives="true",  # required if querying from a team drive
+            corpora="drive",
+            q=query_string)
+        results = _execute(drive_session, request, 'drive.files.list')
+        for item in results.get('files', []):
+            if item['name'] not in folder_index:  # if more than one file exists, we'll just keep the first one
+                _add_to_folder_index(folder_index, item)
+        nextPageToken = results.get('nextPageToken', "")
+        if nextPageToken == "":
+            break
+    print('Indexed', len(folder_index), 'files in Google Team Drive folder', parent_folder_id)
+    return folder_index
+
+
+def _get_file_id_given_folder_index(folder_index, file_name):
+    """ Find a File_Id given a folder_index built by get_folder_index """
     file_id = ""
-    service = build('drive', 'v3', credentials=credentials)
+    if file_name in folder_index:
+        file_id = folder_index[file_name].file_id
+    return file_id
+
+
+def _add_to_folder_index(folder_index, file):
+    """ Record a file resource returned by the Drive API in the folder_index """
+    folder_index[file['name']] = drive_file(file['id'], file.get('md5Checksum', ''), file.get('modifiedTime', ''))
+
+
+def _get_file_id_given_filename(drive_session, drive_id, parent_folder_id, file_name):
+    """ Find a File_Id given drive, parent folder, and file_name """
+    request = _get_file_name_request(drive_session, drive_id, parent_folder_id, file_name)
+    return _get_first_file_id(_execute(drive_session, request, 'drive.files.list'))
+
+
+def get_file_ids_given_filenames(drive_session, drive_id, parent_folder_id, file_names):
+    """ _get_file_id_given_filename for each of file_names, BATCH_SIZE to an http request.
+        Returns a dictionary of file name -> file id ("" if there is no such file), leaving out any that failed. """
+    requests = {file_name: _get_file_name_request(drive_session, drive_id, parent_folder_id, file_name)
+                for file_name in file_names}
+    return {file_name: _get_first_file_id(result)
+            for file_name, result in execute_batch(drive_session, requests, 'drive.batch.files.list').items()
+            if not isinstance(result, HttpError)}
+
+
+def _get_file_name_request(drive_session, drive_id, parent_folder_id, file_name):
+    service = drive_session.service
     nextPageToken = ""
     query_string = "name='" + file_name + "'" + " and '" + parent_folder_id + "' in parents"
     query_string += " and trashed = False"
-    results = service.files().list(
+    return service.files().list(
         pageSize=1000,  # 1000 is the maximum pageSize allowed
         pageToken=nextPageToken,
         fields="kind, nextPageToken, incompleteSearch, files(id, name, mimeType, modifiedTime, parents)",
@@ -48,7 +189,12 @@ def _get_file_id_given_filename(credentials, drive_id, parent_folder_id, file_na
         driveId=drive_id,
         includeItemsFromAllDrives="true",  # required if querying from a team drive
         corpora="drive",
-        q=query_string).execute()
+        q=query_string)
+
+
+def _get_first_file_id(results):
+    """ The id of the first file in a files.list response, or "" if there are none """
+    file_id = ""
     items = results.get('files', [])
     if items:
         for item in items:
@@ -58,35 +204,57 @@ def _get_file_id_given_filename(credentials, drive_id, parent_folder_id, file_na
     return file_id
 
 
-def _update_existing_file(credentials, parent_folder_id, file_id, local_folder_name, file_name, mime_type='text/xml'):
+def _update_existing_file(drive_session, parent_folder_id, file_id, local_folder_name, file_name, mime_type='text/xml',
+                          folder_index=None):
     """ upload new content for existing file_id """
     full_path_file_name = _get_full_path_file_name(local_folder_name, file_name)
     media = MediaFileUpload(full_path_file_name,
                             mimetype=mime_type,
                             resumable=True)  # 'image/jpeg'
-    drive_service = build('drive', 'v3', credentials=credentials)
-    file = drive_service.files().update(fileId=file_id,
-                                        media_body=media,
-                                        supportsAllDrives=True,
-                                        fields='id').execute()
+    return _update_file_media(drive_session, file_id, media, folder_index)
+
+
+def _update_file_media(drive_session, file_id, media, folder_index=None):
+    """ Replace the content of file_id with media """
+    drive_service = drive_session.service
+    request = drive_service.files().update(fileId=file_id,
+                                           media_body=media,
+                                           supportsAllDrives=True,
+                                           fields='id, name, md5Checksum, modifiedTime')
+    file = _execute(drive_session, request, 'drive.files.update')
+    get_run_metrics().count('uploads_updated')
+    if folder_index is not None:
+        _add_to_folder_index(folder_index, file)
     return(file.get('id'))
 
 
-def _upload_new_file(credentials, drive_id, parent_folder_id, local_folder_name, file_name, mime_type='text/xml'):
+def _upload_new_file(drive_session, drive_id, parent_folder_id, local_folder_name, file_name, mime_type='text/xml',
+                     folder_index=None):
     """ Upload an all new file (note, this will produce duplicates,
         so check for existance before calling this) """
     full_path_file_name = _get_full_path_file_name(local_folder_name, file_name)
-    file_metadata = {'name': file_name, 'mimeType': mime_type,
-                     'teamDriveId': drive_id,
-                     'parents': [parent_folder_id]}
     media = MediaFileUpload(full_path_file_name,
                             mimetype=mime_type,
                             resumable=True)  # 'image/jpeg'
-    drive_service = build('drive', 'v3', credentials=credentials)
-    file = drive_service.files().create(body=file_metadata,
-                                        media_body=media,
-                                        supportsAllDrives=True,
-                                        fields='id').execute()
+    return _create_file_with_media(drive_session, drive_id, parent_folder_id, file_name, media, mime_type,
+                                   folder_index)
+
+
+def _create_file_with_media(drive_session, drive_id, parent_folder_id, file_name, media, mime_type,
+                            folder_index=None):
+    """ Create file_name in parent_folder_id with media as its content """
+    file_metadata = {'name': file_name, 'mimeType': mime_type,
+                     'teamDriveId': drive_id,
+                     'parents': [parent_folder_id]}
+    drive_service = drive_session.service
+    request = drive_service.files().create(body=file_metadata,
+                                           media_body=media,
+                                           supportsAllDrives=True,
+                                           fields='id, name, md5Checksum, modifiedTime')
+    file = _execute(drive_session, request, 'drive.files.create')
+    get_run_metrics().count('uploads_created')
+    if folder_index is not None:
+        _add_to_folder_index(folder_index, file)
     return(file.get('id'))
 
 
@@ -98,9 +266,80 @@ def _get_full_path_file_name(local_folder_name, file_name):
     return full_path_file_name
 
 
-def _delete_existing_file(credentials, file_id):
+def _delete_existing_file(drive_session, file_id):
     """ Delete an existing file given file_id """
     # note: user needs "organizer" privilege on the parent folder in order to delete
-    drive_service = build('drive', 'v3', credentials=credentials)
-    drive_service.files().delete(fileId=file_id,
-                                 supportsAllDrives=True).execute()
+    drive_service = drive_session.service
+    _execute(drive_session, drive_service.files().delete(fileId=file_id, supportsAllDrives=True),
+             'drive.files.delete')
+
+
+def delete_files(drive_session, file_ids):
+    """ Delete each of file_ids for good, BATCH_SIZE to an http request.
+        Returns a dictionary of file id -> HttpError for any that could not be deleted. """
+    drive_service = drive_session.service
+    requests = {file_id: drive_service.files().delete(fileId=file_id, supportsAllDrives=True) for file_id in file_ids}
+    return _get_failures(execute_batch(drive_session, requests, 'drive.batch.files.delete'))
+
+
+def trash_files(drive_session, file_ids):
+    """ Move each of file_ids to the trash (from which it can be restored for 30 days), BATCH_SIZE to an http request.
+        Returns a dictionary of file id -> HttpError for any that could not be trashed. """
+    drive_service = drive_session.service
+    requests = {file_id: drive_service.files().update(fileId=file_id, body={'trashed': True}, supportsAllDrives=True,
+                                                      fields='id')
+                for file_id in file_ids}
+    return _get_failures(execute_batch(drive_session, requests, 'drive.batch.files.update'))
+
+
+def _get_failures(results):
+    return {key: result for key, result in results.items() if isinstance(result, HttpError)}
+
+
+def execute_batch(drive_session, requests, call):
+    """ Execute requests (a dictionary of key -> Drive API request) through Drive's batch endpoint,
+        BATCH_SIZE to an http request, within our quota.  Each batch is recorded as one call.
+        Returns a dictionary of key -> response, or the HttpError that request failed with.
+        Requests Drive throttles are sent again, in the batch's next try, once the rate controller has backed off. """
+    results = {}
+    keys = list(requests)
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = _DriveBatch(drive_session, {key: requests[key] for key in keys[start:start + BATCH_SIZE]}, results)
+        try:
+            drive_session.rate_controller.execute(batch, call, cost=len(batch.pending))
+        except HttpError as e:  # still throttled after every retry, or the whole batch failed
+            results.update((key, e) for key in batch.pending)
+    return results
+
+
+class _DriveBatch():
+    """ One batch http request, which can be executed again to send just the requests not done yet """
+    def __init__(self, drive_session, requests, results):
+        self.drive_session = drive_session
+        self.pending = requests
+        self.results = results
+
+    def execute(self):
+        """ Send the pending requests, putting each result in results unless Drive throttled that request.
+            If it throttled any, raise the first of those errors so the rate controller backs off and tries again. """
+        throttled = []
+
+        def save_result(key, response, exception):
+            if exception is not None:
+                if is_rate_limit_error(exception):
+                    throttled.append(exception)
+                    return
+                get_run_metrics().count('drive_errors_' + str(exception.resp.status))
+            self.results[key] = response if exception is None else exception
+            del self.pending[key]
+        batch = self.drive_session.service.new_batch_http_request(callback=save_result)
+        for key, request in self.pending.items():
+            batch.add(request, request_id=key)
+        batch.execute()
+        if throttled:
+            raise throttled[0]
+
+
+def _execute(drive_session, request, call):
+    """ Execute a Drive API request within our quota, recording its latency as call, and counting errors by status """
+    return drive_session.rate_controller.execute(request, call)
@@ -1,40 +1,47 @@
 # send_notification_email.py
 """ This routine sends and email alerting the user of missing fields. """
 
-import os
-import sys
-where_i_am = os.path.dirname(os.path.realpath(__file__))
-sys.path.append(where_i_am)
-sys.path.append(where_i_am + "/dependencies")
-import boto3  # noqa: E402
-from botocore.errorfactory import ClientError  # noqa: E402
-from sentry_sdk import capture_exception  # noqa: E402
+from html import escape
+from sentry_sdk import capture_message
+from run_metrics import get_run_metrics
 
 
-def create_and_send_email_notification(missing_fields, notification_email_address, sender):
+def create_and_send_email_notification(missing_field_report, notification_email_address, sender):
     """ Create and then send an email alerting someone about missing fields """
     recipients = notification_email_address.split(",")
     subject = "Metadata is missing required fields"
-    body_html = _create_email_html_body(missing_fields)
+    body_html = _create_email_html_body(missing_field_report)
     body_text = ''
     _send_email(sender, recipients, subject, body_html, body_text)
 
 
-def _create_email_html_body(missing_fields):
-    """ Create the body of the email in html format """
-    body_html = """<html>
+def _create_email_html_body(missing_field_report):
+    """ Create the body of the email in html format: a count for each missing field,
+        then the fields missing from each object """
+    parts = ["""<html>
     <head></head>
     <body>
     <h1>Missing required fields when processing metadata</h1>
-    <p> """ + missing_fields + """</p>
-    </body>
-    </html>"""
-    body_html = body_html.replace('\n', '<br/>')
-    return body_html
+    <h2>Summary</h2>
+    <ul>"""]
+    for field, details in missing_field_report.get_summary().items():
+        parts.append('<li>' + escape(field) + ' - missing from ' + str(details['count'])
+                     + ' object(s), at xpath location ' + escape(details['xpath']) + '</li>')
+    parts.append('</ul>\n    <h2>Details</h2>')
+    for object_id, missing_fields in missing_field_report.get_object_lines():
+        parts.append('<p>' + escape(object_id) + ' is missing the following required field(s):<br/>')
+        parts.append('<br/>'.join(escape(field) + ' - at xpath location ' + escape(xpath)
+                                  for field, xpath in missing_fields))
+        parts.append('</p>')
+    parts.append("""</body>
+    </html>""")
+    return '\n'.join(parts)
 
 
 def _send_email(sender, recipients, subject, body_html, body_text):
     """ Actually send the email. """
+    import boto3  # only loaded on runs that find missing fields
+    from botocore.errorfactory import ClientError
     AWS_REGION = "us-east-1"
     CHARSET = "UTF-8"
     client = boto3.client('ses', region_name=AWS_REGION)
@@ -50,14 +57,16 @@ def _send_email(sender, recipients, subject, body_html, body_text):
     elif body_text > '':
         email_message_json['Body']['Text'] = {'Charset': CHARSET, 'Data': body_text}
     try:
-        response = client.send_email(
-            Destination={'ToAddresses': recipients},
-            Message=email_message_json,
-            Source=sender
-        )
+        with get_run_metrics().time_call('ses.send_email'):
+            response = client.send_email(
+                Destination={'ToAddresses': recipients},
+                Message=email_message_json,
+                Source=sender
+            )
     except ClientError as e:
-        capture_exception(e.response['Error']['Message'])
+        capture_message('Unable to send notification email: ' + e.response['Error']['Message'])
     else:
+        get_run_metrics().count('emails_sent')
         print("Email sent! Message ID:"),
         print(response['MessageId'])
     return
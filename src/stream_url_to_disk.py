@@ -0,0 +1,311 @@
+# stream_url_to_disk.py
+""" Stream the response of a URL to a file on disk in fixed-size chunks,
+    so memory use stays flat no matter how large the response is.
+    UrlStream reads it in the same chunks without saving it, for a pipeline to parse as it arrives.
+    Responses are requested gzipped, which the repetitive xml of an export compresses several times over,
+    and decompressed as they arrive (or saved as they were sent, with keep_compressed, to be read by open_saved_file).
+    If the connection drops part way, the rest is requested with a Range from the last byte received,
+    and the whole is checked against the size the server gave.  A connection that goes quiet for timeout_seconds
+    is treated as dropped. """
+
+from collections import namedtuple, deque
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from http.client import HTTPException
+from itertools import count
+from urllib import request, error
+import gzip
+import os
+import re
+import socket
+import threading
+import time
+import zlib
+from sentry_sdk import capture_message
+from file_system_utilities import create_directory, get_full_path_file_name
+from run_metrics import get_run_metrics
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_RESUMES = 5  # in a row without receiving anything more
+DEFAULT_TIMEOUT_SECONDS = 60  # to connect, or between reads
+GZIP_MAGIC = b'\x1f\x8b'
+GZIP_WINDOW_BITS = 16 + zlib.MAX_WBITS  # for zlib to read (or write) the gzip header and trailer
+RESUMABLE_ERRORS = (HTTPException, ConnectionError, socket.timeout)  # the connection dropping part way
+
+stream_result = namedtuple('stream_result', ['path', 'size', 'status', 'elapsed_seconds', 'md5_checksum'])
+
+
+def stream_url_to_disk(url, folder_name, file_name, chunk_size=DEFAULT_CHUNK_SIZE, keep_compressed=False,
+                       max_resumes=DEFAULT_MAX_RESUMES, timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+    """ Save the response from url to folder_name/file_name, gzipped if keep_compressed and the server gzipped it.
+        Returns a stream_result rather than the payload itself, including the size and an md5 of its content
+        (decompressed, so they are the same either way).
+        status is 'ok' when content was saved, 'empty' when the response had no content,
+        or 'error' when the url could not be retrieved. """
+    create_directory(folder_name)
+    full_path_file_name = get_full_path_file_name(folder_name, file_name)
+    partial_file_name = full_path_file_name + '.part'
+    size = 0
+    status = 'error'
+    checksum = md5()
+    start_time = time.time()
+    transfer = _ResumableTransfer(url, chunk_size, max_resumes, timeout_seconds)
+    try:
+        with open(partial_file_name, 'wb') as output_file:
+            raw_file = output_file if keep_compressed else None
+            for content in transfer.iterate_content(raw_file):
+                if raw_file is None:
+                    output_file.write(content)
+                checksum.update(content)
+                size += len(content)
+        os.replace(partial_file_name, full_path_file_name)
+        status = 'ok' if size > 0 else 'empty'
+    except error.HTTPError:
+        capture_message('Unable to retrieve xml from ' + url)
+    except ConnectionRefusedError:
+        capture_message('Connection refused on url ' + url)
+    except:  # noqa E722 - intentionally ignore warning about bare except
+        capture_message('Error caught trying to process url ' + url)
+    if status == 'error':
+        _remove_partial_file(partial_file_name)
+        size = 0
+    elapsed_seconds = time.time() - start_time
+    _record_fetch(url, size, status, elapsed_seconds, transfer.received)
+    return stream_result(full_path_file_name, size, status, elapsed_seconds, checksum.hexdigest())
+
+
+class UrlStream():
+    """ The response from a URL, read a chunk at a time as it arrives rather than saved to disk.
+        Iterate it (once, e.g. as the first stage of a Pipeline) for its chunks.
+        status is None until the first chunk arrives, then 'ok'; it ends up 'empty' if there was no content,
+        or 'error' if the url could not be retrieved, even part way through. """
+    def __init__(self, url, chunk_size=DEFAULT_CHUNK_SIZE, max_resumes=DEFAULT_MAX_RESUMES,
+                 timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.max_resumes = max_resumes
+        self.timeout_seconds = timeout_seconds
+        self.size = 0
+        self.status = None
+        self.checksum = md5()
+        self.elapsed_seconds = 0
+        self._started = threading.Event()
+
+    def __iter__(self):
+        start_time = time.time()
+        transfer = _ResumableTransfer(self.url, self.chunk_size, self.max_resumes, self.timeout_seconds)
+        try:
+            for chunk in transfer.iterate_content():
+                self.checksum.update(chunk)
+                self.size += len(chunk)
+                self.status = 'ok'
+                self._started.set()
+                yield chunk
+            self.status = 'ok' if self.size > 0 else 'empty'
+        except error.HTTPError:
+            self.status = 'error'
+            capture_message('Unable to retrieve xml from ' + self.url)
+        except ConnectionRefusedError:
+            self.status = 'error'
+            capture_message('Connection refused on url ' + self.url)
+        except Exception:  # but not GeneratorExit, which is the stream being closed before its end
+            self.status = 'error'
+            capture_message('Error caught trying to process url ' + self.url)
+        finally:
+            self.elapsed_seconds = time.time() - start_time
+            if self.status is not None:  # otherwise it was closed before anything arrived
+                _record_fetch(self.url, self.size, self.status, self.elapsed_seconds, transfer.received)
+            self._started.set()
+
+    def wait_until_started(self):
+        """ Wait for the first chunk to arrive (or for the stream to end without one), then return get_result() """
+        self._started.wait()
+        return self.get_result()
+
+    def get_result(self):
+        """ A stream_result for what has been read so far.  Its path is None, as nothing is saved """
+        return stream_result(None, self.size, self.status, self.elapsed_seconds, self.checksum.hexdigest())
+
+
+class _ResumableTransfer():
+    """ The response from a URL, requested gzipped, and carried on with a Range request when the connection drops.
+        A server that answers the Range with anything but the rest of the response is treated as an error,
+        and any ETag is sent as If-Range, so a changed response is refused rather than spliced onto the old one. """
+    def __init__(self, url, chunk_size, max_resumes, timeout_seconds):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.max_resumes = max_resumes
+        self.timeout_seconds = timeout_seconds
+        self.received = 0  # bytes of the response as sent, so possibly compressed
+        self.expected_size = None  # from Content-Length or Content-Range, if the server sent either
+        self.compressed = False
+        self.etag = None
+
+    def __iter__(self):
+        """ Yield the response as it was sent, a chunk at a time, across however many requests it takes """
+        resumes = 0  # in a row, without receiving anything more
+        while True:
+            received_before = self.received
+            try:
+                with request.urlopen(self._get_request(), timeout=self.timeout_seconds) as response:
+                    self._read_headers(response)
+                    while True:
+                        chunk = response.read1(self.chunk_size)  # what has arrived, so a timeout loses none
+                        if not chunk:
+                            break
+                        self.received += len(chunk)
+                        yield chunk
+                if self.expected_size is not None and self.received != self.expected_size:
+                    raise HTTPException('Received ' + str(self.received) + ' of ' + str(self.expected_size) + ' bytes')
+                return
+            except RESUMABLE_ERRORS:
+                resumes = 1 if self.received > received_before else resumes + 1
+                if resumes > self.max_resumes:
+                    raise
+            get_run_metrics().count('fetch_resumes')
+            print('Connection dropped after', self.received, 'bytes; resuming from there')
+            time.sleep(2 ** resumes - 2)  # at once after progress, then backing off
+
+    def iterate_content(self, raw_file=None):
+        """ Yield the content of the response a chunk at a time, decompressed if it was sent gzipped,
+            first writing each chunk as sent to raw_file (if any) """
+        decompressor = None
+        for chunk in self:
+            if raw_file is not None:
+                raw_file.write(chunk)
+            if self.compressed and decompressor is None:
+                decompressor = zlib.decompressobj(GZIP_WINDOW_BITS)
+            content = chunk if decompressor is None else decompressor.decompress(chunk)
+            if content:  # an empty chunk would read as the end of the response
+                yield content
+        if decompressor is not None:
+            content = decompressor.flush()
+            if not decompressor.eof:
+                raise EOFError('Compressed response from ' + self.url + ' ended before its gzip trailer')
+            if content:
+                yield content
+
+    def _get_request(self):
+        headers = {'Accept-Encoding': 'gzip'}
+        if self.received > 0:
+            headers['Range'] = 'bytes=' + str(self.received) + '-'
+            if self.etag is not None:
+                headers['If-Range'] = self.etag
+        return request.Request(self.url, headers=headers)
+
+    def _read_headers(self, response):
+        """ Note what the response says about itself, refusing a resumed one not carrying on from our last byte """
+        if self.received == 0:
+            self.compressed = response.headers.get('Content-Encoding', '').strip().lower() == 'gzip'
+            self.etag = response.headers.get('ETag')
+            content_length = response.headers.get('Content-Length')
+            self.expected_size = int(content_length) if content_length else None
+            return
+        content_range = re.fullmatch(r'bytes (\d+)-\d+/(\d+)', response.headers.get('Content-Range', '').strip())
+        if response.status != 206 or content_range is None or int(content_range.group(1)) != self.received:
+            raise error.HTTPError(self.url, response.status, 'Unable to resume from byte ' + str(self.received),
+                                  response.headers, None)
+        self.expected_size = int(content_range.group(2))
+
+
+def stream_pages_to_disk(get_page_url, folder_name, get_page_file_name, max_workers=4, retries=2,
+                         keep_compressed=False, timeout_seconds=DEFAULT_TIMEOUT_SECONDS):
+    """ Generator which saves page 0, 1, 2... (from get_page_url(page_number)) to
+        folder_name/get_page_file_name(page_number), keeping max_workers pages downloading at once,
+        and yields a stream_result for each page in page order as soon as it is available.
+        Each page is retried up to retries times before it is reported with status 'error'.
+        This never runs out of pages: stop by closing the generator (or leaving a for loop over it),
+        which cancels anything not yet started and removes pages that were fetched but never yielded. """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque()
+    try:
+        for page_number in count():
+            pending.append(executor.submit(_stream_url_with_retries,
+                                           get_page_url(page_number),
+                                           folder_name,
+                                           get_page_file_name(page_number),
+                                           retries,
+                                           keep_compressed,
+                                           timeout_seconds))
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        for future in pending:
+            if not future.cancelled() and future.exception() is None:
+                _remove_partial_file(future.result().path)
+
+
+def _stream_url_with_retries(url, folder_name, file_name, retries, keep_compressed, timeout_seconds):
+    """ stream_url_to_disk, trying again (after a short, growing pause) if it fails """
+    for attempt in range(retries + 1):
+        if attempt > 0:
+            get_run_metrics().count('fetch_retries')
+            time.sleep(2 ** attempt)
+        result = stream_url_to_disk(url, folder_name, file_name, keep_compressed=keep_compressed,
+                                    timeout_seconds=timeout_seconds)
+        if result.status != 'error':
+            break
+    return result
+
+
+def get_saved_file_result(full_path_file_name, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Return a stream_result describing a file saved earlier (its content, if it was kept compressed),
+        or None if it is not there """
+    checksum = md5()
+    size = 0
+    try:
+        with open_saved_file(full_path_file_name) as input_file:
+            size = _copy_in_chunks(input_file, None, chunk_size, checksum)
+    except FileNotFoundError:
+        return None
+    return stream_result(full_path_file_name, size, 'ok' if size > 0 else 'empty', 0, checksum.hexdigest())
+
+
+def is_saved_file_compressed(full_path_file_name):
+    """ True if stream_url_to_disk kept this file gzipped, as it was sent """
+    with open(full_path_file_name, 'rb') as saved_file:
+        return saved_file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def open_saved_file(full_path_file_name):
+    """ Open a file saved by stream_url_to_disk to read its content, decompressing it if it was kept compressed """
+    if is_saved_file_compressed(full_path_file_name):
+        return gzip.open(full_path_file_name, 'rb')
+    return open(full_path_file_name, 'rb')
+
+
+def _copy_in_chunks(source, destination, chunk_size, checksum):
+    """ Copy from source to destination (if any) one chunk at a time, adding each chunk to checksum.
+        Returns the number of bytes copied """
+    size = 0
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if destination is not None:
+            destination.write(chunk)
+        checksum.update(chunk)
+        size += len(chunk)
+    return size
+
+
+def _record_fetch(url, size, status, elapsed_seconds, transferred):
+    metrics = get_run_metrics()
+    metrics.add_latency('web_kiosk.results', elapsed_seconds)
+    metrics.count('bytes_fetched', size)
+    metrics.count('bytes_transferred', transferred)
+    if status == 'error':
+        metrics.count('fetch_errors')
+    print('Retrieved', size, 'bytes (' + str(transferred), 'transferred) in', round(elapsed_seconds, 2),
+          'seconds from', url)
+
+
+def _remove_partial_file(partial_file_name):
+    """ Remove anything left behind by an interrupted or unused download """
+    try:
+        os.remove(partial_file_name)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,158 @@
+# xml_backend.py
+""" The XML library used to split the composite file into objects and serialize each one.
+    StdlibXmlBackend uses xml.etree.ElementTree.  LxmlXmlBackend, used when lxml is installed, parses and serializes
+    in C, and is about twice as fast.  Either gives elements supporting find(), findall(), get() and iteration,
+    which is all the rest of the code uses.
+    Objects are saved in the form ElementTree writes them, whichever backend is used, so that
+    their checksums still match what is already on the drive: both backends produce the same bytes. """
+
+import sys
+from xml.etree import ElementTree as StdlibElementTree
+from xml.etree.ElementTree import _escape_attrib
+from io import BytesIO
+from run_metrics import get_run_metrics
+from xml_manipulation import iterate_xml_records, iterate_parsed_records, serialize_xml_tree
+
+# Since we can't read the xsi information from the original xml file, it is added to each object
+SCHEMA_LOCATION = "http://www.loc.gov/METS/ http://www.loc.gov/standards/mets/mets.xsd http://purl.org/dc/terms/ \
+                 http://dublincore.org/schemas/xmls/qdc/2008/02/11/dcterms.xsd \
+                 http://www.vraweb.org/vracore4.htm http://www.loc.gov/standards/vracore/vra-strict.xsd"
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+XML_DECLARATION = b"<?xml version='1.0' encoding='utf-8'?>\n"
+# Before Python 3.8, ElementTree wrote attributes sorted by name rather than in document order
+ELEMENT_TREE_SORTS_ATTRIBUTES = sys.version_info < (3, 8)
+
+
+def get_xml_backend(name='auto'):
+    """ Return the backend called name: "stdlib", "lxml", or "auto" for lxml if it is installed """
+    if name == 'stdlib':
+        return StdlibXmlBackend()
+    if name == 'lxml':
+        return LxmlXmlBackend()
+    try:
+        return LxmlXmlBackend()
+    except ImportError:
+        return StdlibXmlBackend()
+
+
+class StdlibXmlBackend():
+    """ xml.etree.ElementTree.  Namespace prefixes for output are registered globally, with register_namespace. """
+    name = 'stdlib'
+
+    def iterate_records(self, full_path_file_name, record_name, namespace_dictionary):
+        """ Yield each record_name child of the root, filling in namespace_dictionary from the root """
+        return iterate_xml_records(full_path_file_name, record_name, namespace_dictionary)
+
+    def use_namespaces(self, namespace_dictionary):
+        """ Use the prefixes in namespace_dictionary (read from the composite file) when serializing """
+        for prefix in namespace_dictionary:
+            StdlibElementTree.register_namespace(prefix, namespace_dictionary[prefix])
+
+    def serialize_record(self, element):
+        """ Return the bytes saved for one object: the element with xsi information added to it """
+        element.set("xsi:schemaLocation", SCHEMA_LOCATION)
+        element.set("xmlns:xsi", XSI_NAMESPACE)
+        return serialize_xml_tree(StdlibElementTree.ElementTree(element))
+
+
+class LxmlXmlBackend():
+    """ lxml.  Records are parsed with its C iterparse, and serialized by moving each record's children
+        under a new root that declares our prefixes, then writing it with tostring.
+        Anything tostring would write differently from ElementTree (character references,
+        or namespaces we have no prefix for) is serialized through ElementTree instead. """
+    name = 'lxml'
+
+    def __init__(self):
+        from lxml import etree
+        self.etree = etree
+        self.prefixes = dict(StdlibElementTree._namespace_map)  # namespace -> prefix, ElementTree's defaults
+        self.nsmap = {}
+        self.namespace_dictionary = {}
+        self.stdlib_backend = None  # only needed for objects lxml can't write the way ElementTree would
+
+    def iterate_records(self, full_path_file_name, record_name, namespace_dictionary):
+        """ Yield each record_name child of the root, filling in namespace_dictionary from the root """
+        events = self.etree.iterparse(full_path_file_name, events=('start-ns', 'start', 'end'),
+                                      remove_comments=True, remove_pis=True, huge_tree=True)
+        return iterate_parsed_records(events, record_name, namespace_dictionary)
+
+    def use_namespaces(self, namespace_dictionary):
+        """ Use the prefixes in namespace_dictionary (read from the composite file) when serializing,
+            choosing the same prefix for each namespace that ElementTree.register_namespace would """
+        for prefix, namespace in namespace_dictionary.items():
+            for other_namespace, other_prefix in list(self.prefixes.items()):
+                if other_namespace == namespace or other_prefix == prefix:
+                    del self.prefixes[other_namespace]
+            self.prefixes[namespace] = prefix
+        self.nsmap = {prefix or None: namespace for namespace, prefix in self.prefixes.items()
+                      if namespace != XML_NAMESPACE}
+        if self.stdlib_backend is not None:
+            self.stdlib_backend.use_namespaces(namespace_dictionary)
+        self.namespace_dictionary = namespace_dictionary
+
+    def serialize_record(self, element):
+        """ Return the bytes saved for one object: the element with xsi information added to it,
+            exactly as StdlibXmlBackend would write it.  This moves the children out of element. """
+        etree = self.etree
+        canonical = etree.Element(element.tag, nsmap=self.nsmap)
+        canonical.text = element.text
+        canonical.tail = element.tail
+        canonical.extend(element)  # moving children here puts them in our namespace prefixes
+        etree.cleanup_namespaces(canonical)  # leaving only those that are used, as ElementTree does
+        if ELEMENT_TREE_SORTS_ATTRIBUTES:
+            self._sort_attributes(canonical)
+        content = etree.tostring(canonical, encoding='utf-8')
+        start_tag_end = content.index(b'>') + 1
+        if b'&#' in content or b'xmlns' in content[start_tag_end:] \
+                or any(self.prefixes.get(namespace) != prefix for prefix, namespace in canonical.nsmap.items()
+                       if prefix is not None):
+            return self._serialize_with_element_tree(element, canonical)
+        start_tag = self._get_start_tag(element, canonical)
+        if content[start_tag_end - 2:start_tag_end] == b'/>':  # an empty object
+            start_tag = start_tag[:-1] + b' />'
+        xml_as_bytes = XML_DECLARATION + start_tag + content[start_tag_end:].replace(b'/>', b' />')
+        get_run_metrics().count('bytes_serialized', len(xml_as_bytes))
+        return xml_as_bytes
+
+    def _get_start_tag(self, element, canonical):
+        """ The object's start tag as ElementTree writes it: namespace declarations sorted by prefix,
+            then attributes, including the xsi information we add """
+        parts = [b'<', self._get_name(element.tag)]
+        for prefix, namespace in sorted(canonical.nsmap.items(), key=lambda item: item[0] or ''):
+            parts.append(b' xmlns' + (b':' + prefix.encode('utf-8') if prefix else b'')
+                         + b'="' + _escape_attrib(namespace).encode('utf-8') + b'"')
+        attributes = list(element.attrib.items())
+        attributes += [("xsi:schemaLocation", SCHEMA_LOCATION), ("xmlns:xsi", XSI_NAMESPACE)]
+        if ELEMENT_TREE_SORTS_ATTRIBUTES:
+            attributes.sort()
+        for name, value in attributes:
+            parts.append(b' ' + self._get_name(name) + b'="' + _escape_attrib(value).encode('utf-8') + b'"')
+        parts.append(b'>')
+        return b''.join(parts)
+
+    def _get_name(self, name):
+        """ "{namespace}name" -> b"prefix:name" """
+        if name[:1] != '{':
+            return name.encode('utf-8')
+        namespace, local_name = name[1:].split('}', 1)
+        prefix = self.prefixes[namespace]
+        return ((prefix + ':' if prefix else '') + local_name).encode('utf-8')
+
+    def _sort_attributes(self, canonical):
+        for child in canonical.iter():
+            if len(child.attrib) > 1:
+                attributes = sorted(child.attrib.items())
+                child.attrib.clear()
+                child.attrib.update(attributes)
+
+    def _serialize_with_element_tree(self, element, canonical):
+        """ Write one object through ElementTree, for anything tostring would write differently """
+        if self.stdlib_backend is None:
+            self.stdlib_backend = StdlibXmlBackend()
+            self.stdlib_backend.use_namespaces(self.namespace_dictionary)
+        for name, value in element.attrib.items():
+            canonical.set(name, value)
+        stdlib_element = StdlibElementTree.parse(BytesIO(self.etree.tostring(canonical, with_tail=False))).getroot()
+        stdlib_element.tail = canonical.tail
+        return self.stdlib_backend.serialize_record(stdlib_element)
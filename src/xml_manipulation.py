@@ -1,11 +1,14 @@
 # xml_manipulation.py
 """ This routine reads includes xml-related tasks. """
 
+from hashlib import md5
+from io import BytesIO
 import re
-import os
-import sys
-sys.path.append(os.path.dirname(os.path.realpath(__file__)))
-from file_system_utilities import create_directory, get_full_path_file_name  # noqa: E402
+from xml.etree.ElementTree import iterparse
+from file_system_utilities import create_directory, get_full_path_file_name
+from run_metrics import get_run_metrics
+
+RECORD_TAIL = '\n'  # after each object, whatever follows it in the export
 
 
 def get_value_given_xpath(xml, xpath, namespace_dictionary):
@@ -21,6 +24,58 @@ def get_value_given_xpath(xml, xpath, namespace_dictionary):
     return value
 
 
+def iterate_xml_records(full_path_file_name, record_name, namespace_dictionary):
+    """ Yield each record_name child of the root element as soon as it has been parsed.
+        Each record is freed once the consumer asks for the next one, so memory is bounded
+        by the largest single record rather than by the whole file.
+        namespace_dictionary is filled in once, from the namespaces declared on the root. """
+    return iterate_parsed_records(iterparse(full_path_file_name, ("start-ns", "start", "end")),
+                                  record_name, namespace_dictionary)
+
+
+def iterate_parsed_records(events, record_name, namespace_dictionary):
+    """ iterate_xml_records, given the ("start-ns", "start", "end") events of ElementTree's or lxml's iterparse.
+        A record is yielded when the next child of the root starts (or the root ends) rather than when it ends,
+        since only then is its tail read: otherwise the tail depends on where iterparse's reads fall in the file.
+        Its tail is then replaced with RECORD_TAIL, so an object's bytes don't depend on what follows it,
+        e.g. the end of a page rather than the next object. """
+    root = None
+    record_tag = None
+    pending = None  # the last child of the root to end
+    depth = 0
+    record_count = 0
+    try:
+        for event, elem in events:
+            if event == "start-ns":
+                if root is None:
+                    namespace_dictionary[elem[0]] = elem[1]
+                continue
+            depth += 1 if event == "start" else -1
+            if root is None:
+                root = elem
+                record_tag = get_qualified_name(record_name, namespace_dictionary)
+            elif event == "end" and depth == 1:
+                pending = elem
+            elif pending is not None and depth == (2 if event == "start" else 0):
+                if pending.tag == record_tag:
+                    record_count += 1
+                    pending.tail = RECORD_TAIL
+                    yield pending
+                pending.clear()
+                root.remove(pending)
+                pending = None
+    finally:
+        get_run_metrics().count('objects_parsed', record_count)  # once per file, rather than once per record
+
+
+def get_qualified_name(prefixed_name, namespace_dictionary):
+    """ Convert a name like "mets:mets" to the "{http://www.loc.gov/METS/}mets" form ElementTree uses """
+    if ':' not in prefixed_name:
+        return prefixed_name
+    prefix, local_name = prefixed_name.split(':', 1)
+    return '{' + namespace_dictionary[prefix] + '}' + local_name
+
+
 def write_xml_output_file(folder_name, file_name, xml_tree):
     """ Write xml to output file """
     create_directory(folder_name)
@@ -28,6 +83,29 @@ def write_xml_output_file(folder_name, file_name, xml_tree):
     xml_tree.write(full_path_file_name, encoding="utf-8", xml_declaration=True)
 
 
+def serialize_xml_tree(xml_tree):
+    """ Return the exact bytes write_xml_output_file would write for xml_tree.
+        The same tree always serializes to the same bytes, so these can be hashed and compared. """
+    output = BytesIO()
+    xml_tree.write(output, encoding="utf-8", xml_declaration=True)
+    xml_as_bytes = output.getvalue()
+    get_run_metrics().count('bytes_serialized', len(xml_as_bytes))
+    return xml_as_bytes
+
+
+def get_md5_checksum(content):
+    """ Return the hex md5 of content, in the same form as Google Drive's md5Checksum """
+    return md5(content).hexdigest()
+
+
+def save_bytes_of_xml_to_disk(folder_name, file_name, xml_as_bytes):
+    """ Write already serialized xml to disk """
+    create_directory(folder_name)
+    full_path_file_name = get_full_path_file_name(folder_name, file_name)
+    with open(full_path_file_name, "wb") as xml_file:
+        xml_file.write(xml_as_bytes)
+
+
 def save_string_of_xml_to_disk(folder_name, file_name, xml_as_string):
     """ Write string of xml to disk """
     create_directory(folder_name)
@@ -0,0 +1,87 @@
+# test_concurrent_uploader.py
+""" test uploads run on a bounded pool, with failures counted rather than stopping the others """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+from datetime import datetime  # noqa: E402
+import json  # noqa: E402
+import threading  # noqa: E402
+import unittest  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+from sentry_sdk import Client, Hub  # noqa: E402
+from src.concurrent_uploader import ConcurrentUploader  # noqa: E402
+from src.get_config import get_config  # noqa: E402
+from src.process_web_kiosk_metadata import process_web_kiosk_metadata  # noqa: E402
+from run_metrics import start_run_metrics  # noqa: E402 - as src modules import it, so they record into the same one
+
+
+def _upload(name):
+    if name.endswith('3'):
+        raise ValueError('could not upload ' + name)
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def setUp(self):
+        self.metrics = start_run_metrics()
+        Hub.main.bind_client(Client())  # as handler does, so a failure is reported just as it would be in Lambda
+        self.addCleanup(Hub.main.bind_client, None)
+
+    def test_1_failure_does_not_stop_the_others(self):
+        """ Test a failing upload is recorded, and every other upload still runs and is reported done """
+        done = []
+        uploader = ConcurrentUploader(3, on_success=done.append)
+        for number in range(20):
+            uploader.submit('object ' + str(number), _upload, 'object ' + str(number))
+        uploader.skip('object 20')
+        summary = uploader.wait()
+        self.assertEqual(sorted(name for name, error in uploader.failed), ['object 13', 'object 3'])
+        self.assertEqual(len(uploader.succeeded), 18)
+        self.assertEqual(sorted(done), sorted(uploader.succeeded))
+        self.assertTrue(summary.startswith('Uploads completed: 18, skipped as unchanged: 1, failed: 2\n'))
+        self.assertIn("object 3 - ValueError('could not upload object 3')", summary)
+
+    def test_2_submit_blocks_when_enough_are_queued(self):
+        """ Test submit waits once twice max_workers uploads are in flight or queued, until one finishes """
+        release = threading.Event()
+        uploader = ConcurrentUploader(2)
+        submitted = []
+
+        def submit_all():
+            for number in range(10):
+                uploader.submit(str(number), release.wait)
+                submitted.append(number)
+        submitter = threading.Thread(target=submit_all)
+        submitter.start()
+        submitter.join(0.5)
+        self.assertEqual(len(submitted), 4)
+        release.set()
+        submitter.join()
+        uploader.wait()
+        self.assertEqual(len(uploader.succeeded), 10)
+        self.assertEqual(self.metrics.get_summary()['queue_depths']['upload']['max'], 4)
+
+    def test_3_failed_upload_keeps_the_watermark(self):
+        """ Test a run with any failed upload does not advance the last successful export """
+        with patch.dict(os.environ, {'CONFIG_JSON': json.dumps({}), 'WEB_KIOSK_EXPORT_MODE': 'incremental'}):
+            processor = process_web_kiosk_metadata(get_config())
+        processor.export_started = datetime(2020, 10, 18, 2, 0, 0)
+        processor.fetch_status = 'ok'
+        processor.uploader = ConcurrentUploader(1)
+        processor.uploader.submit('object 3', _upload, 'object 3')
+        processor.uploader.wait()
+        with patch('src.process_web_kiosk_metadata.save_last_successful_export') as save:
+            self.assertFalse(processor.record_successful_export())
+        save.assert_not_called()
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -0,0 +1,107 @@
+# test_drive_rate_controller.py
+""" test Drive calls are kept within the quota, backing off and cutting concurrency when Drive throttles them """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import json  # noqa: E402
+import time  # noqa: E402
+import unittest  # noqa: E402
+import httplib2  # noqa: E402
+from googleapiclient.errors import HttpError  # noqa: E402
+from benchmark.fake_services import FakeDrive, network_conditions, get_fake_service_account_info, \
+    FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID, RATE_LIMIT_ERROR  # noqa: E402
+from src.drive_rate_controller import DriveRateController, is_rate_limit_error  # noqa: E402
+from src.save_to_google_team_drive import DriveSession, save_bytes_to_google_team_drive  # noqa: E402
+from run_metrics import start_run_metrics  # noqa: E402 - as src modules import it, so they record into the same one
+
+QUICK_BACKOFF = {'initial_backoff_seconds': 0.01, 'max_backoff_seconds': 0.05}
+
+
+class _Request():
+    """ Stands in for a googleapiclient request, failing with each status in statuses before succeeding """
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        if self.statuses:
+            status = self.statuses.pop(0)
+            content = RATE_LIMIT_ERROR if status == 403 else {'error': {'errors': [{'reason': 'notFound'}]}}
+            raise HttpError(httplib2.Response({'status': status}), json.dumps(content).encode('utf-8'))
+        return {'id': 'file-id'}
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def setUp(self):
+        self.metrics = start_run_metrics()
+
+    def test_1_rate_limit_errors(self):
+        """ Test 429, and 403 for rate limits only, are recognized as throttling """
+        def get_http_error(status, content):
+            return HttpError(httplib2.Response({'status': status}), json.dumps(content).encode('utf-8'))
+        self.assertTrue(is_rate_limit_error(get_http_error(429, {})))
+        self.assertTrue(is_rate_limit_error(get_http_error(403, RATE_LIMIT_ERROR)))
+        self.assertFalse(is_rate_limit_error(get_http_error(403, {'error': {'errors': [{'reason': 'forbidden'}]}})))
+        self.assertFalse(is_rate_limit_error(get_http_error(500, RATE_LIMIT_ERROR)))
+
+    def test_2_retry_and_adapt_concurrency(self):
+        """ Test a throttled call is retried and halves the concurrency limit, which successes then raise again,
+            while any other error is raised at once """
+        controller = DriveRateController(initial_concurrency=8, max_concurrency=8, **QUICK_BACKOFF)
+        request = _Request(429, 403)
+        self.assertEqual(controller.execute(request, 'drive.files.create'), {'id': 'file-id'})
+        self.assertEqual(request.calls, 3)
+        self.assertEqual(controller.concurrency_limit, 2)
+        for _ in range(2 + 3):
+            controller.execute(_Request(), 'drive.files.create')
+        self.assertEqual(controller.concurrency_limit, 4)
+        request = _Request(404)
+        with self.assertRaises(HttpError):
+            controller.execute(request, 'drive.files.update')
+        self.assertEqual(request.calls, 1)
+        counters = self.metrics.get_summary()['counters']
+        self.assertEqual((counters['drive_retries'], counters['drive_throttled']), (2, 2))
+
+    def test_3_token_bucket(self):
+        """ Test calls beyond the burst are held to requests_per_second """
+        controller = DriveRateController(requests_per_second=100, burst=5)
+        start = time.perf_counter()
+        for _ in range(25):
+            controller.execute(_Request(), 'drive.files.list')
+        self.assertGreaterEqual(time.perf_counter() - start, (25 - 5) / 100 * 0.9)
+
+    def test_4_batch_costs_more_than_burst(self):
+        """ Test a batch of more requests than the burst is charged for every one of them """
+        controller = DriveRateController(requests_per_second=100, burst=50)
+        start = time.perf_counter()
+        controller.execute(_Request(), 'drive.batch', cost=100)
+        controller.execute(_Request(), 'drive.batch', cost=100)
+        controller.execute(_Request(), 'drive.files.list')
+        self.assertGreaterEqual(time.perf_counter() - start, (100 + 100 + 1 - 50) / 100 * 0.9)
+
+    def test_5_within_fake_drive_quota(self):
+        """ Test saving through a Drive that throttles anything over its quota still saves every file """
+        drive = FakeDrive(network_conditions(requests_per_second=50)).start()
+        self.addCleanup(drive.server_close)
+        self.addCleanup(drive.shutdown)
+        credentials = dict(get_fake_service_account_info('unused'), token_uri=drive.url + 'token')
+        drive_session = DriveSession(credentials, drive.url, dict(QUICK_BACKOFF, requests_per_second=200, burst=100))
+        for number in range(120):
+            save_bytes_to_google_team_drive(drive_session, FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID,
+                                            str(number) + '.xml', b'<mets/>', folder_index={})
+        self.assertEqual(drive.get_stats()['files'], 120)
+        self.assertGreater(self.metrics.get_summary()['counters']['drive_retries'], 0)
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -0,0 +1,85 @@
+# test_export_watermark.py
+""" test the last successful export watermark: when it advances, and the incremental query built from it """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+from datetime import datetime, timedelta  # noqa: E402
+import json  # noqa: E402
+import unittest  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+from src.concurrent_uploader import ConcurrentUploader  # noqa: E402
+from src.export_watermark import get_last_successful_export  # noqa: E402
+from src.get_config import get_config  # noqa: E402
+from src.process_web_kiosk_metadata import process_web_kiosk_metadata  # noqa: E402
+
+EXPORT_STARTED = datetime(2020, 10, 18, 12, 30, 0)
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def _get_processor(self, last_successful_export=None, overlap_hours=6):
+        parameters = {'embark/server-address': 'http://web-kiosk'}
+        if last_successful_export is not None:
+            parameters['embark/last-successful-export'] = last_successful_export
+        with patch.dict(os.environ, {'CONFIG_JSON': json.dumps(parameters), 'WEB_KIOSK_EXPORT_MODE': 'incremental'}):
+            config = get_config()
+            self.assertIn('server-address', config['embark'])  # read now, while CONFIG_JSON is set
+        config['watermark_overlap_hours'] = overlap_hours
+        processor = process_web_kiosk_metadata(config)
+        processor.export_started = EXPORT_STARTED
+        processor.fetch_status = 'ok'
+        processor.uploader = ConcurrentUploader(1)
+        return processor
+
+    def _record_successful_export(self, processor):
+        """ Return whether the watermark was saved, and what as """
+        with patch('src.process_web_kiosk_metadata.save_last_successful_export') as save:
+            recorded = processor.record_successful_export()
+        self.assertEqual(save.called, recorded)
+        return recorded, save.call_args[0][1] if save.called else None
+
+    def test_1_watermark_advances_after_complete_export(self):
+        """ Test a run that fetched and uploaded everything records when its export was taken """
+        self.assertEqual(self._record_successful_export(self._get_processor()), (True, EXPORT_STARTED))
+
+    def test_2_watermark_stays_put(self):
+        """ Test the watermark is left alone after a failed fetch, a run that stopped early, or a failed upload """
+        processor = self._get_processor()
+        processor.fetch_status = 'error'
+        self.assertEqual(self._record_successful_export(processor), (False, None))
+        processor = self._get_processor()
+        processor.stopped_early = True
+        self.assertEqual(self._record_successful_export(processor), (False, None))
+        processor = self._get_processor()
+        processor.uploader.failed.append(('1990.001', 'HttpError'))
+        self.assertEqual(self._record_successful_export(processor), (False, None))
+        processor = self._get_processor()
+        processor.export_started = None  # nothing was fetched
+        self.assertEqual(self._record_successful_export(processor), (False, None))
+
+    def test_3_incremental_query_date(self):
+        """ Test the query asks for changes after the day before the overlap reaches back to """
+        self.assertEqual(get_last_successful_export(self._get_processor('2020-10-18T12:00:00Z').config),
+                         datetime(2020, 10, 18, 12, 0, 0))
+        for watermark, overlap_hours, query_date in [('2020-10-18T12:00:00Z', 6, '10/17/2020'),
+                                                     ('2020-10-18T03:00:00Z', 6, '10/16/2020'),
+                                                     ('2020-10-18T03:00:00Z', 0, '10/17/2020'),
+                                                     ('2020-10-18T00:00:00Z', 0, '10/17/2020')]:
+            processor = self._get_processor(watermark, overlap_hours)
+            url = processor._get_snite_metadata_url('http://web-kiosk', 'incremental')
+            self.assertTrue(url.endswith('&query=mod_date%3E%22' + query_date + '%22'), (watermark, url))
+        processor = self._get_processor()
+        two_days_ago = (datetime.utcnow() - timedelta(days=2)).strftime('%m/%d/%Y')
+        self.assertIn(two_days_ago, processor._get_snite_metadata_url('http://web-kiosk', 'incremental'))
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -0,0 +1,168 @@
+# test_fake_services.py
+""" test save_to_google_team_drive and stream_url_to_disk against the fake services in benchmark/fake_services """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import tempfile  # noqa: E402
+import time  # noqa: E402
+import unittest  # noqa: E402
+from hashlib import md5  # noqa: E402
+from googleapiclient.errors import HttpError  # noqa: E402
+from benchmark.generate_composite_mets import COMPOSITE_HEAD, COMPOSITE_TAIL  # noqa: E402
+from benchmark.fake_services import FakeDrive, FakeWebKiosk, network_conditions, get_fake_service_account_info, \
+    FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID  # noqa: E402
+from src.save_to_google_team_drive import DriveSession, delete_files, get_file_ids_given_filenames, \
+    get_folder_index, save_bytes_to_google_team_drive, save_file_to_google_team_drive, trash_files  # noqa: E402
+from src.stream_url_to_disk import GZIP_MAGIC, UrlStream, get_saved_file_result, open_saved_file, \
+    stream_url_to_disk  # noqa: E402
+
+CONTENT = b'<?xml version=\'1.0\' encoding=\'utf-8\'?>\n<mets:mets xmlns:mets="http://www.loc.gov/METS/" />\n'
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    @classmethod
+    def setUpClass(cls):
+        cls.credentials = get_fake_service_account_info('unused')
+
+    def _get_drive_session(self, drive, rate_limit=None):
+        credentials = dict(self.credentials, token_uri=drive.url + 'token')
+        return DriveSession(credentials, drive.url, rate_limit)
+
+    def test_1_create_then_update(self):
+        """ Test saving bytes creates a file, then updates it, keeping the folder index current """
+        drive = FakeDrive(keep_content=True).start()
+        self.addCleanup(drive.server_close)
+        self.addCleanup(drive.shutdown)
+        drive_session = self._get_drive_session(drive)
+        folder_index = get_folder_index(drive_session, FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID)
+        self.assertEqual(folder_index, {})
+        file_id = save_bytes_to_google_team_drive(drive_session, FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID,
+                                                  '1990.001.xml', CONTENT, folder_index=folder_index)
+        self.assertEqual(folder_index['1990.001.xml'].md5_checksum, md5(CONTENT).hexdigest())
+        self.assertEqual(drive.content[file_id], CONTENT)
+        updated_content = CONTENT.replace(b'mets:mets', b'mets:div')
+        self.assertEqual(save_bytes_to_google_team_drive(drive_session, FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID,
+                                                         '1990.001.xml', updated_content), file_id)
+        self.assertEqual(drive.content[file_id], updated_content)
+        folder_index = get_folder_index(drive_session, FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID)
+        self.assertEqual(folder_index['1990.001.xml'].md5_checksum, md5(updated_content).hexdigest())
+        self.assertEqual(drive.get_stats()['files'], 1)
+
+    def test_2_resumable_upload_from_disk(self):
+        """ Test a local file goes through a resumable upload session """
+        drive = FakeDrive(keep_content=True).start()
+        self.addCleanup(drive.server_close)
+        self.addCleanup(drive.shutdown)
+        with tempfile.TemporaryDirectory() as folder_name:
+            with open(os.path.join(folder_name, '1990.002.xml'), 'wb') as output_file:
+                output_file.write(CONTENT)
+            file_id = save_file_to_google_team_drive(self._get_drive_session(drive), FAKE_DRIVE_ID,
+                                                     FAKE_PARENT_FOLDER_ID, folder_name, '1990.002.xml')
+        self.assertEqual(drive.content[file_id], CONTENT)
+        self.assertEqual(drive.files[file_id]['parents'], [FAKE_PARENT_FOLDER_ID])
+
+    def test_3_rate_limited(self):
+        """ Test requests chosen to be rate limited fail as Drive's would, once they are not retried """
+        drive = FakeDrive(network_conditions(rate_limit_rate=1.0)).start()
+        self.addCleanup(drive.server_close)
+        self.addCleanup(drive.shutdown)
+        with self.assertRaises(HttpError) as context:
+            get_folder_index(self._get_drive_session(drive, {'max_retries': 0}), FAKE_DRIVE_ID,
+                             FAKE_PARENT_FOLDER_ID)
+        self.assertEqual(context.exception.resp.status, 403)
+        self.assertIn('userRateLimitExceeded', context.exception.content.decode('utf-8'))
+
+    def test_4_web_kiosk_pages(self):
+        """ Test pages of the fake Web Kiosk export add up to the whole export """
+        web_kiosk = FakeWebKiosk(5).start()
+        self.addCleanup(web_kiosk.server_close)
+        self.addCleanup(web_kiosk.shutdown)
+        with tempfile.TemporaryDirectory() as folder_name:
+            url = web_kiosk.url + 'results.html?maximumrecords='
+            whole = self._get_content(stream_url_to_disk(url + '-1', folder_name, 'whole.xml'))
+            pages = [self._get_content(stream_url_to_disk(url + '2&startrecord=' + str(start), folder_name,
+                                                          'page.xml'))
+                     for start in (1, 3, 5, 7)]
+        self.assertEqual(whole.count(b'<mets>'), 5)
+        self.assertEqual([page.count(b'<mets>') for page in pages], [2, 2, 1, 0])
+        head, tail = len(COMPOSITE_HEAD), len(COMPOSITE_TAIL)
+        self.assertEqual(b''.join(page[head:-tail] for page in pages), whole[head:-tail])
+
+    def test_5_batches(self):
+        """ Test lookups, moves to the trash and deletes go a batch of up to 100 at a time, retrying throttled ones """
+        drive = FakeDrive(network_conditions(rate_limit_rate=0.2, seed=1)).start()
+        self.addCleanup(drive.server_close)
+        self.addCleanup(drive.shutdown)
+        metadata = [{'name': str(number) + '.xml', 'parents': [FAKE_PARENT_FOLDER_ID]} for number in range(150)]
+        file_ids = [drive.save_file(None, file_metadata, b'')['id'] for file_metadata in metadata]
+        drive_session = self._get_drive_session(drive, {'initial_backoff_seconds': 0.01, 'max_backoff_seconds': 0.05})
+        found = get_file_ids_given_filenames(drive_session, FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID,
+                                             ['0.xml', '149.xml', 'missing.xml'])
+        self.assertEqual(found, {'0.xml': file_ids[0], '149.xml': file_ids[149], 'missing.xml': ''})
+        self.assertEqual(trash_files(drive_session, file_ids[:120]), {})
+        self.assertEqual(delete_files(drive_session, file_ids[100:]), {})
+        self.assertEqual(get_folder_index(drive_session, FAKE_DRIVE_ID, FAKE_PARENT_FOLDER_ID), {})
+        stats = drive.get_stats()
+        self.assertEqual((stats['files'], stats['delete']), (100, 50))
+        self.assertGreater(stats['rate_limited'], 0)
+        self.assertLess(stats['batch'], 20)
+
+    def test_6_compressed_transfer_resumes(self):
+        """ Test a gzipped export is decompressed, or kept compressed, and resumed where each connection dropped """
+        web_kiosk = FakeWebKiosk(50, drop_after_bytes=3000).start()
+        self.addCleanup(web_kiosk.server_close)
+        self.addCleanup(web_kiosk.shutdown)
+        url = web_kiosk.url + 'results.html?maximumrecords=-1'
+        export = b''.join(web_kiosk.iterate_export(1, -1))
+        with tempfile.TemporaryDirectory() as folder_name:
+            result = stream_url_to_disk(url, folder_name, 'whole.xml')
+            self.assertEqual(self._get_content(result), export)
+            kept = stream_url_to_disk(url, folder_name, 'kept.xml', keep_compressed=True)
+            with open(kept.path, 'rb') as kept_file:
+                compressed = kept_file.read()
+            with open_saved_file(kept.path) as kept_file:
+                self.assertEqual(kept_file.read(), export)
+            self.assertEqual(get_saved_file_result(kept.path), get_saved_file_result(result.path)._replace(
+                path=kept.path))
+        self.assertEqual(compressed[:2], GZIP_MAGIC)
+        self.assertLess(len(compressed), len(export) / 3)
+        self.assertEqual((result.size, result.status), (len(export), 'ok'))
+        self.assertEqual((kept.size, kept.md5_checksum), (result.size, result.md5_checksum))
+        self.assertEqual(b''.join(UrlStream(url, chunk_size=1000)), export)
+        stats = web_kiosk.get_stats()
+        self.assertGreaterEqual(stats['resumed'], 3 * (len(compressed) // 3000))
+        self.assertEqual(stats['dropped'], stats['resumed'])
+
+    def test_7_stalled_transfer_resumes(self):
+        """ Test a connection that stops sending part way is given up after the timeout and resumed from there """
+        web_kiosk = FakeWebKiosk(50, drop_after_bytes=3000, stall_seconds=5).start()
+        self.addCleanup(web_kiosk.server_close)
+        self.addCleanup(web_kiosk.shutdown)
+        url = web_kiosk.url + 'results.html?maximumrecords=-1'
+        export = b''.join(web_kiosk.iterate_export(1, -1))
+        with tempfile.TemporaryDirectory() as folder_name:
+            start = time.perf_counter()
+            result = stream_url_to_disk(url, folder_name, 'whole.xml', timeout_seconds=0.2)
+            elapsed_seconds = time.perf_counter() - start
+            self.assertEqual(self._get_content(result), export)
+        stats = web_kiosk.get_stats()
+        self.assertGreater(stats['resumed'], 0)
+        self.assertLess(elapsed_seconds, 5)  # it didn't wait for any stalled connection to close
+
+    def _get_content(self, result):
+        self.assertEqual(result.status, 'ok')
+        with open(result.path, 'rb') as input_file:
+            return input_file.read()
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
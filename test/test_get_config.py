@@ -0,0 +1,72 @@
+# test_get_config.py
+""" test get_config, reading configuration from CONFIG_JSON instead of Parameter Store """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import json  # noqa: E402
+import stat  # noqa: E402
+import tempfile  # noqa: E402
+import unittest  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+import src.get_config  # noqa: E402
+from src.get_config import get_config, forget_cached_parameters  # noqa: E402
+
+PARAMETERS = {
+    "google/credentials/private_key": "a-private-key",
+    "google/museum/metadata/drive-id": "a-drive-id",
+    "sentry/dsn": "a-sentry-dsn",
+    "embark/server-address": "an-embark-server",
+    "museum/notification-email-address": "someone@somewhere.com",
+    "no-reply-email-address": "do.not.reply@nd.edu"
+}
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def test_1_sections_are_read_when_used(self):
+        """ Test each section is only read the first time it is used """
+        with patch.dict(os.environ, {'CONFIG_JSON': json.dumps(PARAMETERS), 'WEB_KIOSK_EXPORT_MODE': 'full'}):
+            config = get_config()
+            self.assertEqual(config.loaded_sections, set())
+            self.assertEqual(config['mode'], 'full')
+            self.assertEqual(config['sentry'], {'dsn': 'a-sentry-dsn'})
+            self.assertEqual(config.loaded_sections, {'sentry'})
+            self.assertEqual(config['google']['credentials']['private_key'], 'a-private-key\n')
+            self.assertEqual(config['google']['museum']['metadata']['drive-id'], 'a-drive-id')
+            self.assertEqual(config['museum']['notification-email-address'], 'someone@somewhere.com')
+            self.assertEqual(config['no-reply-email-address'], 'do.not.reply@nd.edu')
+            self.assertEqual(config.get('not-a-key', 'default'), 'default')
+            self.assertRaises(KeyError, lambda: config['not-a-key'])
+
+    def test_2_parameters_are_cached(self):
+        """ Test Parameter Store is read once per section while the cache lasts, and the cache file is private """
+        cache_file_name = os.path.join(tempfile.mkdtemp(), 'config_cache.json')
+        environment = {'SSM_KEY_BASE': '/base', 'WEB_KIOSK_EXPORT_MODE': 'full', 'CONFIG_JSON': '', 'CONFIG_FILE': '',
+                       'CONFIG_CACHE_FILE': cache_file_name}
+        with patch.dict(os.environ, environment), \
+                patch.object(src.get_config, '_get_parameter_store_parameters',
+                             return_value={'sentry/dsn': 'a-sentry-dsn'}) as get_parameters:
+            forget_cached_parameters()
+            self.assertEqual(get_config()['sentry']['dsn'], 'a-sentry-dsn')
+            self.assertEqual(get_config()['sentry']['dsn'], 'a-sentry-dsn')
+            self.assertEqual(get_parameters.call_count, 1)
+            self.assertEqual(stat.S_IMODE(os.stat(cache_file_name).st_mode), 0o600)
+            src.get_config._cached_parameters.clear()  # as if this were a new process
+            self.assertEqual(get_config()['sentry']['dsn'], 'a-sentry-dsn')
+            self.assertEqual(get_parameters.call_count, 1)
+            forget_cached_parameters()
+            self.assertEqual(get_config()['sentry']['dsn'], 'a-sentry-dsn')
+            self.assertEqual(get_parameters.call_count, 2)
+            forget_cached_parameters()
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -0,0 +1,77 @@
+# test_missing_field_report.py
+""" test missing_field_report """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import unittest  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+from sentry_sdk import Client, Hub  # noqa: E402
+from src.missing_field_report import MissingFieldReport  # noqa: E402
+from src.required_field_validator import missing_field  # noqa: E402
+from src.send_notification_email import _create_email_html_body, create_and_send_email_notification  # noqa: E402
+
+TITLE = missing_field('Title', 'mets:dmdSec/dcterms:title')
+CREATOR = missing_field('Creator', 'mets:dmdSec/dcterms:creator')
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def _get_report(self):
+        missing_field_report = MissingFieldReport(sample_size=2)
+        missing_field_report.add('1990.001', [TITLE, CREATOR])
+        missing_field_report.add('1990.002', [])
+        missing_field_report.add('1990.003', [CREATOR])
+        missing_field_report.add('1990.004', [CREATOR])
+        return missing_field_report
+
+    def test_1_summary(self):
+        """ Test objects are counted and sampled by field """
+        missing_field_report = self._get_report()
+        self.assertEqual(len(missing_field_report), 3)
+        summary = missing_field_report.get_summary()
+        self.assertEqual(list(summary), ['Title', 'Creator'])
+        self.assertEqual(summary['Title']['count'], 1)
+        self.assertEqual(summary['Creator']['count'], 3)
+        self.assertEqual(summary['Creator']['sample_object_ids'], ['1990.001', '1990.003'])
+        self.assertEqual(summary['Creator']['xpath'], CREATOR.xpath)
+
+    def test_2_object_lines(self):
+        """ Test each object's missing fields come back in the order they were added """
+        object_lines = list(self._get_report().get_object_lines())
+        self.assertEqual(object_lines[0], ('1990.001', [('Title', TITLE.xpath), ('Creator', CREATOR.xpath)]))
+        self.assertEqual([object_id for object_id, missing_fields in object_lines],
+                         ['1990.001', '1990.003', '1990.004'])
+
+    def test_3_email_body(self):
+        """ Test the email is rendered from the report, escaping anything that looks like html """
+        missing_field_report = MissingFieldReport()
+        missing_field_report.add('<1990.005>', [TITLE])
+        body_html = _create_email_html_body(missing_field_report)
+        self.assertIn('Title - missing from 1 object(s)', body_html)
+        self.assertIn('&lt;1990.005&gt; is missing', body_html)
+
+    def test_4_email_not_sent(self):
+        """ Test SES refusing the email is reported to Sentry, as it would be in Lambda, rather than raised """
+        events = []
+        Hub.main.bind_client(Client(transport=events.append))
+        self.addCleanup(Hub.main.bind_client, None)
+        error = ClientError({'Error': {'Code': 'MessageRejected', 'Message': 'Email address is not verified.'}},
+                            'SendEmail')
+        with patch('boto3.client') as client:
+            client.return_value.send_email.side_effect = error
+            create_and_send_email_notification(self._get_report(), 'nobody@example.com', 'nobody@example.com')
+        self.assertEqual([event['message'] for event in events],
+                         ['Unable to send notification email: Email address is not verified.'])
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -0,0 +1,68 @@
+# test_object_index.py
+""" test objects read through the sidecar object index are just as a full parse of the composite file gives them """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import tempfile  # noqa: E402
+import unittest  # noqa: E402
+from benchmark.generate_composite_mets import generate_composite_mets  # noqa: E402
+from src.object_index import ObjectIndexError, iterate_indexed_records, load_object_index, \
+    write_object_index  # noqa: E402
+from src.process_web_kiosk_metadata import OBJECT_ID_XPATH  # noqa: E402
+from src.xml_backend import get_xml_backend  # noqa: E402
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.full_path_file_name = os.path.join(self.folder.name, 'composite.xml')
+        generate_composite_mets(self.full_path_file_name, 20)
+        self.backend = get_xml_backend('stdlib')
+        self.expected = {}
+        namespace_dictionary = {}
+        for item in self.backend.iterate_records(self.full_path_file_name, 'mets:mets', namespace_dictionary):
+            if not self.expected:
+                self.backend.use_namespaces(namespace_dictionary)
+            self.expected[item.find(OBJECT_ID_XPATH, namespace_dictionary).text] = self.backend.serialize_record(item)
+        self.index = write_object_index(self.full_path_file_name, self.backend, 'mets:mets', OBJECT_ID_XPATH)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_1_indexed_records_match_full_parse(self):
+        """ Test chosen records, in the order asked for, serialize just as they do from a full parse """
+        object_ids = list(self.expected)[::-7]
+        namespace_dictionary = {}
+        actual = {item.find(OBJECT_ID_XPATH, namespace_dictionary).text: self.backend.serialize_record(item)
+                  for item in iterate_indexed_records(self.full_path_file_name, object_ids, self.backend,
+                                                      namespace_dictionary)}
+        self.assertEqual(list(actual), object_ids)
+        self.assertEqual(actual, {object_id: self.expected[object_id] for object_id in object_ids})
+        self.assertEqual(list(load_object_index(self.full_path_file_name)['objects']), list(self.expected))
+
+    def test_2_unknown_object_id(self):
+        """ Test an object not in the composite file is reported before anything is read """
+        with self.assertRaises(ObjectIndexError):
+            list(iterate_indexed_records(self.full_path_file_name, ['no such object'], self.backend, {}))
+
+    def test_3_changed_composite_file(self):
+        """ Test a composite file changed since it was indexed is noticed, even when its size is the same """
+        object_id, entry = list(self.index['objects'].items())[3]
+        with open(self.full_path_file_name, 'r+b') as composite_file:
+            composite_file.seek(entry.offset + 1)
+            composite_file.write(b'M')
+        with self.assertRaises(ObjectIndexError):
+            list(iterate_indexed_records(self.full_path_file_name, [object_id], self.backend, {}))
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
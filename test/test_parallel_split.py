@@ -0,0 +1,65 @@
+# test_parallel_split.py
+""" test splitting a composite file with a pool of processes gives the same objects as splitting it in this one """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import mmap  # noqa: E402
+import tempfile  # noqa: E402
+import unittest  # noqa: E402
+from benchmark.generate_composite_mets import generate_composite_mets  # noqa: E402
+from src.get_config import REQUIRED_FIELDS  # noqa: E402
+from src.parallel_split import find_record_offsets, iterate_split_objects  # noqa: E402
+from src.process_web_kiosk_metadata import OBJECT_ID_XPATH  # noqa: E402
+from src.required_field_validator import RequiredFieldValidator  # noqa: E402
+from src.xml_backend import get_xml_backend  # noqa: E402
+
+NAMESPACE_DICTIONARY = {'': 'http://www.loc.gov/METS/', 'mets': 'http://www.loc.gov/METS/'}
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def test_1_find_record_offsets(self):
+        """ Test records are found under each prefix of their namespace, and not mistaken for longer names """
+        content = b'<superMets xmlns="http://www.loc.gov/METS/" xmlns:mets="http://www.loc.gov/METS/">\n' \
+            b'<mets ID="1"><metsHdr/></mets>\n<mets:mets>\n<mets:metsHdr/></mets:mets><mets/></superMets>'
+        with tempfile.TemporaryFile() as composite_file:
+            composite_file.write(content)
+            composite_file.flush()
+            with mmap.mmap(composite_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                offsets = find_record_offsets(mapped_file, 'mets:mets', NAMESPACE_DICTIONARY)
+        self.assertEqual([content[offset:offset + 6] for offset in offsets], [b'<mets ', b'<mets:', b'<mets/'])
+
+    def test_2_same_objects_as_one_process(self):
+        """ Test two workers, each given a few records at a time, give the same objects in the same order """
+        with tempfile.TemporaryDirectory() as folder_name:
+            full_path_file_name = os.path.join(folder_name, 'composite.xml')
+            generate_composite_mets(full_path_file_name, 50, missing_field_rate=0.2)
+            expected = []
+            namespace_dictionary = {}
+            backend = get_xml_backend('stdlib')
+            for item in backend.iterate_records(full_path_file_name, 'mets:mets', namespace_dictionary):
+                if not expected:
+                    backend.use_namespaces(namespace_dictionary)
+                    validator = RequiredFieldValidator(REQUIRED_FIELDS, namespace_dictionary)
+                object_id = item.find(OBJECT_ID_XPATH, namespace_dictionary).text
+                missing_fields = validator.validate(item)
+                expected.append((object_id, backend.serialize_record(item), missing_fields))
+            split_namespace_dictionary = {}
+            split_objects = list(iterate_split_objects(full_path_file_name, 'mets:mets', split_namespace_dictionary,
+                                                       OBJECT_ID_XPATH, REQUIRED_FIELDS, 'stdlib', workers=2,
+                                                       records_per_task=7))
+        self.assertEqual(split_namespace_dictionary, namespace_dictionary)
+        self.assertEqual([tuple(split_object) for split_object in split_objects], expected)
+        self.assertTrue(any(missing_fields for object_id, xml_as_bytes, missing_fields in expected))
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -0,0 +1,96 @@
+# test_pipeline.py
+""" test stages connected by bounded queues, and the export read through them as it arrives """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import itertools  # noqa: E402
+import time  # noqa: E402
+import unittest  # noqa: E402
+from benchmark.fake_services import FakeWebKiosk  # noqa: E402
+from src.pipeline import ChunkReader, Pipeline  # noqa: E402
+from src.stream_url_to_disk import UrlStream  # noqa: E402
+from src.xml_backend import get_xml_backend  # noqa: E402
+from run_metrics import start_run_metrics  # noqa: E402 - as src modules import it, so they record into the same one
+
+
+def _double(items):
+    for item in items:
+        yield item * 2
+
+
+def _fail_at_three(items):
+    for item in items:
+        if item == 3:
+            raise ValueError('three')
+        yield item
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def setUp(self):
+        self.metrics = start_run_metrics()
+
+    def test_1_items_pass_through_each_stage(self):
+        """ Test every item reaches the end, in order, and no queue ever holds more than its size """
+        with Pipeline() as pipeline:
+            pipeline.add_stage('count', lambda nothing: iter(range(100)), 3)
+            pipeline.add_stage('double', _double, 2)
+            self.assertEqual(list(pipeline.iterate('end')), list(range(0, 200, 2)))
+        summary = self.metrics.get_summary()
+        self.assertEqual(summary['queue_depths']['count']['samples'], 101)  # and one more for the end
+        self.assertLessEqual(summary['queue_depths']['count']['max'], 3)
+        self.assertLessEqual(summary['queue_depths']['double']['max'], 2)
+        self.assertIn('double_idle', summary['stage_seconds'])
+        self.assertIn('count_blocked', summary['stage_seconds'])
+
+    def test_2_stage_exception_reaches_consumer(self):
+        """ Test an exception in one stage is raised again by the stages after it, then where items are read """
+        with Pipeline() as pipeline:
+            pipeline.add_stage('count', lambda nothing: iter(range(10)), 2)
+            pipeline.add_stage('fail', _fail_at_three, 2)
+            pipeline.add_stage('double', _double, 2)
+            items = pipeline.iterate('end')
+            self.assertEqual([next(items) for _ in range(3)], [0, 2, 4])
+            with self.assertRaisesRegex(ValueError, 'three'):
+                next(items)
+
+    def test_3_close_stops_stages_waiting_on_full_queues(self):
+        """ Test closing the pipeline stops a stage that would otherwise go on forever """
+        pipeline = Pipeline()
+        pipeline.add_stage('count', lambda nothing: itertools.count(), 2)
+        self.assertEqual(next(pipeline.iterate('end')), 0)
+        start = time.perf_counter()
+        pipeline.close()
+        self.assertLess(time.perf_counter() - start, 5)
+
+    def test_4_records_parsed_as_they_arrive(self):
+        """ Test the export read in small chunks through a pipeline parses to the same records as all at once """
+        web_kiosk = FakeWebKiosk(25).start()
+        self.addCleanup(web_kiosk.server_close)
+        self.addCleanup(web_kiosk.shutdown)
+        url = web_kiosk.url + 'results.html?maximumrecords=-1'
+        backend = get_xml_backend('stdlib')
+        url_stream = UrlStream(url, chunk_size=1000)
+        with Pipeline() as pipeline:
+            pipeline.add_stage('fetch', lambda nothing: iter(url_stream), 4)
+            streamed = [backend.serialize_record(item)
+                        for item in backend.iterate_records(ChunkReader(pipeline.iterate('parse')), 'mets:mets', {})]
+        whole_stream = UrlStream(url)
+        whole = [backend.serialize_record(item)
+                 for item in backend.iterate_records(ChunkReader([b''.join(whole_stream)]), 'mets:mets', {})]
+        self.assertEqual(len(streamed), 25)
+        self.assertEqual(streamed, whole)
+        self.assertEqual(url_stream.get_result()[1:3], (whole_stream.size, 'ok'))
+        self.assertEqual(url_stream.checksum.hexdigest(), whole_stream.checksum.hexdigest())
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
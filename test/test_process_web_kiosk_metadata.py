@@ -34,8 +34,9 @@ class Test(unittest.TestCase):
     def test_1_get_snite_composite_mets_metadata(self):
         """ Test retrieving Snite composite METS metadata """
         print('1 - test_1_get_snite_composite_mets_metadata')
-        xml_as_string = self.web_kiosk_class.get_snite_composite_mets_metadata()
-        self.assertTrue(xml_as_string > '')
+        fetch_result = self.web_kiosk_class.get_snite_composite_mets_metadata()
+        self.assertTrue(fetch_result.size > 0)
+        self.assertEqual(fetch_result.status, 'ok')
 
     def test_2_process_snite_composite_mets_metadata(self):
         """ Test processing Snite composite METS metadata. """
@@ -49,8 +50,8 @@ class Test(unittest.TestCase):
         self.config['mode'] = 'incremental'
         self.clean_up_as_we_go = True
         self.web_kiosk_class.__init__(self.config)
-        xml_as_string = self.web_kiosk_class.get_snite_composite_mets_metadata()
-        if xml_as_string > '':
+        fetch_result = self.web_kiosk_class.get_snite_composite_mets_metadata()
+        if fetch_result.size > 0:
             namespace_dictionary = self.web_kiosk_class.process_snite_composite_mets_metadata(self.clean_up_as_we_go)
         self.assertFalse(namespace_dictionary == {})
 
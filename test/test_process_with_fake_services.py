@@ -0,0 +1,256 @@
+# test_process_with_fake_services.py
+""" test whole runs of process_web_kiosk_metadata against the fake Drive and Web Kiosk in benchmark/fake_services """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+from contextlib import redirect_stdout  # noqa: E402
+import io  # noqa: E402
+import json  # noqa: E402
+import tempfile  # noqa: E402
+import threading  # noqa: E402
+import unittest  # noqa: E402
+from unittest.mock import patch  # noqa: E402
+from sentry_sdk import Client, Hub  # noqa: E402
+from benchmark.fake_services import FakeDrive, FakeWebKiosk, get_fake_parameters, FAKE_PARENT_FOLDER_ID  # noqa: E402
+from src.get_config import get_config  # noqa: E402
+from src.object_index import load_object_index, write_object_index  # noqa: E402
+from src.process_web_kiosk_metadata import OBJECT_ID_XPATH, process_web_kiosk_metadata  # noqa: E402
+from src.xml_backend import get_xml_backend  # noqa: E402
+from run_metrics import start_run_metrics  # noqa: E402 - as src modules import it, so they record into the same one
+from save_to_google_team_drive import trash_files  # noqa: E402 - as the module imported by process_web_kiosk_metadata
+
+OBJECT_COUNT = 30
+TRASH_ORPHANS = {'action': 'trash', 'max_fraction': 0.1}
+
+
+class _LambdaContext():
+    """ Stands in for the Lambda context, with plenty of time left for the first calls, then none """
+    def __init__(self, calls_with_time_left):
+        self.calls_with_time_left = calls_with_time_left
+
+    def get_remaining_time_in_millis(self):
+        self.calls_with_time_left -= 1
+        return 900000 if self.calls_with_time_left >= 0 else 0
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def setUp(self):
+        self.drive = self._start(FakeDrive())
+        self.web_kiosk = self._start(FakeWebKiosk(OBJECT_COUNT))
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        parameters = get_fake_parameters(self.drive, self.web_kiosk)
+        environment = patch.dict(os.environ, {'CONFIG_JSON': json.dumps(parameters),
+                                              'DRIVE_API_ROOT_URL': self.drive.url,
+                                              'WEB_KIOSK_EXPORT_MODE': 'full'})
+        environment.start()
+        self.addCleanup(environment.stop)
+        Hub.main.bind_client(Client())  # as handler does, so anything reported is reported as it would be in Lambda
+        self.addCleanup(Hub.main.bind_client, None)
+
+    def test_1_resume_after_deadline(self):
+        """ Test a run that reaches the Lambda deadline stops, and the next run uploads only the objects left """
+        first = self._run(context=_LambdaContext(12))
+        self.assertTrue(first.stopped_early)
+        self.assertEqual(len(first.uploader.succeeded), 12)
+        self.assertFalse(first.record_successful_export())
+        with open(os.path.join(self.folder.name, 'web_kiosk_run_manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        self.assertFalse(manifest['complete'])
+        self.assertEqual(sorted(manifest['processed_object_ids']), sorted(first.uploader.succeeded))
+        self.assertTrue(os.path.exists(os.path.join(self.folder.name, 'web_kiosk_mets_composite.xml')))
+        second = self._run(context=_LambdaContext(OBJECT_COUNT + 1))
+        self.assertFalse(second.stopped_early)
+        self.assertEqual(len(second.uploader.succeeded), OBJECT_COUNT - 12)
+        self.assertFalse(set(first.uploader.succeeded) & set(second.uploader.succeeded))
+        self.assertEqual(second.uploader.skipped, [])  # left alone by the manifest, without comparing checksums
+        self.assertEqual(self.drive.get_stats()['create'], OBJECT_COUNT)
+        with open(os.path.join(self.folder.name, 'web_kiosk_run_manifest.json')) as manifest_file:
+            self.assertTrue(json.load(manifest_file)['complete'])
+        self.assertFalse(os.path.exists(os.path.join(self.folder.name, 'web_kiosk_mets_composite.xml')))
+
+    def test_2_paged_fetch_stops_when_web_kiosk_does(self):
+        """ Test a paged run ends, reporting that the fetch failed, at the first page that fails after its retries """
+        processor = process_web_kiosk_metadata(self._get_config(fetch_mode='paged', page_size=5, fetch_workers=1,
+                                                                page_retries=0))
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(processor.get_snite_composite_mets_metadata().status, 'ok')
+            self.web_kiosk.shutdown()  # so every page after the first is refused
+            self.web_kiosk.server_close()
+            self._run_with_timeout(processor.process_snite_composite_mets_metadata, True)
+        self.assertEqual(processor.fetch_status, 'error')
+        self.assertEqual(len(processor.uploader.succeeded), 5)
+        self.assertFalse(processor.record_successful_export())
+
+    def test_3_object_index_written_as_split(self):
+        """ Test a run that keeps its composite file indexes it from the split, just as parsing it again would """
+        processor = self._run(clean_up_as_we_go=False, write_object_index=True)
+        self.assertEqual(len(processor.uploader.succeeded), OBJECT_COUNT)
+        full_path_file_name = os.path.join(self.folder.name, 'web_kiosk_mets_composite.xml')
+        saved_index = load_object_index(full_path_file_name)
+        self.assertEqual(len(saved_index['objects']), OBJECT_COUNT)
+        index = write_object_index(full_path_file_name, get_xml_backend('stdlib'), 'mets:mets', OBJECT_ID_XPATH)
+        self.assertEqual(json.loads(json.dumps(index)), json.loads(json.dumps(saved_index)))
+        self.assertEqual(list(saved_index['objects']), list(index['objects']))
+
+    def test_4_too_many_orphans_are_left_alone(self):
+        """ Test files for more than max_fraction of the objects no longer exported are reported, not removed """
+        orphan_ids = self._add_orphans(10)
+        processor = self._run(orphan_cleanup=TRASH_ORPHANS)
+        self.assertEqual(len(processor.uploader.succeeded), OBJECT_COUNT)
+        self.assertFalse(any(self.drive.files[file_id].get('trashed') for file_id in orphan_ids))
+        self.assertNotIn('orphans_removed', processor.metrics.get_summary()['counters'])
+        self.assertEqual(len(processor.folder_index), OBJECT_COUNT + 10)
+
+    def test_5_orphans_that_cannot_be_removed(self):
+        """ Test orphans that can't be trashed are counted and reported, while the rest are trashed """
+        orphan_ids = self._add_orphans(3)
+
+        def trash_after_one_has_gone(drive_session, file_ids):
+            self.drive.delete_file(orphan_ids[0])  # as if removed by hand since the folder was listed
+            return trash_files(drive_session, file_ids)
+        with patch('save_to_google_team_drive.trash_files', trash_after_one_has_gone):
+            processor = self._run(orphan_cleanup=TRASH_ORPHANS)
+        self.assertEqual(len(processor.uploader.succeeded), OBJECT_COUNT)
+        self.assertTrue(all(self.drive.files[file_id].get('trashed') for file_id in orphan_ids[1:]))
+        counters = processor.metrics.get_summary()['counters']
+        self.assertEqual((counters['orphans_removed'], counters['orphans_failed']), (2, 1))
+        self.assertEqual(sorted(processor.folder_index), sorted([object_id + '.xml'
+                                                                 for object_id in processor.uploader.succeeded]
+                                                                + ['gone.000.xml']))
+
+    def test_6_old_run_bundles_are_trashed(self):
+        """ Test uploading a run bundle leaves only the newest keep bundles in its folder """
+        bundle_ids = self._add_files(['web_kiosk_export_full_2020101' + str(day) + 'T020000Z.tar.gz'
+                                      for day in range(5)])
+        processor = self._run(run_bundle={'enabled': True, 'parent_folder_id': '', 'keep': 3})
+        self.assertEqual([self.drive.files[file_id].get('trashed', False) for file_id in bundle_ids],
+                         [True, True, True, False, False])
+        self.assertEqual(processor.metrics.get_summary()['counters']['bundles_removed'], 3)
+        self.assertEqual(len(processor.folder_index), OBJECT_COUNT + 3)
+
+    def test_7_run_bundles_are_not_objects(self):
+        """ Test bundles in the objects' folder don't count towards the files orphan cleanup may remove """
+        self._add_files(['web_kiosk_export_full_202010' + str(day) + 'T020000Z.tar.gz' for day in range(10, 20)])
+        orphan_ids = self._add_orphans(4)  # more than max_fraction of the object files, though not of every file
+        processor = self._run(run_bundle={'enabled': True, 'parent_folder_id': '', 'keep': 0},
+                              orphan_cleanup=TRASH_ORPHANS)
+        self.assertFalse(any(self.drive.files[file_id].get('trashed') for file_id in orphan_ids))
+        self.assertEqual(len(processor.folder_index), OBJECT_COUNT + 4 + 11)
+
+    def test_8_paged_fetch_stops_when_pages_repeat(self):
+        """ Test a paged run against a Web Kiosk ignoring the page start parameter ends at the first repeated page,
+            reporting that the fetch failed, rather than processing the same page until the deadline """
+        web_kiosk = self._start(FakeWebKiosk(OBJECT_COUNT, page_start_parameter='ignored'))
+        config = self._get_config(fetch_mode='paged', page_size=5, fetch_workers=1)
+        config['embark']['server-address'] = web_kiosk.url.rstrip('/')
+        processor = process_web_kiosk_metadata(config)
+        with redirect_stdout(io.StringIO()):
+            processor.get_snite_composite_mets_metadata()
+            self._run_with_timeout(processor.process_snite_composite_mets_metadata, True, _LambdaContext(100))
+        self.assertEqual(processor.fetch_status, 'error')
+        self.assertFalse(processor.stopped_early)
+        self.assertEqual(len(processor.uploader.succeeded), 5)
+        self.assertFalse(processor.record_successful_export())
+
+    def test_9_failed_first_page_leaves_nothing_behind(self):
+        """ Test a paged fetch whose first page fails stops fetching the rest, leaving no threads or page files """
+        self.web_kiosk.shutdown()  # so every page is refused
+        self.web_kiosk.server_close()
+        threads_before = set(threading.enumerate())
+        processor = process_web_kiosk_metadata(self._get_config(fetch_mode='paged', page_size=5, fetch_workers=4,
+                                                                page_retries=0))
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(processor.get_snite_composite_mets_metadata().size, 0)
+        self.assertEqual(processor.fetch_status, 'error')
+        self.assertEqual(set(threading.enumerate()) - threads_before, set())
+        self.assertEqual(os.listdir(self.folder.name), [])
+        self.assertFalse(processor.record_successful_export())
+
+    def test_10_paged_objects_match_single(self):
+        """ Test each object is saved with the same bytes whether fetched in pages or all at once,
+            including those ending a page """
+        self.drive.keep_content = True
+        self._run()
+        single = {file['name']: self.drive.content[file_id] for file_id, file in self.drive.files.items()}
+        self.drive.reset()
+        self._run(fetch_mode='paged', page_size=7)
+        paged = {file['name']: self.drive.content[file_id] for file_id, file in self.drive.files.items()}
+        self.assertEqual(len(single), OBJECT_COUNT)
+        self.assertEqual(paged, single)
+
+    def test_11_orphans_left_alone_unless_asked(self):
+        """ Test orphans are left on the drive by default, and only reported when asked to report them """
+        orphan_ids = self._add_orphans(3)
+        events = []
+        Hub.main.bind_client(Client(transport=events.append))
+        self._run()
+        self.assertEqual(events, [])
+        self.assertFalse(any(self.drive.files[file_id].get('trashed') for file_id in orphan_ids))
+        processor = self._run(orphan_cleanup={'action': 'report', 'max_fraction': 0.1})
+        self.assertFalse(any(self.drive.files[file_id].get('trashed') for file_id in orphan_ids))
+        self.assertEqual(processor.metrics.get_summary()['counters']['orphans_found'], 3)
+        self.assertEqual([event['message'] for event in events],
+                         ['Would remove 3 files for objects no longer exported, such as '
+                          'gone.000.xml, gone.001.xml, gone.002.xml'])
+
+    def _add_orphans(self, orphan_count):
+        """ Save files on the drive for orphan_count objects Web Kiosk doesn't export, returning their ids """
+        return self._add_files(['gone.' + str(number).zfill(3) + '.xml' for number in range(orphan_count)])
+
+    def _add_files(self, file_names):
+        """ Save files of file_names in the objects' folder on the drive, returning their ids """
+        return [self.drive.save_file(None, {'name': file_name, 'parents': [FAKE_PARENT_FOLDER_ID]}, b'<mets/>')['id']
+                for file_name in file_names]
+
+    def _run_with_timeout(self, function, *args):
+        """ Call function(*args), failing rather than waiting any longer if it hasn't returned within a minute """
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = function(*args)
+            except Exception as e:
+                outcome['exception'] = e
+        runner = threading.Thread(target=run, daemon=True)
+        runner.start()
+        runner.join(60)
+        self.assertFalse(runner.is_alive(), 'still running after a minute')
+        if 'exception' in outcome:
+            raise outcome['exception']
+        return outcome['result']
+
+    def _start(self, server):
+        server.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def _get_config(self, **settings):
+        config = get_config()
+        config['folder_name'] = self.folder.name
+        config['run_manifest']['folder_name'] = self.folder.name
+        config.update(settings)
+        return config
+
+    def _run(self, context=None, clean_up_as_we_go=True, **settings):
+        """ Fetch and process the export once, as handler does, returning the process_web_kiosk_metadata """
+        start_run_metrics()
+        processor = process_web_kiosk_metadata(self._get_config(**settings))
+        with redirect_stdout(io.StringIO()):
+            processor.get_snite_composite_mets_metadata()
+            processor.process_snite_composite_mets_metadata(clean_up_as_we_go=clean_up_as_we_go, context=context)
+        return processor
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -0,0 +1,92 @@
+# test_required_field_validator.py
+""" test required_field_validator """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import unittest  # noqa: E402
+from xml.etree.ElementTree import fromstring  # noqa: E402
+from src.required_field_validator import RequiredFieldValidator  # noqa: E402
+from src.xml_manipulation import get_value_given_xpath  # noqa: E402
+from src.get_config import REQUIRED_FIELDS  # noqa: E402
+
+NAMESPACE_DICTIONARY = {
+    'mets': 'http://www.loc.gov/METS/',
+    'dcterms': 'http://purl.org/dc/terms/',
+    'vracore': 'http://www.vraweb.org/vracore4.htm'
+}
+
+OBJECT_XML = """<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:dcterms="http://purl.org/dc/terms/"
+    xmlns:vracore="http://www.vraweb.org/vracore4.htm">
+  <mets:dmdSec ID="DSC_01_SNITE"><mets:mdWrap MDTYPE="DC"><mets:xmlData>
+    <dcterms:identifier>1990.001</dcterms:identifier>
+    <dcterms:title>A Title</dcterms:title>
+    <dcterms:creator/>
+    <dcterms:creator>Second Creator</dcterms:creator>
+    <dcterms:created>1900</dcterms:created>
+    <dcterms:subject>Landscape</dcterms:subject>
+    <dcterms:publisher>Snite Museum</dcterms:publisher>
+    <dcterms:rights>Public domain</dcterms:rights>
+    <dcterms:accessRights>On view</dcterms:accessRights>
+    <dcterms:provenance>Gift</dcterms:provenance>
+  </mets:xmlData></mets:mdWrap></mets:dmdSec>
+  <mets:dmdSec ID="DSC_02_SNITE"><mets:mdWrap MDTYPE="VRA"><mets:xmlData>
+    <vracore:work>
+      <vracore:worktypeSet><vracore:worktype>Painting</vracore:worktype></vracore:worktypeSet>
+      <vracore:materialSet><vracore:display></vracore:display></vracore:materialSet>
+    </vracore:work>
+  </mets:xmlData></mets:mdWrap></mets:dmdSec>
+  <mets:structMap TYPE="logical"><mets:div><mets:div ORDER="1">
+    <mets:fptr FILEID="ID_1990_001.jpg"/>
+  </mets:div></mets:div></mets:structMap>
+</mets:mets>"""
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    item = fromstring(OBJECT_XML)
+
+    def _get_missing_fields_the_slow_way(self, required_fields):
+        missing_fields = []
+        for preferred_name, xpath in required_fields.items():
+            value = get_value_given_xpath(self.item, xpath, NAMESPACE_DICTIONARY)
+            if value == '' or value is None:
+                missing_fields.append((preferred_name, xpath))
+        return missing_fields
+
+    def test_1_configured_fields(self):
+        """ Test the configured required fields give the same answer as get_value_given_xpath """
+        validator = RequiredFieldValidator(REQUIRED_FIELDS, NAMESPACE_DICTIONARY)
+        missing_fields = validator.validate(self.item)
+        self.assertEqual(missing_fields, self._get_missing_fields_the_slow_way(REQUIRED_FIELDS))
+        self.assertEqual([field for field, xpath in missing_fields], ['Medium', 'Dimensions'])
+
+    def test_2_attribute_predicates(self):
+        """ Test [@attribute] and [@attribute="value"] steps """
+        required_fields = {
+            "Identifier": 'mets:dmdSec[@ID="DSC_01_SNITE"]/mets:mdWrap[@MDTYPE="DC"]/mets:xmlData/dcterms:identifier',
+            "Wrong section": 'mets:dmdSec[@ID="DSC_02_SNITE"]/mets:mdWrap/mets:xmlData/dcterms:identifier',
+            "Order": "mets:structMap/mets:div/mets:div[@ORDER]",
+            "Label": "mets:structMap/mets:div/mets:div[@LABEL]"
+        }
+        validator = RequiredFieldValidator(required_fields, NAMESPACE_DICTIONARY)
+        missing_fields = validator.validate(self.item)
+        self.assertEqual(missing_fields, self._get_missing_fields_the_slow_way(required_fields))
+        self.assertEqual([field for field, xpath in missing_fields], ['Wrong section', 'Label'])
+
+    def test_3_uncompiled_xpath_falls_back(self):
+        """ Test xpath syntax we don't compile is still checked """
+        required_fields = {"Anywhere title": ".//dcterms:title", "Anywhere extent": ".//dcterms:extent"}
+        validator = RequiredFieldValidator(required_fields, NAMESPACE_DICTIONARY)
+        self.assertEqual([field for field, xpath in validator.validate(self.item)], ['Anywhere extent'])
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
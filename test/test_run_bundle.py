@@ -0,0 +1,75 @@
+# test_run_bundle.py
+""" test the run bundle holds each object as it is uploaded on its own, followed by a manifest describing them """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+from datetime import datetime  # noqa: E402
+from hashlib import md5  # noqa: E402
+import json  # noqa: E402
+import tarfile  # noqa: E402
+import tempfile  # noqa: E402
+import unittest  # noqa: E402
+from src.required_field_validator import missing_field  # noqa: E402
+from src.run_bundle import MANIFEST_NAME, RunBundle, get_old_run_bundle_file_names, \
+    get_run_bundle_file_name  # noqa: E402
+
+EXPORT_STARTED = datetime(2020, 10, 18, 2, 0, 0)
+OBJECTS = [('1990.001', b'<mets:mets>one</mets:mets>', []),
+           ('1990.002', b'<mets:mets>two</mets:mets>', [missing_field('Title', 'dcterms:title')])]
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.file_name = get_run_bundle_file_name('full', EXPORT_STARTED)
+
+    def test_1_objects_then_manifest(self):
+        """ Test every object is in the bundle, in order and unchanged, with the manifest after them """
+        run_bundle = RunBundle(self.folder.name, self.file_name, 'full', EXPORT_STARTED)
+        for object_id, xml_as_bytes, missing_fields in OBJECTS:
+            run_bundle.add(object_id, xml_as_bytes, missing_fields)
+        run_bundle.close()
+        self.assertEqual(self.file_name, 'web_kiosk_export_full_20201018T020000Z.tar.gz')
+        with tarfile.open(run_bundle.full_path_file_name, 'r:gz') as tar_file:
+            members = tar_file.getmembers()
+            contents = [tar_file.extractfile(member).read() for member in members]
+        self.assertEqual([member.name for member in members], ['1990.001.xml', '1990.002.xml', MANIFEST_NAME])
+        self.assertEqual(contents[:2], [xml_as_bytes for object_id, xml_as_bytes, missing_fields in OBJECTS])
+        self.assertEqual({member.mtime for member in members}, {1602986400})
+        manifest = json.loads(contents[2].decode('utf-8'))
+        self.assertEqual((manifest['mode'], manifest['export_started'], manifest['object_count']),
+                         ('full', '2020-10-18T02:00:00', 2))
+        self.assertEqual(manifest['objects'][1], {'object_id': '1990.002', 'file_name': '1990.002.xml',
+                                                  'md5_checksum': md5(OBJECTS[1][1]).hexdigest(),
+                                                  'size': len(OBJECTS[1][1]), 'missing_fields': ['Title']})
+
+    def test_2_delete(self):
+        """ Test an unfinished bundle can be removed from disk """
+        run_bundle = RunBundle(self.folder.name, self.file_name, 'incremental', EXPORT_STARTED)
+        run_bundle.add(*OBJECTS[0])
+        run_bundle.delete()
+        self.assertEqual(os.listdir(self.folder.name), [])
+
+    def test_3_old_run_bundles(self):
+        """ Test only bundles beyond the newest keep of them, whatever their mode, are picked to be removed """
+        file_names = ['web_kiosk_export_full_20201016T020000Z.tar.gz', '1990.001.xml',
+                      'web_kiosk_export_incremental_20201018T020000Z.tar.gz', 'notes.tar.gz',
+                      'web_kiosk_export_full_20201015T020000Z.tar.gz', self.file_name]
+        self.assertEqual(get_old_run_bundle_file_names(file_names, 2),
+                         ['web_kiosk_export_full_20201015T020000Z.tar.gz',
+                          'web_kiosk_export_full_20201016T020000Z.tar.gz'])
+        self.assertEqual(get_old_run_bundle_file_names(file_names, 0), [])
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -0,0 +1,57 @@
+# test_run_manifest.py
+""" test the run manifest picks up an unfinished run over the same composite export, and nothing else """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import tempfile  # noqa: E402
+import unittest  # noqa: E402
+from src.run_manifest import LocalFileManifestStore, RunManifest  # noqa: E402
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.store = LocalFileManifestStore(self.folder.name, 'manifest.json')
+
+    def test_1_is_resumable(self):
+        """ Test only an unfinished manifest for the same composite export is resumed """
+        unfinished = {'composite_identity': 'abc', 'complete': False, 'processed_object_ids': ['1']}
+        self.assertTrue(RunManifest.is_resumable(unfinished, 'abc'))
+        self.assertFalse(RunManifest.is_resumable(unfinished, 'def'))
+        self.assertFalse(RunManifest.is_resumable(dict(unfinished, complete=True), 'abc'))
+        self.assertFalse(RunManifest.is_resumable({}, 'abc'))
+
+    def test_2_unfinished_run_is_picked_up(self):
+        """ Test objects processed before a run stopped are known to the next run over the same export only """
+        manifest = RunManifest(self.store, 'abc', checkpoint_interval=2)
+        manifest.mark_processed('1')
+        self.assertEqual(self.store.load(), {})
+        manifest.mark_processed('2')  # a checkpoint, as if the run then stopped without saving
+        self.assertEqual(self.store.load()['processed_object_ids'], ['1', '2'])
+        manifest.mark_processed('3')
+        manifest.save(complete=False)
+        resumed = RunManifest(self.store, 'abc')
+        self.assertTrue(all(resumed.is_processed(object_id) for object_id in ['1', '2', '3']))
+        self.assertFalse(resumed.is_processed('4'))
+        self.assertFalse(RunManifest(self.store, 'def').is_processed('1'))
+
+    def test_3_finished_run_is_not_picked_up(self):
+        """ Test a manifest saved as complete starts the next run over the same export afresh """
+        manifest = RunManifest(self.store, 'abc')
+        manifest.mark_processed('1')
+        manifest.save(complete=True)
+        self.assertFalse(RunManifest(self.store, 'abc').is_processed('1'))
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
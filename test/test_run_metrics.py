@@ -0,0 +1,67 @@
+# test_run_metrics.py
+""" test run_metrics """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import unittest  # noqa: E402
+from src.run_metrics import RunMetrics  # noqa: E402
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def _get_run_metrics(self):
+        run_metrics = RunMetrics()
+        run_metrics.count('uploads_created', 2)
+        run_metrics.count('bytes_fetched', 1000)
+        run_metrics.add_stage_time('split', 1.5)
+        run_metrics.add_stage_time('split', 0.5)
+        for seconds in (0.004, 0.03, 0.03, 0.2, 20):
+            run_metrics.add_latency('drive.files.create', seconds)
+        return run_metrics
+
+    def test_1_summary(self):
+        """ Test counters, stage times and latency histograms are summarized """
+        summary = self._get_run_metrics().get_summary()
+        self.assertEqual(summary['counters'], {'bytes_fetched': 1000, 'uploads_created': 2})
+        self.assertEqual(summary['stage_seconds'], {'split': 2.0})
+        latency = summary['latencies']['drive.files.create']
+        self.assertEqual(latency['count'], 5)
+        self.assertEqual(latency['buckets'], {'<=10ms': 1, '<=50ms': 2, '<=250ms': 1, '>10000ms': 1})
+        self.assertEqual(latency['p50_milliseconds'], 50)
+        self.assertEqual(latency['max_milliseconds'], 20000)
+
+    def test_2_embedded_metric_format(self):
+        """ Test the CloudWatch embedded metric format entry declares each metric it contains """
+        entry = self._get_run_metrics().get_embedded_metrics('Test', {'Mode': 'full'})
+        declaration = entry['_aws']['CloudWatchMetrics'][0]
+        self.assertEqual(declaration['Namespace'], 'Test')
+        self.assertEqual(declaration['Dimensions'], [['Mode']])
+        self.assertEqual(entry['Mode'], 'full')
+        units = {metric['Name']: metric['Unit'] for metric in declaration['Metrics']}
+        self.assertEqual(units['UploadsCreated'], 'Count')
+        self.assertEqual(units['BytesFetched'], 'Bytes')
+        self.assertEqual(units['SplitSeconds'], 'Seconds')
+        self.assertEqual(entry['DriveFilesCreateCalls'], 5)
+        for name in units:
+            self.assertIn(name, entry)
+
+    def test_3_trace_hooks(self):
+        """ Test trace hooks are only there when added, and receive each traced step """
+        run_metrics = RunMetrics()
+        self.assertFalse(run_metrics.trace_hooks)
+        traced = []
+        run_metrics.add_trace_hook(lambda event, object_id, details: traced.append((event, object_id, details)))
+        run_metrics.trace('queued', '1990.001', queue_seconds=0.5)
+        self.assertEqual(traced, [('queued', '1990.001', {'queue_seconds': 0.5})])
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()
@@ -7,12 +7,14 @@ where_i_am = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(where_i_am)
 sys.path.append(where_i_am + "/dependencies")
 import unittest  # noqa: E402
-from src.save_to_google_team_drive import save_file_to_google_team_drive, \
+from src.save_to_google_team_drive import DriveSession, \
+    save_file_to_google_team_drive, \
     _get_file_id_given_filename, \
     _delete_existing_file, \
     _update_existing_file, \
     _upload_new_file, \
-    _get_credentials_from_service_account_info  # noqa: E402
+    _get_credentials_from_service_account_info, \
+    get_folder_index  # noqa: E402
 from src.get_config import get_config  # noqa: E402
 import time  # noqa: E402
 
@@ -24,6 +26,7 @@ class Test(unittest.TestCase):
     config = get_config()
     google_credentials = config['google']['credentials']
     credentials = _get_credentials_from_service_account_info(google_credentials)
+    drive_session = DriveSession(google_credentials)
     snite_metadata_team_drive_id = config['google']['museum']['metadata']['drive-id']
     snite_metadata_folder_id = config['google']['museum']['metadata']['parent-folder-id']
     local_folder_name = 'test'
@@ -34,11 +37,12 @@ class Test(unittest.TestCase):
         """ Test returning credentials from service account info """
         print('1 - test_get_credentials_from_service_account_info')
         self.assertTrue(self.credentials)
+        self.assertTrue(self.drive_session.credentials.valid)
 
     def test_2_save_file_to_google_team_drive(self):
         """ Test saving a file to google team drive. """
         print('2 - test_save_file_to_google_team_drive')
-        file_id = save_file_to_google_team_drive(self.google_credentials,
+        file_id = save_file_to_google_team_drive(self.drive_session,
                                                  self.snite_metadata_team_drive_id,
                                                  self.snite_metadata_folder_id,
                                                  self.local_folder_name,
@@ -48,7 +52,7 @@ class Test(unittest.TestCase):
     def test_3_known_file_exists(self):
         print('3 - test_known_file_exists')
         time.sleep(5)  # wait so asynchronous above save completes
-        file_id = _get_file_id_given_filename(self.credentials,
+        file_id = _get_file_id_given_filename(self.drive_session,
                                               self.snite_metadata_team_drive_id,
                                               self.snite_metadata_folder_id,
                                               self.file_name)
@@ -56,11 +60,11 @@ class Test(unittest.TestCase):
 
     def test_4_update_existing_file(self):
         print('4 - test_update_existing_file')
-        file_id = _get_file_id_given_filename(self.credentials,
+        file_id = _get_file_id_given_filename(self.drive_session,
                                               self.snite_metadata_team_drive_id,
                                               self.snite_metadata_folder_id,
                                               self.file_name)
-        updated_file_id = _update_existing_file(self.credentials,
+        updated_file_id = _update_existing_file(self.drive_session,
                                                 self.snite_metadata_folder_id,
                                                 file_id,
                                                 self.local_folder_name,
@@ -69,13 +73,13 @@ class Test(unittest.TestCase):
 
     def test_5_delete_file(self):
         print('5 - test_delete_file')
-        file_id = _get_file_id_given_filename(self.credentials,
+        file_id = _get_file_id_given_filename(self.drive_session,
                                               self.snite_metadata_team_drive_id,
                                               self.snite_metadata_folder_id,
                                               self.file_name)
-        _delete_existing_file(self.credentials, file_id)
+        _delete_existing_file(self.drive_session, file_id)
         time.sleep(5)  # wait so asynchronous delete completes
-        file_id = _get_file_id_given_filename(self.credentials,
+        file_id = _get_file_id_given_filename(self.drive_session,
                                               self.snite_metadata_team_drive_id,
                                               self.snite_metadata_folder_id,
                                               self.file_name)
@@ -83,13 +87,30 @@ class Test(unittest.TestCase):
 
     def test_6_upload_new_file(self):
         print('6 - test_upload_new_file')
-        file_id = _upload_new_file(self.credentials,
+        file_id = _upload_new_file(self.drive_session,
                                    self.snite_metadata_team_drive_id,
                                    self.snite_metadata_folder_id,
                                    self.local_folder_name,
                                    self.file_name)
         self.assertTrue(file_id > "")
-        _delete_existing_file(self.credentials, file_id)  # clean up after ourselves
+        _delete_existing_file(self.drive_session, file_id)  # clean up after ourselves
+
+    def test_7_save_file_using_folder_index(self):
+        print('7 - test_save_file_using_folder_index')
+        folder_index = get_folder_index(self.drive_session,
+                                        self.snite_metadata_team_drive_id,
+                                        self.snite_metadata_folder_id)
+        self.assertFalse(self.file_name in folder_index)
+        file_id = save_file_to_google_team_drive(self.drive_session,
+                                                 self.snite_metadata_team_drive_id,
+                                                 self.snite_metadata_folder_id,
+                                                 self.local_folder_name,
+                                                 self.file_name,
+                                                 folder_index=folder_index)
+        self.assertTrue(file_id > "")
+        self.assertEqual(folder_index[self.file_name].file_id, file_id)
+        self.assertTrue(folder_index[self.file_name].md5_checksum > "")
+        _delete_existing_file(self.drive_session, file_id)  # clean up after ourselves
 
 
 def suite():
@@ -0,0 +1,102 @@
+# test_xml_backend.py
+""" test the stdlib and lxml xml backends write each object identically """
+import os
+import sys
+where_i_am = os.path.dirname(os.path.realpath(__file__))
+sys.path.append(where_i_am)
+sys.path.append(where_i_am + "/dependencies")
+import tempfile  # noqa: E402
+import unittest  # noqa: E402
+from benchmark.generate_composite_mets import COMPOSITE_HEAD, COMPOSITE_TAIL, generate_composite_mets  # noqa: E402
+from src.process_web_kiosk_metadata import OBJECT_ID_XPATH  # noqa: E402
+from src.xml_backend import get_xml_backend  # noqa: E402
+from src.xml_manipulation import RECORD_TAIL  # noqa: E402
+
+try:
+    import lxml  # noqa: F401
+    LXML_INSTALLED = True
+except ImportError:
+    LXML_INSTALLED = False
+
+# Objects with things lxml would write differently from ElementTree if left to itself
+UNUSUAL_OBJECTS = '''<!-- a comment before the first object -->
+  <mets:mets OBJID="a" LABEL="x &gt; y /&gt; z"><mets:dmdSec ID="DSC_01_SNITE"><mets:mdWrap MDTYPE="DC"><mets:xmlData>
+<dcterms:identifier>1</dcterms:identifier><dcterms:title>a/&gt;b &amp; c</dcterms:title><!-- c --><?pi x?>
+<dcterms:empty/><vracore:display b="2" a="1"></vracore:display></mets:xmlData></mets:mdWrap></mets:dmdSec></mets:mets>
+  <mets:mets OBJID="tab&#9;cr&#13;newline&#10;"><mets:dmdSec ID="DSC_01_SNITE"><mets:mdWrap MDTYPE="DC">
+<mets:xmlData><dcterms:identifier>2</dcterms:identifier><x:y xmlns:x="urn:other">t&#13;ext</x:y></mets:xmlData>
+</mets:mdWrap></mets:dmdSec></mets:mets>
+  <mets:mets/>
+  <mets:mets><mets:dmdSec ID="DSC_01_SNITE"><mets:mdWrap MDTYPE="DC"><mets:xmlData>
+<dcterms:identifier>3</dcterms:identifier><plain xlink:href="h">é 漢</plain></mets:xmlData></mets:mdWrap>
+</mets:dmdSec>tail</mets:mets>
+  <other>not an object</other>
+  <mets:mets xmlns:unknown="http://example.com/"><unknown:z/></mets:mets>
+'''
+
+
+class Test(unittest.TestCase):
+    """ Class for test fixtures """
+    def _serialize_objects(self, backend_name, full_path_file_name):
+        backend = get_xml_backend(backend_name)
+        namespace_dictionary = {}
+        objects = []
+        for item in backend.iterate_records(full_path_file_name, 'mets:mets', namespace_dictionary):
+            if not objects:
+                backend.use_namespaces(namespace_dictionary)
+            object_id = item.find(OBJECT_ID_XPATH, namespace_dictionary)
+            objects.append((object_id.text if object_id is not None else None, backend.serialize_record(item)))
+        return objects
+
+    def _assert_backends_agree(self, full_path_file_name, object_count):
+        stdlib_objects = self._serialize_objects('stdlib', full_path_file_name)
+        self.assertEqual(len(stdlib_objects), object_count)
+        if LXML_INSTALLED:
+            lxml_objects = self._serialize_objects('lxml', full_path_file_name)
+            self.assertEqual(len(lxml_objects), object_count)
+            for stdlib_object, lxml_object in zip(stdlib_objects, lxml_objects):
+                self.assertEqual(stdlib_object, lxml_object)
+        return stdlib_objects
+
+    def test_1_generated_export(self):
+        """ Test both backends write the same bytes for each object of a generated export """
+        with tempfile.TemporaryDirectory() as folder_name:
+            full_path_file_name = os.path.join(folder_name, 'composite.xml')
+            generate_composite_mets(full_path_file_name, 200, missing_field_rate=0.1)
+            objects = self._assert_backends_agree(full_path_file_name, 200)
+        self.assertTrue(objects[0][1].startswith(b"<?xml version='1.0' encoding='utf-8'?>\n<mets:mets "))
+        self.assertIn(b' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"', objects[0][1])
+
+    def test_2_unusual_objects(self):
+        """ Test both backends agree on comments, character references, unknown namespaces and empty objects """
+        with tempfile.TemporaryDirectory() as folder_name:
+            full_path_file_name = os.path.join(folder_name, 'composite.xml')
+            with open(full_path_file_name, 'w', encoding='utf-8') as composite_file:
+                composite_file.write(COMPOSITE_HEAD + UNUSUAL_OBJECTS + COMPOSITE_TAIL)
+            objects = self._assert_backends_agree(full_path_file_name, 5)
+        self.assertEqual([object_id for object_id, xml_as_bytes in objects], ['1', '2', None, '3', None])
+        self.assertNotIn(b'comment', objects[0][1])
+        self.assertTrue(objects[3][1].endswith(b'tail</mets:mets>\n'))
+
+    def test_3_tail_does_not_depend_on_reads(self):
+        """ Test each record's tail is the same, whatever follows it, even when a read ends inside its tail """
+        record = b'<a>' + b'x' * 100 + b'</a>'
+        first_record = b'<a>' + b'y' * 16032 + b'</a>'  # so that one of ElementTree's 16KB reads ends inside a tail
+        with tempfile.TemporaryDirectory() as folder_name:
+            full_path_file_name = os.path.join(folder_name, 'records.xml')
+            with open(full_path_file_name, 'wb') as records_file:
+                records_file.write(b'<root>' + first_record + (b'\n   ' + record) * 200 + b'\n</root>')
+            for backend_name in ('stdlib', 'lxml') if LXML_INSTALLED else ('stdlib',):
+                tails = [item.tail for item in get_xml_backend(backend_name).iterate_records(full_path_file_name,
+                                                                                             'a', {})]
+                self.assertEqual(tails, [RECORD_TAIL] * 201)
+
+
+def suite():
+    """ define test suite """
+    return unittest.TestLoader().loadTestsFromTestCase(Test)
+
+
+if __name__ == '__main__':
+    suite()
+    unittest.main()